@@ -0,0 +1,214 @@
+# GUI-free annotation engine: the scene loading, object poses, ICP refinement, quality check
+# and saving of the annotator as a Python API, for scripts, batch tools and the annotation
+# service (annotation_server.py).
+#
+# engine = AnnotationEngine("GraspClutter6D_root", "scenes")
+# engine.open_image(1, 0)
+# engine.refine(1, 0, joint=True)
+# print(engine.validate(1, 0))
+# engine.save(1, 0)
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from object_pose_annotator import (VALIDATION_DOWNSCALE, AnnotationScene, Dataset, backproject_depth,
+                                   evaluate_anno_quality, gt_from_pose, is_depth_diff_ok, is_refine_accepted,
+                                   make_validation_renderer, move_delta, pose_from_gt, refine_objects, transfer_gt,
+                                   use_sharded_storage, write_scene_gt_entry)
+
+
+class AnnotationEngine:
+    # images are addressed by (scene_num, image_num) and kept open in an LRU cache; object
+    # models and validation renderers are shared by all images. objects are addressed by
+    # name (obj_<obj_id>_<inst_id>) as in the annotator. calls are serialized by a lock, so
+    # one engine can be shared by the threads of a server.
+    RPC_METHODS = ["open_image", "close_image", "get_objects", "add_object", "remove_object", "set_pose", "move",
+                   "refine", "validate", "save", "copy_annotation"]
+
+    def __init__(self, dataset_path, split="scenes", renderer_backend=None, max_open_images=8, sharded=None):
+        self.dataset = Dataset(dataset_path, split)
+        self.renderer_backend = renderer_backend
+        self.max_open_images = max_open_images
+        self.sharded = use_sharded_storage() if sharded is None else sharded
+        self._images = OrderedDict()  # (scene_num, image_num) -> open image state
+        self._models = {}  # obj_id -> (PointArrays, MeshArrays)
+        self._renderers = {}
+        self._lock = threading.RLock()
+
+    def _get_model(self, obj_id):
+        if obj_id not in self._models:
+            self._models[obj_id] = (self.dataset.load_obj_geometry(obj_id), self.dataset.load_obj_mesh(obj_id))
+        return self._models[obj_id]
+
+    def _get_renderer(self, width, height, intrinsic):
+        key = (width, height, tuple(intrinsic.reshape(-1)))
+        if key not in self._renderers:
+            self._renderers[key] = make_validation_renderer(width, height, intrinsic, self.renderer_backend)
+        return self._renderers[key]
+
+    def _load_image(self, scene_num, image_num):
+        scene_camera = self.dataset.load_scene_camera(scene_num)
+        cam_info = scene_camera[str(image_num)]
+        rgb_img = cv2.imread(self.dataset.get_rgb_path(scene_num, image_num))
+        depth_img = cv2.imread(self.dataset.get_image_path(scene_num, image_num, 'depth'), -1)
+        if rgb_img is None or depth_img is None:
+            raise IOError("Failed to read the images of scene {} image {}".format(scene_num, image_num))
+        cam_K = np.array(cam_info["cam_K"]).reshape((3, 3))
+        depth_mm = np.float32(depth_img) * cam_info["depth_scale"]
+        annotation_scene = AnnotationScene(backproject_depth(rgb_img, depth_mm / 1000, cam_K), scene_num, image_num)
+        # the camera index follows the image order, as in the annotator
+        image_idx = sorted(int(x) for x in scene_camera.keys()).index(image_num)
+
+        inst_counts = {}
+        gt_objs = self.dataset.load_scene_gt(scene_num).get(str(image_num), [])
+        for obj in sorted(gt_objs, key=lambda d: int(d["obj_id"])):
+            obj_id = int(obj["obj_id"])
+            inst_counts[obj_id] = inst_counts.get(obj_id, 0) + 1
+            inst_id = int(obj.get("inst_id", inst_counts[obj_id]))
+            geometry, mesh = self._get_model(obj_id)
+            annotation_scene.add_obj(geometry, mesh, "obj_{:06}_{}".format(obj_id, inst_id), inst_id, pose_from_gt(obj))
+        return {"scene": annotation_scene, "cam_info": cam_info, "cam_K": cam_K, "depth": depth_mm,
+                "camera_idx": image_idx % 4}
+
+    def _get_image(self, scene_num, image_num):
+        key = (int(scene_num), int(image_num))
+        if key in self._images:
+            self._images.move_to_end(key)
+        else:
+            self._images[key] = self._load_image(*key)
+            while len(self._images) > self.max_open_images:
+                self._images.popitem(last=False)
+        return self._images[key]
+
+    @staticmethod
+    def _find_object(annotation_scene, name):
+        for idx, obj in enumerate(annotation_scene.get_objects()):
+            if obj.obj_name == name:
+                return idx, obj
+        raise KeyError("No object {} in scene {} image {}".format(name, annotation_scene.scene_num,
+                                                                  annotation_scene.image_num))
+
+    @staticmethod
+    def _describe(obj):
+        return {"name": obj.obj_name, "obj_id": int(obj.obj_name.split("_")[1]), "inst_id": obj.obj_instance,
+                "pose": obj.transform.copy()}
+
+    def open_image(self, scene_num, image_num, reload=False):
+        # loads the image (again with reload, dropping unsaved changes); returns get_objects
+        with self._lock:
+            if reload:
+                self._images.pop((int(scene_num), int(image_num)), None)
+            return self.get_objects(scene_num, image_num)
+
+    def close_image(self, scene_num, image_num):
+        # drops the image and its unsaved changes from the cache
+        with self._lock:
+            return self._images.pop((int(scene_num), int(image_num)), None) is not None
+
+    def get_objects(self, scene_num, image_num):
+        # [{"name", "obj_id", "inst_id", "pose" (4x4 cam_T_model, meter)}]
+        with self._lock:
+            return [self._describe(obj) for obj in self._get_image(scene_num, image_num)["scene"].get_objects()]
+
+    def add_object(self, scene_num, image_num, obj_id, pose=None):
+        # adds the next instance of obj_id; without a pose it is placed in front of the scene
+        # center as in the annotator. returns the object name
+        with self._lock:
+            annotation_scene = self._get_image(scene_num, image_num)["scene"]
+            obj_id = int(obj_id)
+            if pose is None:
+                pose = np.identity(4)
+                pose[:3, 3] = annotation_scene.annotation_scene.get_center()
+                pose[2, 3] -= 0.2
+            inst_ids = [obj.obj_instance for obj in annotation_scene.get_objects()
+                        if obj.obj_name.startswith("obj_{:06}_".format(obj_id))]
+            inst_id = max(inst_ids) + 1 if inst_ids else 1
+            geometry, mesh = self._get_model(obj_id)
+            name = "obj_{:06}_{}".format(obj_id, inst_id)
+            annotation_scene.add_obj(geometry, mesh, name, inst_id, np.asarray(pose, dtype=np.float64))
+            return name
+
+    def remove_object(self, scene_num, image_num, name):
+        with self._lock:
+            annotation_scene = self._get_image(scene_num, image_num)["scene"]
+            idx, _ = self._find_object(annotation_scene, name)
+            annotation_scene.remove_obj(idx)
+
+    def set_pose(self, scene_num, image_num, name, pose):
+        with self._lock:
+            _, obj = self._find_object(self._get_image(scene_num, image_num)["scene"], name)
+            obj.set_transform(np.matmul(np.asarray(pose, dtype=np.float64), np.linalg.inv(obj.transform)))
+            return obj.transform.copy()
+
+    def move(self, scene_num, image_num, name, translation=(0, 0, 0), rotation=(0, 0, 0)):
+        # a key move of the annotator: a translation (meter), or otherwise a rotation (xyz
+        # euler angles, radian) around the object center. returns the new pose
+        with self._lock:
+            _, obj = self._find_object(self._get_image(scene_num, image_num)["scene"], name)
+            obj.set_transform(move_delta(obj.get_center(), *translation, *rotation))
+            return obj.transform.copy()
+
+    def refine(self, scene_num, image_num, names=None, joint=False):
+        # ICP of the named (default: all) objects; accepted results are applied.
+        # returns [{"name", "success", "fitness", "inlier_rmse"}]
+        with self._lock:
+            annotation_scene = self._get_image(scene_num, image_num)["scene"]
+            objects = annotation_scene.get_objects() if names is None else \
+                [self._find_object(annotation_scene, name)[1] for name in names]
+            if not objects:
+                return []
+            results = []
+            for obj, (transformation, fitness, inlier_rmse) in zip(
+                    objects, refine_objects(annotation_scene, objects, joint)):
+                success = bool(is_refine_accepted(transformation, fitness))
+                if success:
+                    obj.set_transform(transformation)
+                results.append({"name": obj.obj_name, "success": success, "fitness": float(fitness),
+                                "inlier_rmse": float(inlier_rmse)})
+            return results
+
+    def validate(self, scene_num, image_num):
+        # depth difference check of the annotator at validation resolution.
+        # returns [{"name", "depth_diff_mean", "ratio_delta_1", "ratio_delta_2", "num_valid_px", "status"}]
+        with self._lock:
+            image = self._get_image(scene_num, image_num)
+            depth = image["depth"]
+            height, width = depth.shape[0] // VALIDATION_DOWNSCALE, depth.shape[1] // VALIDATION_DOWNSCALE
+            depth_captured = cv2.resize(depth, (width, height), interpolation=cv2.INTER_NEAREST)
+            intrinsic = image["cam_K"] / VALIDATION_DOWNSCALE
+            intrinsic[2, 2] = 1
+            objects = image["scene"].get_objects()
+            results = evaluate_anno_quality(self._get_renderer(width, height, intrinsic),
+                                            [obj.obj_mesh for obj in objects], [obj.transform for obj in objects],
+                                            depth_captured)
+            for obj, result in zip(objects, results):
+                result["name"] = obj.obj_name
+                result["status"] = "Complete" if is_depth_diff_ok(result["depth_diff_mean"], image["camera_idx"]) \
+                    else "Incomplete"
+            return results
+
+    def save(self, scene_num, image_num):
+        # writes the poses of the image to scene_gt.json (or its shard); returns the entry
+        with self._lock:
+            gt_objs = [gt_from_pose(obj.transform, int(obj.obj_name.split("_")[1]), obj.obj_instance)
+                       for obj in self._get_image(scene_num, image_num)["scene"].get_objects()]
+            write_scene_gt_entry(self.dataset.get_scene_path(int(scene_num)), int(image_num), gt_objs, self.sharded)
+            return gt_objs
+
+    def copy_annotation(self, scene_num, source_image_num, target_image_num):
+        # copies the saved annotation of an image to another image of the scene using the
+        # camera poses; an open target image is reloaded. returns the target entry
+        with self._lock:
+            scene_camera = self.dataset.load_scene_camera(int(scene_num))
+            scene_gt = self.dataset.load_scene_gt(int(scene_num))
+            if str(source_image_num) not in scene_gt:
+                raise KeyError("Image {} of scene {} is not annotated".format(source_image_num, scene_num))
+            gt_objs = transfer_gt(scene_gt[str(source_image_num)], scene_camera[str(source_image_num)],
+                                  scene_camera[str(target_image_num)])
+            write_scene_gt_entry(self.dataset.get_scene_path(int(scene_num)), int(target_image_num), gt_objs,
+                                 self.sharded)
+            self._images.pop((int(scene_num), int(target_image_num)), None)
+            return gt_objs
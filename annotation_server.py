@@ -0,0 +1,174 @@
+# Local annotation service: serves AnnotationEngine (annotation_engine.py) over HTTP/JSON,
+# so batch tools and lightweight clients share warm image, model and renderer caches.
+# With --workers N the engine runs in N processes; every scene is handled by one process,
+# so the state of an image is never split between processes.
+#
+# python annotation_server.py --dataset_path GraspClutter6D_root --split scenes --port 8765 --workers 4
+#
+# client = AnnotationClient("http://127.0.0.1:8765")
+# client.open_image(scene_num=1, image_num=0)
+# client.refine(scene_num=1, image_num=0, joint=True)
+
+import argparse
+import json
+import multiprocessing
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from annotation_engine import AnnotationEngine
+
+# per worker process state
+_engine = None
+
+
+def _init_worker(dataset_path, split, renderer_backend, max_open_images):
+    global _engine
+    _engine = AnnotationEngine(dataset_path, split, renderer_backend, max_open_images)
+
+
+def _call(method, params):
+    return getattr(_engine, method)(**params)
+
+
+def _to_json(value):
+    # numpy results of the engine as plain lists / numbers
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{} is not JSON serializable".format(type(value).__name__))
+
+
+class AnnotationService:
+    # dispatches engine calls to the worker owning the scene. with num_workers=0 the engine
+    # runs in this process, e.g. as a localhost stand-in in tests and development.
+    def __init__(self, dataset_path, split="scenes", num_workers=0, renderer_backend=None, max_open_images=8):
+        self.engine = None
+        self.workers = []
+        if num_workers == 0:
+            self.engine = AnnotationEngine(dataset_path, split, renderer_backend, max_open_images)
+        context = multiprocessing.get_context("spawn")
+        for _ in range(num_workers):
+            # one single-process pool per worker keeps the routing of a scene fixed
+            self.workers.append(ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                                    initargs=(dataset_path, split, renderer_backend,
+                                                              max_open_images)))
+
+    def call(self, method, params):
+        if method not in AnnotationEngine.RPC_METHODS:
+            raise AttributeError("Unknown method: {}".format(method))
+        if self.engine is not None:
+            return getattr(self.engine, method)(**params)
+        worker = self.workers[int(params.get("scene_num", 0)) % len(self.workers)]
+        return worker.submit(_call, method, params).result()
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.shutdown()
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    # POST /rpc {"method": ..., "params": {...}} -> {"result": ...} or {"error": ...}
+    # GET /health -> {"status": "ok"}
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body, default=_to_json).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": "Not found: {}".format(self.path)})
+
+        def do_POST(self):
+            if self.path != "/rpc":
+                self._send(404, {"error": "Not found: {}".format(self.path)})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                result = service.call(request["method"], request.get("params", {}))
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                self._send(400, {"error": "{}: {}".format(type(e).__name__, e)})
+            except Exception as e:
+                self._send(500, {"error": "{}: {}".format(type(e).__name__, e)})
+            else:
+                self._send(200, {"result": result})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+class AnnotationClient:
+    # client of the annotation service; every engine method is available with keyword
+    # arguments, e.g. client.move(scene_num=1, image_num=0, name="obj_000001_1", translation=[0, 0, 0.01]).
+    # poses are returned as nested lists.
+    def __init__(self, url="http://127.0.0.1:8765", timeout=600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def call(self, method, **params):
+        data = json.dumps({"method": method, "params": params}, default=_to_json).encode("utf-8")
+        request = urllib.request.Request(self.url + "/rpc", data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))["result"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read().decode("utf-8"))["error"])
+
+    def health(self):
+        with urllib.request.urlopen(self.url + "/health", timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))["status"] == "ok"
+
+    def __getattr__(self, method):
+        if method not in AnnotationEngine.RPC_METHODS:
+            raise AttributeError(method)
+        return lambda **params: self.call(method, **params)
+
+
+def serve_in_thread(service, host="127.0.0.1", port=0):
+    # starts a server on a background thread (port 0: any free port); returns the server
+    # and its url. server.shutdown() stops it
+    server = make_server(service, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://{}:{}".format(*server.server_address[:2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local annotation service")
+    parser.add_argument("--dataset_path", required=True, help="dataset root (contains the split and models_eval)")
+    parser.add_argument("--split", default="scenes", help="split directory with the scenes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="engine processes (scenes are distributed over them), 0: run in the server process")
+    parser.add_argument("--max_open_images", type=int, default=8, help="images kept open per engine")
+    parser.add_argument("--renderer", choices=["gl", "cpu"], default=None,
+                        help="depth renderer of validate, cpu does not need an OpenGL/EGL context")
+    args = parser.parse_args()
+
+    service = AnnotationService(args.dataset_path, args.split, args.workers, args.renderer, args.max_open_images)
+    server = make_server(service, args.host, args.port)
+    print("[Info] Serving the annotation engine on http://{}:{}".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
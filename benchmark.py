@@ -0,0 +1,253 @@
+# End-to-end benchmark of the annotation operations on synthetic BOP datasets.
+# For every configuration (objects per image x image resolution) a dataset is generated
+# (random models, rendered depth/rgb, scene_camera.json, scene_gt.json) and the operations of
+# the annotator are timed headlessly through AnnotationEngine:
+#   scene_load (open_image), move, refine (one object), refine_all, refine_all_joint,
+#   validate (_validate_anno), save (_on_generate) and copy_annotation (_on_copy_button).
+# Results are written as json; --compare prints the change against the results of another run.
+#
+# python benchmark.py --objects 5 20 --resolutions 640x480 1920x1080 --output benchmark_results.json
+# python benchmark.py --compare benchmark_results_main.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+
+import cv2
+import numpy as np
+import open3d as o3d
+
+from annotation_engine import AnnotationEngine
+from object_pose_annotator import CPURenderer, MeshArrays, gt_from_pose
+
+GENERATED_SCENE_GT = "scene_gt_generated.json"  # untouched copy of the generated scene_gt.json
+
+
+def _make_model(rng):
+    # random primitive (mm) with its base on z = 0
+    size = rng.uniform(30, 120, 3)
+    kind = rng.integers(4)
+    if kind == 0:
+        mesh = o3d.geometry.TriangleMesh.create_box(*size)
+        mesh.translate(-size / 2)
+        mesh = mesh.subdivide_midpoint(3)
+    elif kind == 1:
+        # ellipsoid
+        mesh = o3d.geometry.TriangleMesh.create_sphere(size[0] / 2, resolution=20)
+        mesh.vertices = o3d.utility.Vector3dVector(np.asarray(mesh.vertices) * (size / size[0]))
+    elif kind == 2:
+        mesh = o3d.geometry.TriangleMesh.create_cylinder(size[0] / 2, size[2], resolution=30, split=8)
+    else:
+        mesh = o3d.geometry.TriangleMesh.create_cone(size[0] / 2, size[2], resolution=30, split=8)
+    mesh.translate([0, 0, -mesh.get_min_bound()[2]])
+    mesh.compute_vertex_normals()
+    return mesh
+
+
+def _look_at(eye, target):
+    # cam_T_w (world to camera) of a camera at eye looking at target, y axis down
+    z = (target - eye) / np.linalg.norm(target - eye)
+    x = np.cross(z, [0, 0, 1.0])
+    x = x / np.linalg.norm(x) if np.linalg.norm(x) > 1e-6 else np.array([1.0, 0, 0])
+    y = np.cross(z, x)
+    R = np.stack([x, y, z])  # rows: camera axes in world
+    cam_T_w = np.identity(4)
+    cam_T_w[:3, :3] = R
+    cam_T_w[:3, 3] = -R @ eye
+    return cam_T_w
+
+
+def generate_dataset(dataset_path, split="scenes", num_scenes=1, num_images=4, num_objects=5, num_models=None,
+                     width=640, height=480, model_points=5000, seed=0):
+    # synthetic BOP dataset: num_models random models (models_eval: sampled points with
+    # normals, models_obj_eval: meshes, mm), num_scenes scenes of num_objects models on a
+    # table seen from num_images cameras with rendered depth (mm) and a label-colored rgb
+    rng = np.random.default_rng(seed)
+    num_models = num_models or num_objects
+    os.makedirs(os.path.join(dataset_path, "models_eval"), exist_ok=True)
+    os.makedirs(os.path.join(dataset_path, "models_obj_eval"), exist_ok=True)
+    meshes = []
+    for obj_id in range(1, num_models + 1):
+        mesh = _make_model(rng)
+        o3d.io.write_triangle_mesh(os.path.join(dataset_path, "models_obj_eval", "obj_{:06}.obj".format(obj_id)), mesh)
+        o3d.io.write_point_cloud(os.path.join(dataset_path, "models_eval", "obj_{:06}.ply".format(obj_id)),
+                                 mesh.sample_points_uniformly(model_points))
+        meshes.append(MeshArrays(np.asarray(mesh.vertices, dtype=np.float32) * 0.001,
+                                 np.asarray(mesh.triangles, dtype=np.int32)))
+
+    focal = 0.9 * width
+    cam_K = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]])
+    renderer = CPURenderer(width, height, cam_K, far=5.0)
+    table = MeshArrays(np.array([[-1, -1, 0], [1, -1, 0], [1, 1, 0], [-1, 1, 0]], dtype=np.float32),
+                       np.array([[0, 1, 2], [0, 2, 3]], dtype=np.int32))
+    palette = (rng.uniform(40, 255, (num_objects + 1, 3))).astype(np.uint8)
+    palette[0] = 160  # table
+
+    for scene_num in range(1, num_scenes + 1):
+        scene_path = os.path.join(dataset_path, split, "{:06}".format(scene_num))
+        for modality in ["rgb", "depth"]:
+            os.makedirs(os.path.join(scene_path, modality), exist_ok=True)
+        # objects on a grid of the table with random yaw, so they do not intersect
+        grid = int(np.ceil(np.sqrt(num_objects)))
+        cells = rng.permutation(grid * grid)[:num_objects]
+        obj_ids = rng.integers(1, num_models + 1, num_objects)
+        world_T_models = []
+        for cell in cells:
+            world_T_model = np.identity(4)
+            world_T_model[:3, :3] = o3d.geometry.get_rotation_matrix_from_xyz((0, 0, rng.uniform(0, 2 * np.pi)))
+            world_T_model[:2, 3] = (np.array([cell % grid, cell // grid]) - (grid - 1) / 2) * 0.14
+            world_T_models.append(world_T_model)
+        scene_radius = 0.14 * grid / 2
+
+        scene_camera, scene_gt = {}, {}
+        for image_num in range(num_images):
+            azimuth = 2 * np.pi * image_num / num_images
+            distance = 0.5 + 2.2 * scene_radius
+            eye = distance * np.array([np.cos(azimuth) * 0.6, np.sin(azimuth) * 0.6, 0.8])
+            cam_T_w = _look_at(eye, np.zeros(3))
+            poses = [cam_T_w @ world_T_model for world_T_model in world_T_models]
+            depth, labels = renderer.render_labels([meshes[obj_id - 1] for obj_id in obj_ids] + [table],
+                                                   poses + [cam_T_w])
+            depth = depth + rng.normal(0, 0.5, depth.shape) * (depth > 0)  # sensor noise (mm)
+            shading = np.clip(1.2 - depth / (2000 * distance), 0.3, 1.0)[..., None]
+            rgb = (palette[np.where(labels == len(poses) + 1, 0, labels)] * shading).astype(np.uint8)
+            cv2.imwrite(os.path.join(scene_path, "rgb", "{:06}.png".format(image_num)), rgb)
+            cv2.imwrite(os.path.join(scene_path, "depth", "{:06}.png".format(image_num)),
+                        np.clip(depth, 0, 65535).astype(np.uint16))
+            # the camera pose in the world frame, as in the scene_camera.json read by copy_annotation
+            w_T_cam = np.linalg.inv(cam_T_w)
+            scene_camera[str(image_num)] = {"cam_K": cam_K.reshape(-1).tolist(), "depth_scale": 1.0,
+                                            "cam_R_w2c": w_T_cam[:3, :3].reshape(-1).tolist(),
+                                            "cam_t_w2c": (w_T_cam[:3, 3] * 1000).tolist()}
+            inst_counts = {}
+            gt_objs = []
+            for obj_id, pose in zip(obj_ids, poses):
+                inst_counts[obj_id] = inst_counts.get(obj_id, 0) + 1
+                gt_objs.append(gt_from_pose(pose, int(obj_id), inst_counts[obj_id]))
+            scene_gt[str(image_num)] = gt_objs
+        with open(os.path.join(scene_path, "scene_camera.json"), "w") as f:
+            json.dump(scene_camera, f)
+        for file_name in ["scene_gt.json", GENERATED_SCENE_GT]:
+            with open(os.path.join(scene_path, file_name), "w") as f:
+                json.dump(scene_gt, f)
+
+
+def reset_dataset(dataset_path, split="scenes"):
+    # restores the generated poses, which the timed refine, save and copy_annotation overwrite
+    split_path = os.path.join(dataset_path, split)
+    for scene_name in sorted(os.listdir(split_path)):
+        scene_path = os.path.join(split_path, scene_name)
+        shutil.copy(os.path.join(scene_path, GENERATED_SCENE_GT), os.path.join(scene_path, "scene_gt.json"))
+
+
+def _time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"repeats": repeats, "min_ms": float(np.min(times)), "median_ms": float(np.median(times)),
+            "mean_ms": float(np.mean(times))}
+
+
+def run_config(dataset_path, renderer_backend, repeats, num_moves):
+    engine = AnnotationEngine(dataset_path, "scenes", renderer_backend, sharded=False)
+    scene_num, image_num = 1, 0
+    name = engine.open_image(scene_num, image_num)[0]["name"]
+
+    def move():
+        # a held key: num_moves translations and rotations back and forth
+        for i in range(num_moves):
+            engine.move(scene_num, image_num, name, (0.0004 * (-1) ** i, 0, 0))
+            engine.move(scene_num, image_num, name, rotation=(0, 0, 0.0035 * (-1) ** i))
+
+    operations = [
+        ("scene_load", lambda: engine.open_image(scene_num, image_num, reload=True)),
+        ("move", move),
+        ("refine", lambda: engine.refine(scene_num, image_num, [name])),
+        ("refine_all", lambda: engine.refine(scene_num, image_num)),
+        ("refine_all_joint", lambda: engine.refine(scene_num, image_num, joint=True)),
+        ("validate", lambda: engine.validate(scene_num, image_num)),
+        ("save", lambda: engine.save(scene_num, image_num)),
+        ("copy_annotation", lambda: engine.copy_annotation(scene_num, image_num, image_num + 1)),
+    ]
+    results = {}
+    for operation, fn in operations:
+        fn()  # warm up (model and renderer caches, first open)
+        results[operation] = _time(fn, repeats)
+        print("[Info]   {:<18} median {:9.2f} ms".format(operation, results[operation]["median_ms"]))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    # median time of every operation relative to the baseline run
+    baseline_results = {(json.dumps(r["config"], sort_keys=True), r["operation"]): r for r in baseline["results"]}
+    print("{:<40} {:<18} {:>12} {:>12} {:>8}".format("config", "operation", "base (ms)", "new (ms)", "ratio"))
+    for result in results["results"]:
+        config = json.dumps(result["config"], sort_keys=True)
+        base = baseline_results.get((config, result["operation"]))
+        if base is None:
+            continue
+        label = "{objects} obj {width}x{height}".format(**result["config"])
+        print("{:<40} {:<18} {:>12.2f} {:>12.2f} {:>8.2f}".format(
+            label, result["operation"], base["median_ms"], result["median_ms"],
+            result["median_ms"] / max(base["median_ms"], 1e-9)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the annotation operations on synthetic BOP datasets")
+    parser.add_argument("--work_dir", default="benchmark_data", help="where the synthetic datasets are generated")
+    parser.add_argument("--objects", type=int, nargs="+", default=[5, 20], help="objects per image")
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1920x1080"], help="image resolutions WxH")
+    parser.add_argument("--images", type=int, default=4, help="images per scene")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--moves", type=int, default=30, help="key moves per timed move operation")
+    parser.add_argument("--renderer", choices=["gl", "cpu"], default="cpu",
+                        help="depth renderer of validate, cpu does not need an OpenGL/EGL context")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    results = {"commit": _git_commit(), "timestamp": datetime.datetime.now().isoformat(),
+               "python": platform.python_version(), "platform": platform.platform(),
+               "open3d": o3d.__version__, "renderer": args.renderer, "results": []}
+    for num_objects in args.objects:
+        for resolution in args.resolutions:
+            width, height = [int(x) for x in resolution.split("x")]
+            config = {"objects": num_objects, "images": max(args.images, 2), "width": width, "height": height,
+                      "seed": args.seed}
+            dataset_path = os.path.join(args.work_dir, "obj{objects}_img{images}_{width}x{height}_seed{seed}".format(
+                **config))
+            if not os.path.exists(os.path.join(dataset_path, "scenes", "000001", GENERATED_SCENE_GT)):
+                print("[Info] Generating", dataset_path)
+                generate_dataset(dataset_path, num_images=config["images"], num_objects=num_objects,
+                                 width=width, height=height, seed=args.seed)
+            reset_dataset(dataset_path)  # every run starts from the generated poses
+            print("[Info] Benchmarking {} objects at {}x{}".format(num_objects, width, height))
+            for operation, timing in run_config(dataset_path, args.renderer, args.repeats, args.moves).items():
+                results["results"].append(dict(timing, config=config, operation=operation))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("[Info] Results saved to", args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Compiles the per-image annotation shards (scene_gt_shards/) of a dataset split, saved by
+# annotators running with POSE_ANNO_STORAGE=sharded, into the canonical scene_gt.json of
+# every scene. Safe to run while annotators are saving: scene_gt.json and every shard are
+# accessed under their advisory locks.
+#
+# python compile_scene_gt.py --dataset_path GraspClutter6D_root --split scenes
+
+import argparse
+
+from object_pose_annotator import Dataset, compile_scene_gt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the annotation shards of a dataset split into scene_gt.json")
+    parser.add_argument("--dataset_path", required=True, help="dataset root (contains the split)")
+    parser.add_argument("--split", default="scenes", help="split directory with the scenes")
+    parser.add_argument("--scenes", type=int, nargs="*", help="only compile these scene ids")
+    parser.add_argument("--remove_shards", action="store_true",
+                        help="delete the merged shards (e.g. before going back to single-file storage)")
+    args = parser.parse_args()
+
+    dataset = Dataset(args.dataset_path, args.split)
+    scene_nums = args.scenes if args.scenes else dataset.get_scene_nums()
+    num_shards = 0
+    for scene_num in scene_nums:
+        num_scene_shards = compile_scene_gt(dataset.get_scene_path(scene_num), args.remove_shards)
+        if num_scene_shards:
+            print("[Info] Scene {}: merged {} images".format(scene_num, num_scene_shards))
+        num_shards += num_scene_shards
+    print("[Info] Merged {} images into scene_gt.json".format(num_shards))
+
+
+if __name__ == "__main__":
+    main()
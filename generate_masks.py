@@ -0,0 +1,193 @@
+# Generates BOP-style mask/, mask_visib/ and scene_gt_info.json of a dataset split
+# from the annotations in scene_gt.json, using the validation renderer on a process pool.
+# Only images whose scene_gt.json entry changed since the last run are rendered again.
+#
+# python generate_masks.py --dataset_path GraspClutter6D_root --split scenes
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from object_pose_annotator import Dataset, gt_entry_hash, image_name, make_validation_renderer, pose_from_gt
+
+# hashes of the scene_gt.json entries the masks were generated from
+STATE_FILE = "scene_gt_info_hash.json"
+
+# per worker process state
+_dataset = None
+_renderer_backend = None
+_meshes = {}
+_renderers = {}
+
+
+def _init_worker(dataset_path, split, renderer_backend):
+    global _dataset, _renderer_backend
+    _dataset = Dataset(dataset_path, split)
+    _renderer_backend = renderer_backend
+
+
+def _get_mesh(obj_id):
+    if obj_id not in _meshes:
+        _meshes[obj_id] = _dataset.load_obj_mesh(obj_id)
+    return _meshes[obj_id]
+
+
+def _get_renderer(width, height, intrinsic):
+    key = (width, height, tuple(intrinsic.reshape(-1)))
+    if key not in _renderers:
+        _renderers[key] = make_validation_renderer(width, height, intrinsic, _renderer_backend)
+    return _renderers[key]
+
+
+def _bbox(mask):
+    ys, xs = mask.nonzero()
+    if len(xs) == 0:
+        return [-1, -1, -1, -1]
+    return [int(xs.min()), int(ys.min()), int(xs.max() - xs.min() + 1), int(ys.max() - ys.min() + 1)]
+
+
+def generate_image_masks(task):
+    # renders one depth and one instance-id buffer of the image with the footprint of every
+    # object, derives the amodal (mask) and visible (mask_visib) masks one object at a time
+    # and returns the scene_gt_info.json entry of the image
+    # num_prev_objs: number of objects of the previous scene_gt_info.json entry
+    scene_num, image_num, cam_info, gt_objs, num_prev_objs = task
+    depth_img = cv2.imread(_dataset.get_image_path(scene_num, image_num, 'depth'), -1)
+    if depth_img is None:
+        raise IOError("Failed to read the depth of scene {} image {}".format(scene_num, image_num))
+    height, width = depth_img.shape[:2]
+    depth_captured = np.float32(depth_img) * cam_info["depth_scale"]
+    intrinsic = np.array(cam_info["cam_K"]).reshape((3, 3))
+
+    meshes = [_get_mesh(int(obj["obj_id"])) for obj in gt_objs]
+    poses = [pose_from_gt(obj) for obj in gt_objs]
+    _, labels, footprints = _get_renderer(width, height, intrinsic).render_labels(meshes, poses, footprints=True)
+
+    scene_path = _dataset.get_scene_path(scene_num)
+    for mask_dir in ["mask", "mask_visib"]:
+        os.makedirs(os.path.join(scene_path, mask_dir), exist_ok=True)
+        # masks of objects that are no longer annotated
+        for k in range(len(gt_objs), num_prev_objs):
+            stale_path = os.path.join(scene_path, mask_dir, "{}_{:06}.png".format(image_name(image_num), k))
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    gt_info = []
+    for k, footprint in enumerate(footprints):
+        mask = np.zeros(height * width, dtype=bool)
+        mask[footprint] = True
+        mask = mask.reshape(height, width)
+        mask_visib = labels == k + 1
+        mask_name = "{}_{:06}.png".format(image_name(image_num), k)
+        cv2.imwrite(os.path.join(scene_path, "mask", mask_name), mask.astype(np.uint8) * 255)
+        cv2.imwrite(os.path.join(scene_path, "mask_visib", mask_name), mask_visib.astype(np.uint8) * 255)
+        px_count_all = len(footprint)
+        px_count_visib = int(np.sum(mask_visib))
+        gt_info.append({
+            "bbox_obj": _bbox(mask),
+            "bbox_visib": _bbox(mask_visib),
+            "px_count_all": px_count_all,
+            "px_count_valid": int(np.sum(depth_captured.reshape(-1)[footprint] > 0)),
+            "px_count_visib": px_count_visib,
+            "visib_fract": px_count_visib / px_count_all if px_count_all > 0 else 0.0,
+        })
+    return gt_info
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _dump_json(data, path):
+    # write to a temporary file first so an interrupted run never leaves a broken file
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate BOP masks and scene_gt_info.json of a dataset split")
+    parser.add_argument("--dataset_path", required=True, help="dataset root (contains the split and models_obj_eval)")
+    parser.add_argument("--split", default="scenes", help="split directory with the scenes")
+    parser.add_argument("--scenes", type=int, nargs="*", help="only process these scene ids")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--renderer", choices=["gl", "cpu"], default=os.environ.get("POSE_ANNO_RENDERER", "gl"),
+                        help="depth renderer, cpu does not need an OpenGL/EGL context")
+    parser.add_argument("--force", action="store_true", help="regenerate all images")
+    args = parser.parse_args()
+
+    dataset = Dataset(args.dataset_path, args.split)
+    scene_nums = args.scenes if args.scenes else dataset.get_scene_nums()
+
+    def write_scene(state):
+        scene_path = dataset.get_scene_path(state["scene_num"])
+        _dump_json(state["gt_info"], os.path.join(scene_path, "scene_gt_info.json"))
+        _dump_json(state["hashes"], os.path.join(scene_path, STATE_FILE))
+
+    num_images = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(args.dataset_path, args.split, args.renderer)) as executor:
+        pending = {}
+
+        def collect(futures):
+            nonlocal num_images
+            for future in futures:
+                state, image_key, gt_hash = pending.pop(future)
+                try:
+                    state["gt_info"][image_key] = future.result()
+                    state["hashes"][image_key] = gt_hash
+                    num_images += 1
+                except Exception as e:
+                    print("[WARNING]", e)
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    write_scene(state)
+
+        for scene_num in scene_nums:
+            scene_path = dataset.get_scene_path(scene_num)
+            scene_gt = dataset.load_scene_gt(scene_num)
+            scene_camera = dataset.load_scene_camera(scene_num)
+            state = {"scene_num": scene_num,
+                     "gt_info": _load_json(os.path.join(scene_path, "scene_gt_info.json")),
+                     "hashes": {} if args.force else _load_json(os.path.join(scene_path, STATE_FILE))}
+            # drop images that are no longer annotated
+            removed = [key for key in state["gt_info"] if key not in scene_gt]
+            for key in removed:
+                state["gt_info"].pop(key)
+                state["hashes"].pop(key, None)
+
+            tasks = []
+            for image_key in sorted(scene_gt.keys(), key=int):
+                gt_hash = gt_entry_hash(scene_gt[image_key])
+                if state["hashes"].get(image_key) == gt_hash and image_key in state["gt_info"]:
+                    continue
+                tasks.append((image_key, gt_hash, (scene_num, int(image_key), scene_camera[image_key],
+                                                   scene_gt[image_key], len(state["gt_info"].get(image_key, [])))))
+            state["remaining"] = len(tasks)
+            if not tasks:
+                if removed:
+                    write_scene(state)
+                continue
+            print("[Info] Scene {}: {} images to update".format(scene_num, len(tasks)))
+            for image_key, gt_hash, task in tasks:
+                # keep a bounded number of images in flight
+                if len(pending) >= 4 * args.workers:
+                    finished, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending[executor.submit(generate_image_masks, task)] = (state, image_key, gt_hash)
+        collect(list(pending.keys()))
+
+    print("[Info] Generated the masks of {} images".format(num_images))
+
+
+if __name__ == "__main__":
+    main()
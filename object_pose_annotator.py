@@ -3,7 +3,7 @@
 # Base codes from Anas Gouda (anas.gouda@tu-dortmund.de)
 # FLW, TU Dortmund, Germany
 
-import glob
+import hashlib
 import numpy as np
 import open3d as o3d
 import open3d.visualization.gui as gui
@@ -15,13 +15,26 @@ import cv2
 import datetime
 import numpy as np
 import os
-import sys
 import copy
+import threading
+import time
 import matplotlib
 import matplotlib.cm
+import contextlib
+import functools
+import tracemalloc
+import atexit
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 from pathlib import Path
-from os.path import basename, dirname
+from os.path import basename
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
 from scipy.spatial.transform import Rotation as Rot
 
 # customize the threshold factor for each camera if needed
@@ -32,11 +45,725 @@ camera_idx_to_thresh_factor = {
     3: 1.0, # azure kinect
 }
 
+# depth difference thresholds (mm) of the annotation quality check
+DEPTH_DELTA_1 = 5  # high-quality annotation
+DEPTH_DELTA_2 = 15  # ok-ish annotation
+DEPTH_OK_DELTA = 25  # mean depth difference of a complete annotation (scaled per camera)
+
+# the validation renders at 1 / VALIDATION_DOWNSCALE of the image resolution
+VALIDATION_DOWNSCALE = 4
+
+# level of detail: voxel sizes (m) of the coarse levels, finest first, and the time (s)
+# without camera navigation or key moves after which the full detail is shown again
+LOD_VOXEL_SIZES = [0.002, 0.004, 0.008, 0.016]
+LOD_IDLE_TIME = 0.3
+LOD_SUFFIX = "_lod"  # name suffix of the coarse copy of a geometry in the 3D scene
+POSE_HISTORY_SIZE = 512  # pose changes kept for undo/redo
+POSE_HISTORY_COALESCE_TIME = 0.5  # key-repeat moves of an object closer than this (s) are undone together
+IMAGE_PANEL_WIDTH = 512  # width (px) of the rgb / depth difference / mask images of the image panel
+
+# sharded annotation storage: every image is saved to scene_gt_shards/<image>.json of the scene
+# instead of scene_gt.json, so several annotators of a scene never overwrite each other.
+# compile_scene_gt.py merges the shards into scene_gt.json.
+SCENE_GT_SHARD_DIR = "scene_gt_shards"
+# hidden directory of a scene with the lock files of its annotation files
+SCENE_LOCK_DIR = ".locks"
+
+def image_name(image_num):
+    # file name (without extension) of an image; negative ids carry their sign
+    return f'{image_num:07}' if image_num < 0 else f'{image_num:06}'
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+# hot-path tracing: with POSE_ANNO_TRACE=1 (or POSE_ANNO_TRACE=<file>.json) scene loading,
+# validation, ICP refinement and saving are timed as nested spans together with the memory
+# allocated in them (tracemalloc; off with POSE_ANNO_TRACE_MEMORY=0). the spans are shown in
+# the Timing panel and written as a Chrome trace (chrome://tracing, ui.perfetto.dev) on exit
+TRACE_FILE = "pose_anno_trace.json"
+TRACE_MAX_EVENTS = 200000  # oldest spans are dropped beyond this
+
+
+class Tracer:
+    # spans nest per thread; when tracing is disabled span() and traced() cost a flag check
+    def __init__(self, max_events=TRACE_MAX_EVENTS):
+        self.enabled = False
+        self.trace_memory = False
+        self.path = TRACE_FILE
+        self.events = deque(maxlen=max_events)  # Chrome trace events
+        self.last = []  # [(depth, name, ms, allocated kb)] of the last span tree of the main thread
+        self.on_last = None  # called with last when a span tree of the main thread finishes
+        self._main_thread = threading.get_ident()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+
+    def enable(self, path=None, trace_memory=True):
+        # the trace is exported to path on exit (None: only on export())
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.trace_memory = trace_memory
+        if path is not None and not self.enabled:
+            atexit.register(lambda: self.export())
+        self.path = path if path is not None else self.path
+        self.enabled = True
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            with self._lock:
+                self.events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                                    "tid": threading.get_ident(),
+                                    "args": {"name": threading.current_thread().name}})
+        node = (name, [])  # children as (name, ms, kb, children)
+        stack.append(node)
+        mem_start = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            # net allocation of the span, i.e. python and numpy memory still held at its end
+            alloc_kb = (tracemalloc.get_traced_memory()[0] - mem_start) / 1024 if self.trace_memory else 0
+            stack.pop()
+            args["alloc_kb"] = round(alloc_kb, 1)
+            with self._lock:
+                self.events.append({"name": name, "ph": "X", "ts": (start - self._t0) * 1e6,
+                                    "dur": (end - start) * 1e6, "pid": os.getpid(),
+                                    "tid": threading.get_ident(), "args": args})
+            record = (name, (end - start) * 1000, alloc_kb, node[1])
+            if stack:
+                stack[-1][1].append(record)
+            elif threading.get_ident() == self._main_thread:
+                self.last = []
+                self._flatten(record, 0)
+                if self.on_last is not None:
+                    self.on_last(self.last)
+
+    def _flatten(self, record, depth):
+        name, ms, kb, children = record
+        self.last.append((depth, name, ms, kb))
+        for child in children:
+            self._flatten(child, depth + 1)
+
+    def traced(self, name=None):
+        # decorator: the function (or method) as one span
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def export(self, path=None):
+        path = path or self.path
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+tracer = Tracer()
+if os.environ.get("POSE_ANNO_TRACE", "0") not in ("", "0"):
+    tracer.enable(os.environ["POSE_ANNO_TRACE"] if os.environ["POSE_ANNO_TRACE"].endswith(".json") else TRACE_FILE,
+                  os.environ.get("POSE_ANNO_TRACE_MEMORY", "1") != "0")
+
+
+class PointArrays:
+    # float32 point cloud: points, colors (0-1) and normals are (N, 3) float32 arrays, colors
+    # and normals may be None. Open3D geometries are only made on demand: to_tensor() wraps the
+    # arrays without a copy for the 3D scene, to_legacy() makes the float64 copy the
+    # registration pipelines need.
+    def __init__(self, points, colors=None, normals=None):
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        self.colors = None if colors is None else np.ascontiguousarray(colors, dtype=np.float32)
+        self.normals = None if normals is None else np.ascontiguousarray(normals, dtype=np.float32)
+
+    @classmethod
+    def read(cls, path, scale=1.0):
+        pcd = o3d.io.read_point_cloud(path)
+        points = np.asarray(pcd.points, dtype=np.float32)
+        points *= scale  # unit conversion in place
+        colors = np.asarray(pcd.colors, dtype=np.float32) if pcd.has_colors() else None
+        normals = np.asarray(pcd.normals, dtype=np.float32) if pcd.has_normals() else None
+        return cls(points, colors, normals)
+
+    def has_normals(self):
+        return self.normals is not None
+
+    def get_center(self):
+        return self.points.mean(axis=0, dtype=np.float64)
+
+    def get_axis_aligned_bounding_box(self):
+        return o3d.geometry.AxisAlignedBoundingBox(self.points.min(axis=0).astype(np.float64),
+                                                   self.points.max(axis=0).astype(np.float64))
+
+    def voxel_down_sample(self, voxel_size):
+        # average point (color, normal) of every occupied voxel
+        if len(self.points) == 0:
+            return self
+        keys = np.floor(self.points / voxel_size).astype(np.int64)
+        keys -= keys.min(axis=0)
+        dims = keys.max(axis=0) + 1
+        _, inverse, counts = np.unique((keys[:, 0] * dims[1] + keys[:, 1]) * dims[2] + keys[:, 2],
+                                       return_inverse=True, return_counts=True)
+
+        def voxel_mean(values):
+            if values is None:
+                return None
+            sums = np.stack([np.bincount(inverse, weights=values[:, i], minlength=len(counts))
+                             for i in range(3)], axis=1)
+            return sums / counts[:, None]
+
+        normals = voxel_mean(self.normals)
+        if normals is not None:
+            normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        return PointArrays(voxel_mean(self.points), voxel_mean(self.colors), normals)
+
+    def to_tensor(self):
+        pcd = o3d.t.geometry.PointCloud(o3d.core.Tensor.from_numpy(self.points))
+        if self.colors is not None:
+            pcd.point["colors"] = o3d.core.Tensor.from_numpy(self.colors)
+        if self.normals is not None:
+            pcd.point["normals"] = o3d.core.Tensor.from_numpy(self.normals)
+        return pcd
+
+    def to_legacy(self):
+        pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(self.points.astype(np.float64)))
+        if self.colors is not None:
+            pcd.colors = o3d.utility.Vector3dVector(self.colors.astype(np.float64))
+        if self.normals is not None:
+            pcd.normals = o3d.utility.Vector3dVector(self.normals.astype(np.float64))
+        return pcd
+
+
+class MeshArrays:
+    # float32 vertices (N, 3) and int32 triangles (M, 3) of a triangle mesh
+    def __init__(self, vertices, triangles):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int32)
+
+    @classmethod
+    def read(cls, path, scale=1.0):
+        mesh = o3d.io.read_triangle_mesh(path)
+        vertices = np.asarray(mesh.vertices, dtype=np.float32)
+        vertices *= scale  # unit conversion in place
+        return cls(vertices, np.asarray(mesh.triangles))
+
+    def transform(self, transform):
+        return MeshArrays(self.vertices @ transform[:3, :3].T + transform[:3, 3], self.triangles)
+
+    def to_legacy(self):
+        return o3d.geometry.TriangleMesh(o3d.utility.Vector3dVector(self.vertices.astype(np.float64)),
+                                         o3d.utility.Vector3iVector(self.triangles))
+
+
+@tracer.traced()
+def backproject_depth(rgb_img, depth_img, cam_K, depth_trunc=3.0):
+    # colored point cloud of an organized depth image (meter), with normals from the
+    # neighboring pixels oriented towards the camera
+    h, w = depth_img.shape
+    depth = np.where((depth_img > 0) & (depth_img < depth_trunc), depth_img, 0).astype(np.float32)
+    v, u = np.mgrid[0:h, 0:w].astype(np.float32)
+    xyz = np.stack([(u - cam_K[0, 2]) * depth / cam_K[0, 0], (v - cam_K[1, 2]) * depth / cam_K[1, 1], depth], axis=-1)
+
+    normals = np.zeros_like(xyz)
+    normals[..., 2] = -1  # facing the camera where the neighborhood is incomplete
+    dx = xyz[1:-1, 2:] - xyz[1:-1, :-2]
+    dy = xyz[2:, 1:-1] - xyz[:-2, 1:-1]
+    interior = (depth[1:-1, 2:] > 0) & (depth[1:-1, :-2] > 0) & (depth[2:, 1:-1] > 0) & (depth[:-2, 1:-1] > 0)
+    cross = np.cross(dx, dy)
+    norm = np.linalg.norm(cross, axis=-1)
+    interior &= norm > 1e-12
+    cross[interior] /= norm[interior][:, None]
+    cross[np.sum(cross * xyz[1:-1, 1:-1], axis=-1) > 0] *= -1
+    normals[1:-1, 1:-1][interior] = cross[interior]
+
+    valid = depth > 0
+    colors = cv2.cvtColor(rgb_img, cv2.COLOR_BGR2RGB)[valid].astype(np.float32) / 255
+    return PointArrays(xyz[valid], colors, normals[valid])
+
+
+class DatasetManifest:
+    # cached directory listing of a dataset split: scene ids, image ids and rgb extension of
+    # each scene and model ids. a listing is only refreshed when the mtime of its directory
+    # changed, scenes lazily on first access. the manifest is kept next to the split
+    # (in memory only if the dataset is read-only).
+    VERSION = 1
+
+    def __init__(self, dataset_path, dataset_split, objects_path):
+        self.scenes_path = os.path.join(dataset_path, dataset_split)
+        self.objects_path = objects_path
+        self.path = os.path.join(dataset_path, ".manifest_{}.json".format(dataset_split))
+        self._lock = threading.Lock()
+        self._data = {"version": self.VERSION, "scenes": None, "images": {}, "models": None}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    self._data = data
+            except ValueError:
+                print("[WARNING] Failed to read the dataset manifest", self.path)
+        self._checked = set()  # listings whose mtime was checked in this session
+
+    def _save(self):
+        try:
+            dump_json_atomic(self._data, self.path)
+        except OSError:
+            pass
+
+    def _refresh(self, key, dir_path, list_fn):
+        # returns the cached listing of dir_path; list_fn(entry names) builds a new one
+        cached = self._data[key] if key in ("scenes", "models") else self._data["images"].get(key)
+        if (key, dir_path) in self._checked and cached is not None:
+            return cached
+        mtime = _mtime(dir_path)
+        if cached is None or cached["mtime"] != mtime:
+            names = os.listdir(dir_path) if mtime is not None else []
+            cached = dict(list_fn(dir_path, names), mtime=mtime)
+            if key in ("scenes", "models"):
+                self._data[key] = cached
+            else:
+                self._data["images"][key] = cached
+            self._save()
+        self._checked.add((key, dir_path))
+        return cached
+
+    def get_scene_nums(self):
+        def list_scenes(dir_path, names):
+            return {"ids": sorted(int(x) for x in names if x.isdigit() and os.path.isdir(os.path.join(dir_path, x)))}
+        with self._lock:
+            return self._refresh("scenes", self.scenes_path, list_scenes)["ids"]
+
+    def _get_rgb_listing(self, scene_num):
+        def list_images(dir_path, names):
+            for ext in ['.png', '.jpg']:
+                ids = sorted(int(x[:-len(ext)]) for x in names if x.endswith(ext))
+                if ids:
+                    return {"ids": ids, "ext": ext}
+            return {"ids": [], "ext": '.png'}
+        with self._lock:
+            return self._refresh(str(scene_num), os.path.join(self.scenes_path, f'{scene_num:06}', 'rgb'),
+                                 list_images)
+
+    def get_image_nums(self, scene_num):
+        return self._get_rgb_listing(scene_num)["ids"]
+
+    def get_rgb_ext(self, scene_num):
+        return self._get_rgb_listing(scene_num)["ext"]
+
+    def get_obj_ids(self):
+        def list_models(dir_path, names):
+            return {"ids": sorted(int(x[4:-4]) for x in names if x.startswith("obj_") and x.endswith(".ply"))}
+        with self._lock:
+            return self._refresh("models", self.objects_path, list_models)["ids"]
+
+
 class Dataset:
     def __init__(self, dataset_path, dataset_split):
+        self.dataset_path = dataset_path
+        self.dataset_split = dataset_split
         self.scenes_path = os.path.join(dataset_path, dataset_split)
         self.objects_path = os.path.join(dataset_path, 'models_eval')
         self.mesh_path = os.path.join(dataset_path, 'models_obj_eval')
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        # created on first use, so worker processes that only load files never list directories
+        if self._manifest is None:
+            self._manifest = DatasetManifest(self.dataset_path, self.dataset_split, self.objects_path)
+        return self._manifest
+
+    def get_scene_path(self, scene_num):
+        return os.path.join(self.scenes_path, f'{scene_num:06}')
+
+    def get_scene_nums(self):
+        return self.manifest.get_scene_nums()
+
+    def get_image_nums(self, scene_num):
+        return self.manifest.get_image_nums(scene_num)
+
+    def get_obj_ids(self):
+        return self.manifest.get_obj_ids()
+
+    def get_image_path(self, scene_num, image_num, modality='rgb', ext='.png'):
+        return os.path.join(self.get_scene_path(scene_num), modality, image_name(image_num) + ext)
+
+    def get_rgb_path(self, scene_num, image_num):
+        return self.get_image_path(scene_num, image_num, 'rgb', self.manifest.get_rgb_ext(scene_num))
+
+    def load_scene_camera(self, scene_num):
+        with open(os.path.join(self.get_scene_path(scene_num), 'scene_camera.json')) as f:
+            return json.load(f)
+
+    def load_scene_gt(self, scene_num):
+        # includes the annotations saved to shards that were not compiled yet
+        return read_scene_gt(self.get_scene_path(scene_num))
+
+    def load_sample(self, scene_num, image_num, camera_idx, cam_info, gt_objs):
+        # decoded rgb (HxWx3 uint8, RGB order) and depth (HxW float32, mm), camera intrinsics
+        # and extrinsics and the GT poses (N, 4, 4) (meter) of one image
+        rgb_img = cv2.imread(self.get_rgb_path(scene_num, image_num))
+        depth_img = cv2.imread(self.get_image_path(scene_num, image_num, 'depth'), -1)
+        if rgb_img is None or depth_img is None:
+            raise IOError("Failed to read the images of scene {} image {}".format(scene_num, image_num))
+        cam_T_w2c = np.identity(4)
+        if "cam_R_w2c" in cam_info:
+            cam_T_w2c = pose_from_gt({"cam_R_m2c": cam_info["cam_R_w2c"], "cam_t_m2c": cam_info["cam_t_w2c"]})
+        return {
+            "scene_id": scene_num,
+            "image_id": image_num,
+            "camera_idx": camera_idx,
+            "rgb": cv2.cvtColor(rgb_img, cv2.COLOR_BGR2RGB),
+            "depth": np.float32(depth_img) * cam_info["depth_scale"],
+            "cam_K": np.array(cam_info["cam_K"], dtype=np.float64).reshape((3, 3)),
+            "cam_T_w2c": cam_T_w2c,
+            "obj_ids": np.array([int(obj["obj_id"]) for obj in gt_objs], dtype=np.int64),
+            "inst_ids": np.array([int(obj.get("inst_id", 0)) for obj in gt_objs], dtype=np.int64),  # 0: not stored
+            "poses": np.array([pose_from_gt(obj) for obj in gt_objs]).reshape((-1, 4, 4)),
+        }
+
+    def iter_samples(self, scene_nums=None, camera_idxs=None, annotated_only=False, num_workers=4, prefetch=8):
+        # streams the samples (see load_sample) of a split in order. at most prefetch samples
+        # are read ahead on num_workers threads, so memory does not grow with the dataset.
+        # camera_idx follows the image order of a scene, as in the annotator (index % 4).
+        def iter_tasks():
+            for scene_num in (self.get_scene_nums() if scene_nums is None else scene_nums):
+                scene_camera = self.load_scene_camera(scene_num)
+                scene_gt = self.load_scene_gt(scene_num)
+                for image_idx, image_num in enumerate(sorted(int(x) for x in scene_camera.keys())):
+                    gt_objs = scene_gt.get(str(image_num), [])
+                    if camera_idxs is not None and image_idx % 4 not in camera_idxs:
+                        continue
+                    if annotated_only and not gt_objs:
+                        continue
+                    yield scene_num, image_num, image_idx % 4, scene_camera[str(image_num)], gt_objs
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = deque()
+            try:
+                for task in iter_tasks():
+                    if len(pending) >= prefetch:
+                        yield pending.popleft().result()
+                    pending.append(executor.submit(self.load_sample, *task))
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # the consumer stopped early: drop the read-ahead
+                for future in pending:
+                    future.cancel()
+
+    def load_obj_geometry(self, obj_id):
+        return PointArrays.read(os.path.join(self.objects_path, f'obj_{obj_id:06}.ply'),
+                                scale=0.001)  # convert mm to meter
+
+    def load_obj_mesh(self, obj_id):
+        return MeshArrays.read(os.path.join(self.mesh_path, f'obj_{obj_id:06}.obj'),
+                               scale=0.001)  # convert mm to meter
+
+
+def pose_from_gt(obj):
+    # 4x4 cam_T_model (meter) of a BOP scene_gt.json entry
+    translation = np.array(np.array(obj['cam_t_m2c']), dtype=np.float64) / 1000  # convert to meter
+    orientation = np.array(np.array(obj['cam_R_m2c']), dtype=np.float64)
+    transform = np.concatenate((orientation.reshape((3, 3)), translation.reshape(3, 1)), axis=1)
+    return np.concatenate((transform, np.array([0, 0, 0, 1]).reshape(1, 4)))  # homogeneous transform
+
+
+def gt_from_pose(transform, obj_id, inst_id):
+    # scene_gt.json entry of a 4x4 cam_T_model (meter)
+    return {
+        "cam_R_m2c": transform[0:3, 0:3].tolist(),  # rotation matrix
+        "cam_t_m2c": np.array(transform[0:3, 3] * 1000, dtype=np.float32).tolist(),  # convert meter to mm
+        "obj_id": obj_id,
+        "inst_id": inst_id
+    }
+
+
+def transfer_gt(gt_objs, cam_info_source, cam_info_target):
+    # scene_gt.json entries of one image expressed in the camera of another image of the
+    # scene, using the camera poses (cam_R_w2c, cam_t_w2c) of scene_camera.json
+    se3_base_to_source = np.eye(4)
+    se3_base_to_source[:3, :3] = np.array(cam_info_source["cam_R_w2c"]).reshape(3, 3)
+    se3_base_to_source[:3, 3] = np.array(cam_info_source["cam_t_w2c"])
+    se3_base_to_target = np.eye(4)
+    se3_base_to_target[:3, :3] = np.array(cam_info_target["cam_R_w2c"]).reshape(3, 3)
+    se3_base_to_target[:3, 3] = np.array(cam_info_target["cam_t_w2c"])
+    se3_target_to_source = np.matmul(np.linalg.inv(se3_base_to_target), se3_base_to_source)
+
+    target_data = list()
+    for source in gt_objs:
+        se3_source_to_object = np.eye(4)
+        se3_source_to_object[:3, :3] = np.array(source['cam_R_m2c']).reshape(3, 3)
+        se3_source_to_object[:3, 3] = np.array(source['cam_t_m2c'])
+        se3_target_to_object = np.matmul(se3_target_to_source, se3_source_to_object)
+        target = copy.deepcopy(source)
+        target['cam_R_m2c'] = se3_target_to_object[:3, :3].reshape(9).tolist()
+        target['cam_t_m2c'] = se3_target_to_object[:3, 3].tolist()
+        target_data.append(target)
+    return target_data
+
+
+def move_delta(center, x, y, z, rx, ry, rz):
+    # transformation of a key move: a translation, or a rotation (xyz euler angles, radian)
+    # around the object center
+    if x != 0 or y != 0 or z != 0:
+        return np.array([[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z], [0, 0, 0, 1]])
+    rot_mat_obj_center = o3d.geometry.get_rotation_matrix_from_xyz((rx, ry, rz))
+    T_neg = np.vstack((np.hstack((np.identity(3), -center.reshape(3, 1))), [0, 0, 0, 1]))
+    R = np.vstack((np.hstack((rot_mat_obj_center, [[0], [0], [0]])), [0, 0, 0, 1]))
+    T_pos = np.vstack((np.hstack((np.identity(3), center.reshape(3, 1))), [0, 0, 0, 1]))
+    return np.matmul(T_pos, np.matmul(R, T_neg))
+
+
+def gt_entry_hash(gt_objs):
+    # hash of the annotation of one image (its list of scene_gt.json entries)
+    return hashlib.sha1(json.dumps(gt_objs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(scene_path, name):
+    # advisory exclusive lock of a scene file, held on <scene>/.locks/<name>.lock. lock files
+    # are never deleted, since another process may be waiting on the deleted file's lock
+    lock_dir = os.path.join(scene_path, SCENE_LOCK_DIR)
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, name + ".lock"), "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def dump_json_atomic(data, path):
+    # the temporary file is unique per process, so annotators on shared storage never mix writes
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def use_sharded_storage():
+    # POSE_ANNO_STORAGE=sharded saves per-image shards instead of scene_gt.json
+    return os.environ.get("POSE_ANNO_STORAGE", "single") == "sharded"
+
+
+def read_scene_gt(scene_path):
+    # scene_gt.json of a scene with the per-image shards applied on top of it
+    scene_gt = {}
+    scene_gt_path = os.path.join(scene_path, "scene_gt.json")
+    if os.path.exists(scene_gt_path):
+        with open(scene_gt_path) as f:
+            scene_gt = json.load(f)
+    shard_dir = os.path.join(scene_path, SCENE_GT_SHARD_DIR)
+    if os.path.isdir(shard_dir):
+        for file_name in sorted(os.listdir(shard_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(shard_dir, file_name)) as f:
+                scene_gt[str(int(file_name[:-5]))] = json.load(f)
+    return scene_gt
+
+
+def _shard_lock_name(image_num):
+    return "shard_" + image_name(image_num)
+
+
+def remove_shard(scene_path, image_num, gt_objs=None):
+    # deletes the shard of an image; with gt_objs only if the shard still holds them.
+    # returns whether it was deleted
+    shard_path = os.path.join(scene_path, SCENE_GT_SHARD_DIR, image_name(image_num) + ".json")
+    with file_lock(scene_path, _shard_lock_name(image_num)):
+        if not os.path.exists(shard_path):
+            return False
+        if gt_objs is not None:
+            with open(shard_path) as f:
+                if json.load(f) != gt_objs:
+                    return False
+        os.remove(shard_path)
+    return True
+
+
+def write_scene_gt_entry(scene_path, image_num, gt_objs, sharded=False):
+    # saves the annotation of one image, either to its shard or into scene_gt.json. both are
+    # written under an advisory lock and replaced atomically
+    shard_path = os.path.join(scene_path, SCENE_GT_SHARD_DIR, image_name(image_num) + ".json")
+    if sharded:
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        with file_lock(scene_path, _shard_lock_name(image_num)):
+            dump_json_atomic(gt_objs, shard_path)
+        return
+    scene_gt_path = os.path.join(scene_path, "scene_gt.json")
+    with file_lock(scene_path, "scene_gt"):
+        # read under the lock, so annotators saving other images of the scene are not lost
+        scene_gt = {}
+        if os.path.exists(scene_gt_path):
+            try:
+                with open(scene_gt_path) as f:
+                    scene_gt = json.load(f)
+            except ValueError:
+                date_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                backup_path = scene_gt_path.replace(".json", "_backup_{}.json".format(date_time))
+                shutil.copy(scene_gt_path, backup_path)
+                print("[WARNING] Failed to read {}, saved it as {}".format(scene_gt_path, backup_path))
+        scene_gt[str(image_num)] = gt_objs
+        dump_json_atomic(scene_gt, scene_gt_path)
+        # an older shard of the image would override the saved annotation on reading
+        if os.path.exists(shard_path):
+            remove_shard(scene_path, image_num)
+
+
+def compile_scene_gt(scene_path, remove_shards=False):
+    # merges the shards of a scene into scene_gt.json; returns the number of merged shards.
+    # with remove_shards, shards are deleted unless they were saved again meanwhile
+    shard_dir = os.path.join(scene_path, SCENE_GT_SHARD_DIR)
+    scene_gt_path = os.path.join(scene_path, "scene_gt.json")
+    with file_lock(scene_path, "scene_gt"):
+        scene_gt = read_scene_gt(scene_path)
+        shard_names = [name for name in os.listdir(shard_dir) if name.endswith(".json")] \
+            if os.path.isdir(shard_dir) else []
+        if not shard_names:
+            return 0
+        dump_json_atomic(scene_gt, scene_gt_path)
+        if remove_shards:
+            for file_name in shard_names:
+                image_num = int(file_name[:-5])
+                remove_shard(scene_path, image_num, scene_gt[str(image_num)])
+    return len(shard_names)
+
+
+class QualityIndex:
+    # per-scene index of the annotation quality of every validated image, stored next to
+    # scene_gt.json. an entry is only valid while the pose hash matches the image's annotation.
+    FILE_NAME = "anno_quality_index.json"
+
+    def __init__(self, scene_path):
+        self.scene_path = scene_path
+        self.path = os.path.join(scene_path, self.FILE_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print("[WARNING] Failed to read the quality index", self.path)
+
+    def get(self, image_num, gt_objs):
+        entry = self.entries.get(str(image_num))
+        if entry is None or entry["pose_hash"] != gt_entry_hash(gt_objs):
+            return None
+        return entry
+
+    def is_complete(self, image_num, gt_objs):
+        entry = self.get(image_num, gt_objs)
+        return entry is not None and entry["complete"]
+
+    def num_complete(self):
+        # complete images, without checking the pose hashes
+        return sum(entry["complete"] for entry in self.entries.values())
+
+    def update(self, image_num, gt_objs, objects, num_objects):
+        # objects: [{"name", "depth_diff_mean", "status"}] of the validated objects
+        entry = {
+            "pose_hash": gt_entry_hash(gt_objs),
+            "objects": objects,
+            "complete": 0 < len(objects) == num_objects and all(obj["status"] == "Complete" for obj in objects),
+        }
+        with file_lock(self.scene_path, "anno_quality_index"):
+            # entries written by other annotators of the scene since it was read are kept
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        self.entries = json.load(f)
+                except ValueError:
+                    print("[WARNING] Failed to read the quality index", self.path)
+            self.entries[str(image_num)] = entry
+            dump_json_atomic(self.entries, self.path)
+
+
+class SceneGtWriter:
+    # saves the annotation of an image (write_scene_gt_entry) on a single background thread,
+    # so saving never blocks the GUI and saves of this process never interleave. the files are
+    # replaced atomically: a crash leaves either the previous or the new version.
+    def __init__(self, sharded=None):
+        self.sharded = use_sharded_storage() if sharded is None else sharded
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def write(self, scene_path, image_num, gt_objs):
+        # returns a future of the updated annotation of the scene (read_scene_gt)
+        return self._executor.submit(self._write, scene_path, image_num, gt_objs)
+
+    def _write(self, scene_path, image_num, gt_objs):
+        write_scene_gt_entry(scene_path, image_num, gt_objs, self.sharded)
+        return read_scene_gt(scene_path)
+
+
+class BackgroundTask:
+    # runs build_fn once on a daemon thread; result() waits for it to finish
+    def __init__(self, build_fn):
+        self._build_fn = build_fn
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            self._result = self._build_fn()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class LevelOfDetail:
+    # voxel-downsampled levels of a point cloud; level 0 is the cloud itself.
+    # each level is downsampled from the previous one, so building all levels is cheap
+    def __init__(self, pcd, voxel_sizes=LOD_VOXEL_SIZES):
+        self.levels = [pcd]
+        for voxel_size in voxel_sizes:
+            self.levels.append(self.levels[-1].voxel_down_sample(voxel_size))
+
+    def get_level(self, point_budget):
+        # finest level within the point budget
+        for level in self.levels:
+            if len(level.points) <= point_budget:
+                return level
+        return self.levels[-1]
 
 
 class AnnotationScene:
@@ -46,9 +773,17 @@ class AnnotationScene:
         self.image_num = image_num
 
         self.obj_list = list()
-
-    def add_obj(self, obj_geometry, obj_mesh, obj_name, obj_instance, transform=np.identity(4)):
-        self.obj_list.append(self.SceneObject(obj_geometry, obj_mesh, obj_name, obj_instance, transform))
+        # spatial indices of the scene, built once per scene in the background
+        self._scene_tree = None
+        self._scene_raycaster = None
+        self._model_raycasters = {}
+        self.scene_features = None  # FPFH of the scene cloud for pose proposals
+
+    def add_obj(self, obj_geometry, obj_mesh, obj_name, obj_instance, transform=np.identity(4), index=None):
+        obj = self.SceneObject(obj_geometry, obj_mesh, obj_name, obj_instance, transform)
+        self.obj_list.insert(len(self.obj_list) if index is None else index, obj)
+        if self._scene_raycaster is not None:
+            self._build_model_raycaster_async(obj)
 
     def get_objects(self):
         return self.obj_list[:]
@@ -56,20 +791,859 @@ class AnnotationScene:
     def remove_obj(self, index):
         self.obj_list.pop(index)
 
+    def build_scene_tree_async(self):
+        # start building the KD-tree of the scene cloud in the background
+        if self._scene_tree is None:
+            scene_points = np.asarray(self.annotation_scene.points)
+            self._scene_tree = BackgroundTask(lambda: cKDTree(scene_points))
+
+    def get_scene_tree(self):
+        # KD-tree over the scene cloud points; waits for the background build if needed
+        self.build_scene_tree_async()
+        return self._scene_tree.result()
+
+    def build_raycaster_async(self, depth_img, cam_K):
+        # start building the ray-casting structure of the scene surface in the background.
+        # depth_img is the organized depth (meter) the scene cloud was made from.
+        if self._scene_raycaster is None:
+            self._scene_raycaster = BackgroundTask(lambda: make_raycasting_scene(*make_depth_mesh(depth_img, cam_K)))
+            # the models are ray cast as well; objects added later start theirs in add_obj
+            for obj in self.obj_list:
+                self._build_model_raycaster_async(obj)
+
+    def _build_model_raycaster_async(self, obj):
+        # one ray-casting structure per model in its model frame, shared by its instances
+        model_name = obj.obj_name.rsplit('_', 1)[0]
+        if model_name not in self._model_raycasters:
+            vertices, triangles = np.asarray(obj.obj_mesh.vertices), np.asarray(obj.obj_mesh.triangles)
+            self._model_raycasters[model_name] = BackgroundTask(lambda: make_raycasting_scene(vertices, triangles))
+
+    def cast_ray(self, origin, direction, exclude=None):
+        # distance along the ray to the nearest hit on the scene surface or on any object
+        # except `exclude` (np.inf if nothing is hit). direction must be normalized.
+        ray = np.hstack([origin, direction]).astype(np.float32).reshape(1, 6)
+        t_hit = np.inf
+        if self._scene_raycaster is not None:
+            t_hit = self._scene_raycaster.result().cast_rays(o3d.core.Tensor(ray))['t_hit'].numpy()[0]
+        for obj in self.obj_list:
+            if obj is exclude:
+                continue
+            # objects are tested in their model frame, so poses can change freely
+            self._build_model_raycaster_async(obj)  # only builds here if added before the scene raycaster
+            model_raycaster = self._model_raycasters[obj.obj_name.rsplit('_', 1)[0]].result()
+            inv_transform = np.linalg.inv(obj.transform)
+            obj_ray = np.hstack([inv_transform[:3, :3] @ origin + inv_transform[:3, 3],
+                                 inv_transform[:3, :3] @ direction]).astype(np.float32).reshape(1, 6)
+            t_obj = model_raycaster.cast_rays(o3d.core.Tensor(obj_ray))['t_hit'].numpy()[0]
+            t_hit = min(t_hit, t_obj)
+        return t_hit
+
     class SceneObject:
+        # obj_geometry and obj_mesh stay in the model frame; the pose is only kept in transform
         def __init__(self, obj_geometry, obj_mesh, obj_name, obj_instance, transform):
             self.obj_geometry = obj_geometry
             self.obj_mesh = obj_mesh
             self.obj_name = obj_name
             self.obj_instance = obj_instance
+            self.model_center = obj_geometry.get_center()
             self.transform = np.identity(4)
             self.set_transform(transform)
 
         def set_transform(self, transform):
-            self.obj_geometry.transform(transform)
-            self.obj_mesh.transform(transform)
             self.transform = np.matmul(transform, self.transform)
 
+        def get_center(self):
+            return self.transform[:3, :3] @ self.model_center + self.transform[:3, 3]
+
+        def get_points(self):
+            points = np.asarray(self.obj_geometry.points)
+            return points @ self.transform[:3, :3].T + self.transform[:3, 3]
+
+        def get_posed_mesh(self):
+            return self.obj_mesh.transform(self.transform)
+
+
+def make_depth_mesh(depth_img, cam_K, stride=2, depth_trunc=3.0, max_depth_jump=0.02):
+    # triangulate an organized depth image (meter) into a surface mesh, dropping
+    # triangles over invalid pixels and depth discontinuities
+    depth = depth_img[::stride, ::stride]
+    depth = np.where((depth > 0) & (depth < depth_trunc), depth, 0).astype(np.float32)
+    h, w = depth.shape
+    v, u = np.mgrid[0:h, 0:w] * stride
+    x = (u - cam_K[0, 2]) * depth / cam_K[0, 0]
+    y = (v - cam_K[1, 2]) * depth / cam_K[1, 1]
+    vertices = np.stack([x, y, depth], axis=-1).reshape(-1, 3).astype(np.float32)
+
+    idx = np.arange(h * w).reshape(h, w)
+    top_left, top_right = idx[:-1, :-1].reshape(-1), idx[:-1, 1:].reshape(-1)
+    bottom_left, bottom_right = idx[1:, :-1].reshape(-1), idx[1:, 1:].reshape(-1)
+    triangles = np.concatenate([np.stack([top_left, bottom_left, top_right], axis=-1),
+                                np.stack([top_right, bottom_left, bottom_right], axis=-1)])
+    triangle_depth = depth.reshape(-1)[triangles]
+    keep = np.all(triangle_depth > 0, axis=1) & \
+        (triangle_depth.max(axis=1) - triangle_depth.min(axis=1) < max_depth_jump)
+    return vertices, triangles[keep].astype(np.uint32)
+
+
+def make_raycasting_scene(vertices, triangles):
+    raycasting_scene = o3d.t.geometry.RaycastingScene()
+    raycasting_scene.add_triangles(o3d.core.Tensor(np.asarray(vertices, dtype=np.float32)),
+                                   o3d.core.Tensor(np.asarray(triangles, dtype=np.uint32)))
+    return raycasting_scene
+
+
+def icp_point_to_plane(source_points, target_points, target_normals, target_tree,
+                       threshold=0.004, max_iteration=50, tolerance=1e-6):
+    # point-to-plane ICP against a prebuilt (read-only) KD-tree of the target,
+    # so several sources can be registered to the same scene concurrently.
+    # returns the transformation to apply on top of the current source pose.
+    transformation = np.identity(4)
+    source = np.asarray(source_points, dtype=np.float64)
+    num_inliers, inlier_rmse = 0, 0.0
+    for _ in range(max_iteration):
+        dist, idx = target_tree.query(source, distance_upper_bound=threshold)
+        valid = np.isfinite(dist)
+        num_inliers = int(np.sum(valid))
+        if num_inliers < 6:
+            break
+        inlier_rmse = float(np.sqrt(np.mean(dist[valid] ** 2)))
+        p = source[valid]
+        q = target_points[idx[valid]]
+        n = target_normals[idx[valid]]
+        A = np.hstack([np.cross(p, n), n])
+        b = np.sum((q - p) * n, axis=1)
+        try:
+            x = np.linalg.solve(A.T @ A, A.T @ b)
+        except np.linalg.LinAlgError:
+            break
+        delta = np.identity(4)
+        delta[:3, :3] = Rot.from_rotvec(x[:3]).as_matrix()
+        delta[:3, 3] = x[3:]
+        source = source @ delta[:3, :3].T + delta[:3, 3]
+        transformation = np.matmul(delta, transformation)
+        if np.linalg.norm(x) < tolerance:
+            break
+    fitness = num_inliers / max(len(source), 1)
+    return transformation, fitness, inlier_rmse
+
+
+def joint_icp_point_to_plane(sources, target_points, target_normals,
+                             threshold=0.004, max_iteration=50, tolerance=1e-6):
+    # refine all posed sources together. every scene point is claimed only by the
+    # nearest posed model surface (one KD-tree over all models), so touching
+    # objects cannot pull on the same points. returns per-source transformations,
+    # fitness and inlier rmse, like icp_point_to_plane.
+    num_obj = len(sources)
+    labels = np.concatenate([np.full(len(src), k) for k, src in enumerate(sources)])
+    num_points = np.bincount(labels, minlength=num_obj)
+    source = np.vstack([np.asarray(src, dtype=np.float64) for src in sources])
+    transformations = np.tile(np.identity(4), (num_obj, 1, 1))
+    counts = np.zeros(num_obj, dtype=np.int64)
+    sq_dist_sums = np.zeros(num_obj)
+
+    # only scene points around the objects can be claimed
+    target_points = np.asarray(target_points)
+    target_normals = np.asarray(target_normals)
+    margin = 0.25 + threshold  # same limit on the allowed drift as single-object refine
+    in_bounds = np.all((target_points > source.min(axis=0) - margin) &
+                       (target_points < source.max(axis=0) + margin), axis=1)
+    target_points = target_points[in_bounds]
+    target_normals = target_normals[in_bounds]
+
+    for _ in range(max_iteration):
+        model_tree = cKDTree(source)
+        dist, idx = model_tree.query(target_points, distance_upper_bound=threshold)
+        valid = np.isfinite(dist)
+        if np.sum(valid) < 6:
+            break
+        q = target_points[valid]
+        n = target_normals[valid]
+        p = source[idx[valid]]
+        k = labels[idx[valid]]
+        A = np.hstack([np.cross(p, n), n])
+        b = np.sum((q - p) * n, axis=1)
+
+        # accumulate the normal equations of every object in one pass
+        order = np.argsort(k, kind="stable")
+        k_sorted = k[order]
+        starts = np.flatnonzero(np.r_[True, k_sorted[1:] != k_sorted[:-1]])
+        obj_ids = k_sorted[starts]
+        AtA = np.zeros((num_obj, 6, 6))
+        Atb = np.zeros((num_obj, 6))
+        AtA[obj_ids] = np.add.reduceat((A[:, :, None] * A[:, None, :])[order], starts)
+        Atb[obj_ids] = np.add.reduceat((A * b[:, None])[order], starts)
+        counts = np.bincount(k, minlength=num_obj)
+        sq_dist_sums = np.bincount(k, weights=dist[valid] ** 2, minlength=num_obj)
+
+        x = np.zeros((num_obj, 6))
+        solvable = counts >= 6
+        solvable[solvable] = np.abs(np.linalg.det(AtA[solvable])) > 1e-18
+        if np.any(solvable):
+            x[solvable] = np.linalg.solve(AtA[solvable], Atb[solvable][..., None])[..., 0]
+        deltas = np.tile(np.identity(4), (num_obj, 1, 1))
+        deltas[:, :3, :3] = Rot.from_rotvec(x[:, :3]).as_matrix()
+        deltas[:, :3, 3] = x[:, 3:]
+
+        # move all model points with their own object's update at once
+        source = np.einsum("nij,nj->ni", deltas[labels, :3, :3], source) + deltas[labels, :3, 3]
+        transformations = np.matmul(deltas, transformations)
+        if np.max(np.linalg.norm(x, axis=1)) < tolerance:
+            break
+
+    fitness = counts / np.maximum(num_points, 1)
+    inlier_rmse = np.sqrt(sq_dist_sums / np.maximum(counts, 1))
+    return transformations, fitness, inlier_rmse
+
+
+@tracer.traced()
+def refine_objects(annotation_scene, objects, joint=False):
+    # ICP of objects of an AnnotationScene against its scene cloud, jointly (occlusion-aware)
+    # or each object on its own in parallel. returns (transformation, fitness, inlier_rmse)
+    # per object; a transformation is only meant to be applied if is_refine_accepted
+    target = annotation_scene.annotation_scene
+    target_points = np.asarray(target.points)
+    target_normals = np.asarray(target.normals)
+    if joint:
+        # all objects compete for the scene points and are refined together
+        return list(zip(*joint_icp_point_to_plane(
+            [obj.get_points() for obj in objects], target_points, target_normals)))
+    # the scene cloud and its KD-tree are shared read-only by all workers
+    target_tree = annotation_scene.get_scene_tree()
+
+    def refine(obj):
+        return icp_point_to_plane(obj.get_points(), target_points, target_normals, target_tree)
+
+    with ThreadPoolExecutor(max_workers=min(len(objects), os.cpu_count() or 1)) as executor:
+        return list(executor.map(refine, objects))
+
+
+def is_refine_accepted(transformation, fitness):
+    # ICP results that moved the object too far are treated as failures
+    return fitness > 0 and np.sum(np.abs(transformation[:3, 3])) < 0.25
+
+
+class PoseProposer:
+    # proposes initial object poses by feature-based global registration
+    # (FPFH + RANSAC) of the model against the scene cloud. model descriptors are
+    # cached in memory and on disk next to models_eval, and all work runs on a worker pool.
+    def __init__(self, objects_path, voxel_size=0.005, num_workers=None):
+        self.objects_path = objects_path
+        self.cache_path = os.path.normpath(objects_path) + '_fpfh'
+        self.voxel_size = voxel_size
+        self._executor = ThreadPoolExecutor(max_workers=num_workers or os.cpu_count() or 1)
+        self._model_features = {}
+        self._lock = threading.Lock()
+
+    def _compute_features(self, pcd):
+        pcd = pcd.voxel_down_sample(self.voxel_size)
+        if not pcd.has_normals():
+            pcd.estimate_normals(o3d.geometry.KDTreeSearchParamHybrid(radius=2 * self.voxel_size, max_nn=30))
+        fpfh = o3d.pipelines.registration.compute_fpfh_feature(
+            pcd, o3d.geometry.KDTreeSearchParamHybrid(radius=5 * self.voxel_size, max_nn=100))
+        return pcd, fpfh
+
+    def get_model_features(self, model_name):
+        with self._lock:
+            if model_name in self._model_features:
+                return self._model_features[model_name]
+        cache_file = os.path.join(self.cache_path, '{}_{:.4f}.npz'.format(model_name, self.voxel_size))
+        model_path = os.path.join(self.objects_path, model_name + '.ply')
+        # the cached descriptors are only used for the model file (mtime, size) they were computed from
+        model_stat = os.stat(model_path)
+        source = np.array([model_stat.st_mtime_ns, model_stat.st_size], dtype=np.int64)
+        cached = None
+        if os.path.exists(cache_file):
+            try:
+                with np.load(cache_file) as data:
+                    if 'source' in data and np.array_equal(data['source'], source):
+                        cached = data['points'], data['normals'], data['features']
+            except Exception as e:  # truncated or corrupt cache file, computed again
+                print("[WARNING] Failed to read the cached descriptors of {}: {}".format(model_name, e))
+        if cached is not None:
+            pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(cached[0]))
+            pcd.normals = o3d.utility.Vector3dVector(cached[1])
+            fpfh = o3d.pipelines.registration.Feature()
+            fpfh.data = cached[2]
+        else:
+            pcd = o3d.io.read_point_cloud(model_path)
+            pcd.scale(0.001, np.zeros(3))  # convert mm to meter
+            pcd, fpfh = self._compute_features(pcd)
+            try:
+                os.makedirs(self.cache_path, exist_ok=True)
+                # written to a temporary file first, so readers never see a partial cache file
+                tmp_file = "{}.tmp{}".format(cache_file, os.getpid())
+                with open(tmp_file, "wb") as f:
+                    np.savez(f, points=np.asarray(pcd.points), normals=np.asarray(pcd.normals),
+                             features=np.asarray(fpfh.data), source=source)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                print("[WARNING] Failed to cache the descriptors of", model_name)
+        with self._lock:
+            self._model_features[model_name] = (pcd, fpfh)
+        return pcd, fpfh
+
+    def precompute(self, model_names):
+        # warm the descriptor cache of all models in the background
+        return [self._executor.submit(self.get_model_features, model_name) for model_name in model_names]
+
+    def compute_scene_features(self, scene_pcd):
+        # scene_pcd: PointArrays; only the downsampled cloud is converted to Open3D
+        return self._compute_features(scene_pcd.voxel_down_sample(self.voxel_size).to_legacy())
+
+    def _ransac(self, model_features, scene_features):
+        (model_pcd, model_fpfh), (scene_pcd, scene_fpfh) = model_features, scene_features
+        distance_threshold = 1.5 * self.voxel_size
+        return o3d.pipelines.registration.registration_ransac_based_on_feature_matching(
+            model_pcd, scene_pcd, model_fpfh, scene_fpfh, True, distance_threshold,
+            o3d.pipelines.registration.TransformationEstimationPointToPoint(False), 3,
+            [o3d.pipelines.registration.CorrespondenceCheckerBasedOnEdgeLength(0.9),
+             o3d.pipelines.registration.CorrespondenceCheckerBasedOnDistance(distance_threshold)],
+            o3d.pipelines.registration.RANSACConvergenceCriteria(100000, 0.999))
+
+    def propose(self, model_name, scene_features, top_k=5, num_trials=None):
+        # blocking; returns up to top_k (pose, fitness, inlier_rmse) ranked by fit.
+        # call it from a background thread, not from a worker of this pool.
+        model_features = self._executor.submit(self.get_model_features, model_name).result()
+        trials = [self._executor.submit(self._ransac, model_features, scene_features)
+                  for _ in range(num_trials or 2 * top_k)]
+        results = sorted([trial.result() for trial in trials], key=lambda r: (-r.fitness, r.inlier_rmse))
+        proposals = []
+        for result in results:
+            if result.fitness == 0:
+                continue
+            # skip poses that are (nearly) the same as a better one
+            pose = np.array(result.transformation)
+            is_duplicate = False
+            for other_pose, _, _ in proposals:
+                dist = np.linalg.norm(pose[:3, 3] - other_pose[:3, 3])
+                angle = Rot.from_matrix(other_pose[:3, :3].T @ pose[:3, :3]).magnitude()
+                if dist < 2 * self.voxel_size and angle < np.deg2rad(15):
+                    is_duplicate = True
+                    break
+            if not is_duplicate:
+                proposals.append((pose, result.fitness, result.inlier_rmse))
+            if len(proposals) == top_k:
+                break
+        return proposals
+
+
+class ValidationRenderer:
+    # renders depth (mm, 0 where empty) of posed meshes seen from the camera at the
+    # validation resolution. meshes stay in the model frame, poses are 4x4 cam_T_model.
+    def __init__(self, width, height, intrinsic):
+        self.width = width
+        self.height = height
+        self.render = rendering.OffscreenRenderer(width=width, height=height)
+        self.render.scene.set_background([0, 0, 0, 1])
+        self.render.setup_camera(intrinsic, np.eye(4), width, height)
+        self.render.scene.camera.look_at([0, 0, 1], [0, 0, 0], [0, -1, 0])
+        self.render.scene.camera.set_projection(intrinsic, 0.01, 3.0, width, height)
+        self.material = rendering.MaterialRecord()
+        self.material.base_color = [1.0, 1.0, 1.0, 1.0]
+        self.material.shader = Settings.UNLIT
+
+    def _render_depth(self):
+        depth = np.array(self.render.render_to_depth_image(z_in_view_space=True), dtype=np.float32)
+        depth[np.isposinf(depth)] = 0
+        return depth * 1000  # convert meter to mm
+
+    def render_depth(self, meshes, poses):
+        # z-buffer of all meshes together
+        for i, (mesh, pose) in enumerate(zip(meshes, poses)):
+            self.render.scene.add_geometry("mesh_{}".format(i), mesh.to_legacy(), self.material,
+                                           add_downsampled_copy_for_fast_rendering=False)
+            self.render.scene.set_geometry_transform("mesh_{}".format(i), pose)
+        depth = self._render_depth()
+        self.render.scene.clear_geometry()
+        return depth
+
+    def render_depths(self, meshes, poses):
+        # (N, H, W) depth of every mesh rendered alone; a mesh repeated with
+        # several poses is uploaded only once
+        depths = np.zeros((len(meshes), self.height, self.width), dtype=np.float32)
+        current_mesh = None
+        for i, (mesh, pose) in enumerate(zip(meshes, poses)):
+            if mesh is not current_mesh:
+                self.render.scene.clear_geometry()
+                self.render.scene.add_geometry("mesh", mesh.to_legacy(), self.material,
+                                               add_downsampled_copy_for_fast_rendering=False)
+                current_mesh = mesh
+            self.render.scene.set_geometry_transform("mesh", pose)
+            depths[i] = self._render_depth()
+        self.render.scene.clear_geometry()
+        return depths
+
+    def render_labels(self, meshes, poses, footprints=False):
+        # z-buffer (mm) and instance labels (0: background, i + 1: mesh i) of all meshes, and
+        # with footprints the flat pixel indices each mesh covers, occluded or not. the meshes
+        # are rendered one after another into one depth and one label buffer
+        depth = np.full((self.height, self.width), np.inf, dtype=np.float32)
+        labels = np.zeros((self.height, self.width), dtype=np.int32)
+        mesh_footprints = []
+        current_mesh = None
+        for i, (mesh, pose) in enumerate(zip(meshes, poses)):
+            if mesh is not current_mesh:
+                self.render.scene.clear_geometry()
+                self.render.scene.add_geometry("mesh", mesh.to_legacy(), self.material,
+                                               add_downsampled_copy_for_fast_rendering=False)
+                current_mesh = mesh
+            self.render.scene.set_geometry_transform("mesh", pose)
+            mesh_depth = self._render_depth()
+            covered = mesh_depth > 0
+            closer = covered & (mesh_depth < depth)
+            depth[closer] = mesh_depth[closer]
+            labels[closer] = i + 1
+            if footprints:
+                mesh_footprints.append(np.flatnonzero(covered))
+        self.render.scene.clear_geometry()
+        depth[np.isinf(depth)] = 0
+        return (depth, labels, mesh_footprints) if footprints else (depth, labels)
+
+
+class CPURenderer:
+    # pure NumPy z-buffer rasterizer with the interface of ValidationRenderer, for machines
+    # without an EGL/GL context. pixel centers are at integer coordinates of the intrinsic.
+    # small triangles are rasterized over their bounding boxes, large ones over image tiles,
+    # both vectorized and processed in chunks of at most max_samples pixel samples.
+    def __init__(self, width, height, intrinsic, near=0.01, far=3.0, tile_size=32, max_samples=1 << 22):
+        self.width = width
+        self.height = height
+        self.intrinsic = np.array(intrinsic, dtype=np.float64).reshape((3, 3))
+        self.near = near
+        self.far = far
+        self.tile_size = tile_size
+        self.max_samples = max_samples
+
+    def _chunks(self, num_samples):
+        # splits items with num_samples pixel samples each into chunks of bounded size
+        ends = np.cumsum(num_samples)
+        start = 0
+        while start < len(num_samples):
+            base = ends[start - 1] if start > 0 else 0
+            end = max(int(np.searchsorted(ends, base + self.max_samples, side='right')), start + 1)
+            yield start, end
+            start = end
+
+    def _shade(self, px, py, u, v, inv_z, denom, zbuffer, labels=None, label=0):
+        # barycentric inside test and perspective-correct depth of pixel samples;
+        # u, v, inv_z are the (N, 3) triangle vertex attributes of every sample.
+        # samples that are the nearest so far label their pixel. returns the covered pixels
+        l1 = ((px - u[:, 0]) * (v[:, 2] - v[:, 0]) - (u[:, 2] - u[:, 0]) * (py - v[:, 0])) / denom
+        l2 = ((u[:, 1] - u[:, 0]) * (py - v[:, 0]) - (px - u[:, 0]) * (v[:, 1] - v[:, 0])) / denom
+        l0 = 1 - l1 - l2
+        inside = (l0 >= -1e-9) & (l1 >= -1e-9) & (l2 >= -1e-9) & (px < self.width) & (py < self.height)
+        z = 1 / (l0 * inv_z[:, 0] + l1 * inv_z[:, 1] + l2 * inv_z[:, 2])
+        inside &= (z >= self.near) & (z <= self.far)
+        pixels = (py[inside] * self.width + px[inside]).astype(np.int64)
+        z = z[inside]
+        np.minimum.at(zbuffer, pixels, z)
+        if labels is not None:
+            # a later nearer sample relabels the pixel, so labels follow the z-buffer
+            labels[pixels[z == zbuffer[pixels]]] = label
+        return pixels
+
+    def _rasterize(self, mesh, pose, zbuffer, labels=None, label=0, footprint=False):
+        # returns the pixels covered by the mesh with footprint, otherwise None
+        vertices = np.asarray(mesh.vertices) @ pose[:3, :3].T + pose[:3, 3]
+        triangles = vertices[np.asarray(mesh.triangles)]
+        z = triangles[..., 2]
+        keep = np.all(z > self.near, axis=1) & np.any(z < self.far, axis=1)
+        triangles, z = triangles[keep], z[keep]
+        covered = [np.zeros(0, dtype=np.int64)]
+        u = self.intrinsic[0, 0] * triangles[..., 0] / z + self.intrinsic[0, 2]
+        v = self.intrinsic[1, 1] * triangles[..., 1] / z + self.intrinsic[1, 2]
+        x0 = np.maximum(np.ceil(u.min(axis=1)), 0).astype(np.int64)
+        x1 = np.minimum(np.floor(u.max(axis=1)), self.width - 1).astype(np.int64)
+        y0 = np.maximum(np.ceil(v.min(axis=1)), 0).astype(np.int64)
+        y1 = np.minimum(np.floor(v.max(axis=1)), self.height - 1).astype(np.int64)
+        denom = (u[:, 1] - u[:, 0]) * (v[:, 2] - v[:, 0]) - (u[:, 2] - u[:, 0]) * (v[:, 1] - v[:, 0])
+        keep = (x1 >= x0) & (y1 >= y0) & (np.abs(denom) > 1e-12)
+        u, v, inv_z, denom = u[keep], v[keep], 1 / z[keep], denom[keep]
+        x0, x1, y0, y1 = x0[keep], x1[keep], y0[keep], y1[keep]
+        bbox_w = x1 - x0 + 1
+        num_px = bbox_w * (y1 - y0 + 1)
+
+        # small triangles: every pixel of their bounding box
+        small = np.flatnonzero(num_px <= self.tile_size * self.tile_size)
+        for start, end in self._chunks(num_px[small]):
+            tri = np.repeat(small[start:end], num_px[small[start:end]])
+            offsets = np.cumsum(num_px[small[start:end]]) - num_px[small[start:end]]
+            local = np.arange(len(tri)) - np.repeat(offsets, num_px[small[start:end]])
+            px = x0[tri] + local % bbox_w[tri]
+            py = y0[tri] + local // bbox_w[tri]
+            pixels = self._shade(px, py, u[tri], v[tri], inv_z[tri], denom[tri], zbuffer, labels, label)
+            if footprint:
+                covered.append(pixels)
+
+        # large triangles: every pixel of each image tile they overlap
+        large = np.flatnonzero(num_px > self.tile_size * self.tile_size)
+        if len(large) == 0:
+            return np.unique(np.concatenate(covered)) if footprint else None
+        tx0, tx1 = x0[large] // self.tile_size, x1[large] // self.tile_size
+        ty0, ty1 = y0[large] // self.tile_size, y1[large] // self.tile_size
+        tiles_w = tx1 - tx0 + 1
+        num_tiles = tiles_w * (ty1 - ty0 + 1)
+        pair_tri = np.repeat(np.arange(len(large)), num_tiles)
+        local = np.arange(len(pair_tri)) - np.repeat(np.cumsum(num_tiles) - num_tiles, num_tiles)
+        tile_x = (tx0[pair_tri] + local % tiles_w[pair_tri]) * self.tile_size
+        tile_y = (ty0[pair_tri] + local // tiles_w[pair_tri]) * self.tile_size
+        tile_px = np.tile(np.arange(self.tile_size), self.tile_size)
+        tile_py = np.repeat(np.arange(self.tile_size), self.tile_size)
+        tile_area = self.tile_size * self.tile_size
+        for start, end in self._chunks(np.full(len(pair_tri), tile_area)):
+            tri = np.repeat(large[pair_tri[start:end]], tile_area)
+            px = (tile_x[start:end, None] + tile_px[None]).reshape(-1)
+            py = (tile_y[start:end, None] + tile_py[None]).reshape(-1)
+            pixels = self._shade(px, py, u[tri], v[tri], inv_z[tri], denom[tri], zbuffer, labels, label)
+            if footprint:
+                covered.append(pixels)
+        return np.unique(np.concatenate(covered)) if footprint else None
+
+    def _render_depth(self, meshes, poses):
+        zbuffer = np.full(self.height * self.width, np.inf)
+        for mesh, pose in zip(meshes, poses):
+            self._rasterize(mesh, np.asarray(pose, dtype=np.float64), zbuffer)
+        zbuffer[np.isinf(zbuffer)] = 0
+        return (zbuffer * 1000).astype(np.float32).reshape(self.height, self.width)  # convert meter to mm
+
+    def render_depth(self, meshes, poses):
+        # z-buffer of all meshes together
+        return self._render_depth(meshes, poses)
+
+    def render_depths(self, meshes, poses):
+        # (N, H, W) depth of every mesh rendered alone
+        depths = np.zeros((len(meshes), self.height, self.width), dtype=np.float32)
+        for i, (mesh, pose) in enumerate(zip(meshes, poses)):
+            depths[i] = self._render_depth([mesh], [pose])
+        return depths
+
+    def render_labels(self, meshes, poses, footprints=False):
+        # z-buffer (mm) and instance labels (0: background, i + 1: mesh i) of all meshes in
+        # one pass: a pixel takes the label of the mesh whose triangle won its depth test.
+        # with footprints also the flat pixel indices each mesh covers, occluded or not
+        zbuffer = np.full(self.height * self.width, np.inf)
+        labels = np.zeros(self.height * self.width, dtype=np.int32)
+        mesh_footprints = [self._rasterize(mesh, np.asarray(pose, dtype=np.float64), zbuffer, labels, i + 1,
+                                           footprints)
+                           for i, (mesh, pose) in enumerate(zip(meshes, poses))]
+        zbuffer[np.isinf(zbuffer)] = 0
+        depth = (zbuffer * 1000).astype(np.float32).reshape(self.height, self.width)  # convert meter to mm
+        labels = labels.reshape(self.height, self.width)
+        return (depth, labels, mesh_footprints) if footprints else (depth, labels)
+
+
+def make_validation_renderer(width, height, intrinsic, backend=None):
+    # backend: "gl" (offscreen OpenGL/EGL, default) or "cpu" (NumPy rasterizer);
+    # defaults to the POSE_ANNO_RENDERER environment variable
+    backend = backend or os.environ.get("POSE_ANNO_RENDERER", "gl")
+    if backend == "cpu":
+        return CPURenderer(width, height, intrinsic)
+    if backend == "gl":
+        return ValidationRenderer(width, height, intrinsic)
+    raise ValueError("Unknown renderer backend: {}".format(backend))
+
+
+def score_depth_hypotheses(depth_captured, depth_others, depth_hypotheses):
+    # scores K renders of one object (depth_hypotheses, (K, H, W), object alone) composited
+    # with the render of all other objects against the captured depth, with the same
+    # criteria as the annotation quality check. depths in mm, 0 where empty.
+    # returns the mean depth difference, the ratio of visible pixels within
+    # DEPTH_DELTA_1 / DEPTH_DELTA_2 and the number of visible pixels, one entry per hypothesis.
+    others = np.where(depth_others > 0, depth_others, np.inf)[None]
+    hypotheses = np.where(depth_hypotheses > 0, depth_hypotheses, np.inf)
+    composite = np.minimum(hypotheses, others)
+    composite[np.isinf(composite)] = 0
+    visible = np.isfinite(hypotheses) & (hypotheses < others)
+    valid = visible & (depth_captured > 200)[None]
+
+    depth_diff = depth_captured[None] - composite
+    has_inlier = np.any(np.abs(depth_diff) < 100, axis=(1, 2))
+    depth_diff[~has_inlier] = 1000
+    depth_diff_abs = np.abs(depth_diff)
+
+    num_valid = np.sum(valid, axis=(1, 2))
+    denom = np.maximum(num_valid, 1)
+    depth_diff_mean = np.abs(np.sum(depth_diff * valid, axis=(1, 2)) / denom)
+    depth_diff_mean[num_valid == 0] = np.inf
+    ratio_delta_1 = np.sum(valid & (depth_diff_abs < DEPTH_DELTA_1), axis=(1, 2)) / denom
+    ratio_delta_2 = np.sum(valid & (depth_diff_abs < DEPTH_DELTA_2), axis=(1, 2)) / denom
+    return depth_diff_mean, ratio_delta_1, ratio_delta_2, num_valid
+
+
+def compose_depths(depths, height, width):
+    # z-buffer and instance labels (0: background, i + 1: object i) from the
+    # depths (mm, 0 where empty) of every object rendered alone
+    if len(depths) == 0:
+        return np.zeros((height, width), dtype=np.float32), np.zeros((height, width), dtype=np.int32)
+    stacked = np.where(depths > 0, depths, np.inf)
+    labels = np.argmin(stacked, axis=0).astype(np.int32) + 1
+    depth = np.min(stacked, axis=0)
+    labels[np.isinf(depth)] = 0
+    depth[np.isinf(depth)] = 0
+    return depth, labels
+
+
+def compute_depth_diff(depth_captured, depth_rendered, obj_mask):
+    # per-object metric of the annotation quality check (depths in mm). returns the
+    # absolute mean depth difference over the valid object pixels (np.inf if there is
+    # none), the absolute depth difference image and the valid object mask
+    valid_mask = obj_mask & (depth_captured > 200)
+    depth_diff = depth_captured - depth_rendered
+    inlier_mask = np.abs(depth_diff) < 100
+    depth_diff = depth_diff * valid_mask
+    if np.sum(inlier_mask) == 0:
+        depth_diff = np.ones_like(depth_diff) * 1000
+    num_valid = np.sum(valid_mask)
+    depth_diff_mean = abs(np.sum(depth_diff[valid_mask]) / num_valid) if num_valid > 0 else np.inf
+    return depth_diff_mean, np.abs(depth_diff), valid_mask
+
+
+def is_depth_diff_ok(depth_diff_mean, camera_idx, ok_delta=DEPTH_OK_DELTA):
+    # completeness rule of the quality check (annotator, engine and quality report):
+    # the mean depth difference (mm) is at most ok_delta scaled for the camera
+    return depth_diff_mean <= ok_delta * camera_idx_to_thresh_factor[camera_idx % 4]
+
+
+@tracer.traced()
+def evaluate_anno_quality(renderer, meshes, poses, depth_captured):
+    # headless annotation quality check of one image. returns one dict per object with
+    # the mean depth difference (mm), the ratios of valid pixels within DEPTH_DELTA_1 /
+    # DEPTH_DELTA_2 and the number of valid pixels
+    depth_rendered, labels = renderer.render_labels(meshes, poses)
+    results = []
+    for i in range(len(meshes)):
+        depth_diff_mean, depth_diff_abs, valid_mask = compute_depth_diff(depth_captured, depth_rendered, labels == i + 1)
+        num_valid = int(np.sum(valid_mask))
+        results.append({
+            "depth_diff_mean": float(depth_diff_mean),
+            "ratio_delta_1": float(np.sum(valid_mask & (depth_diff_abs < DEPTH_DELTA_1)) / max(num_valid, 1)),
+            "ratio_delta_2": float(np.sum(valid_mask & (depth_diff_abs < DEPTH_DELTA_2)) / max(num_valid, 1)),
+            "num_valid_px": num_valid,
+        })
+    return results
+
+
+def rank_pose_hypotheses(renderer, obj_mesh, poses, other_meshes, other_poses, depth_captured):
+    # renders and scores all candidate poses of obj_mesh in one pass; returns the
+    # hypothesis indices best first (most pixels within DEPTH_DELTA_1, then the
+    # smallest mean depth difference) with the scores of score_depth_hypotheses
+    depth_others = renderer.render_depth(other_meshes, other_poses)
+    depth_hypotheses = renderer.render_depths([obj_mesh] * len(poses), poses)
+    scores = score_depth_hypotheses(depth_captured, depth_others, depth_hypotheses)
+    depth_diff_mean, ratio_delta_1 = scores[0], scores[1]
+    order = np.lexsort((depth_diff_mean, -ratio_delta_1))
+    return order, scores
+
+
+class SceneGraph:
+    # retained state of the named geometries of an Open3DScene: source data, material, pose
+    # and visibility. requested state is diffed against it, so only actual changes are sent
+    # to the renderer and geometries are uploaded again only when their source data changes.
+    def __init__(self, scene):
+        self.scene = scene
+        self._nodes = {}
+
+    @staticmethod
+    def _material_key(material):
+        return material.shader, tuple(float(c) for c in material.base_color), float(material.point_size)
+
+    def has(self, name):
+        return name in self._nodes
+
+    def add(self, name, geometry, material, transform=None, source=None, downsampled=True):
+        # source: object that owns the data of geometry (default: geometry itself)
+        source = geometry if source is None else source
+        node = self._nodes.get(name)
+        if node is None or node["source"] is not source:
+            if node is not None:
+                self.scene.remove_geometry(name)
+            self.scene.add_geometry(name, geometry, material, add_downsampled_copy_for_fast_rendering=downsampled)
+            self._nodes[name] = {"source": source, "material": self._material_key(material),
+                                 "transform": None, "visible": True}
+        else:
+            self.set_material(name, material)
+        if transform is not None:
+            self.set_transform(name, transform)
+
+    def remove(self, name):
+        if self._nodes.pop(name, None) is not None:
+            self.scene.remove_geometry(name)
+
+    def clear(self):
+        self.scene.clear_geometry()
+        self._nodes = {}
+
+    def set_material(self, name, material):
+        key = self._material_key(material)
+        if self._nodes[name]["material"] != key:
+            self.scene.modify_geometry_material(name, material)
+            self._nodes[name]["material"] = key
+
+    def set_transform(self, name, transform):
+        node = self._nodes[name]
+        if node["transform"] is None or not np.array_equal(node["transform"], transform):
+            self.scene.set_geometry_transform(name, transform)
+            node["transform"] = np.array(transform)
+
+    def set_visible(self, name, visible):
+        if self._nodes[name]["visible"] != visible:
+            self.scene.show_geometry(name, visible)
+            self._nodes[name]["visible"] = visible
+
+
+class OverlayManager:
+    # pooled 3D labels and coordinate frames. an overlay group keeps the labels/frames it has
+    # shown: they are moved and retitled in place, and hidden (empty text, invisible frame)
+    # instead of destroyed when fewer are needed, so nothing is re-created per keystroke and
+    # the pool never grows beyond the largest number shown at once
+    def __init__(self, scene_widget, scene_graph, frame_material):
+        self.widget = scene_widget
+        self.scene_graph = scene_graph
+        self.frame_material = frame_material
+        self._labels = {}  # group -> [[Label3D, position, text]]
+        self._frame_meshes = {}  # size -> coordinate frame mesh shared by all frames of that size
+
+    def set_labels(self, group, items):
+        # items: [(position, text)]
+        pool = self._labels.setdefault(group, [])
+        for i, (position, text) in enumerate(items):
+            position = np.asarray(position, dtype=np.float32)
+            if i == len(pool):
+                pool.append([self.widget.add_3d_label(position, text), position, text])
+                continue
+            entry = pool[i]
+            if not np.array_equal(entry[1], position):
+                entry[0].position = position
+                entry[1] = position
+            if entry[2] != text:
+                entry[0].text = text
+                entry[2] = text
+        for entry in pool[len(items):]:
+            if entry[2]:
+                entry[0].text = ""
+                entry[2] = ""
+
+    def set_frames(self, group, transforms, size):
+        # frames are nodes "<group>_<i>" of the scene graph sharing one mesh
+        if size not in self._frame_meshes:
+            self._frame_meshes[size] = o3d.geometry.TriangleMesh.create_coordinate_frame(size=size)
+        for i, transform in enumerate(transforms):
+            name = "{}_{}".format(group, i)
+            if not self.scene_graph.has(name):
+                self.scene_graph.add(name, self._frame_meshes[size], self.frame_material)
+            self.scene_graph.set_transform(name, transform)
+            self.scene_graph.set_visible(name, True)
+        i = len(transforms)
+        while self.scene_graph.has("{}_{}".format(group, i)):
+            self.scene_graph.set_visible("{}_{}".format(group, i), False)
+            i += 1
+
+
+class PoseHistory:
+    # undo/redo history of object poses in preallocated ring buffers. every row is one change
+    # (object index, pose before, pose after); rows recorded together (e.g. refining all
+    # objects) share a group and are undone together. the oldest groups are dropped when full.
+    # undo_object undoes the changes of one object only, as changes of their own.
+    def __init__(self, capacity=POSE_HISTORY_SIZE):
+        self.capacity = capacity
+        self._obj_idxs = np.zeros(capacity, dtype=np.int32)
+        self._groups = np.zeros(capacity, dtype=np.int64)
+        self._before = np.zeros((capacity, 4, 4))
+        self._after = np.zeros((capacity, 4, 4))
+        self._reverted = np.zeros(capacity, dtype=np.int64)  # row undone by undo_object, -1: none
+        self.clear()
+
+    def clear(self):
+        # rows are addressed by ever increasing counters; row i is stored at i % capacity.
+        # [start, cursor) can be undone, [cursor, end) redone
+        self._start = self._cursor = self._end = 0
+        self._next_group = 0
+        self._last_key = None
+        self._last_time = 0.0
+
+    def can_undo(self):
+        return self._cursor > self._start
+
+    def can_redo(self):
+        return self._cursor < self._end
+
+    def record(self, changes, key=None):
+        # changes: [(obj_idx, pose_before, pose_after)]. consecutive records with the same
+        # key (e.g. ("move", obj_idx)) in quick succession are merged into the last row.
+        # a group is undone as a whole, so one larger than the history is rejected
+        if len(changes) > self.capacity:
+            raise ValueError("{} pose changes do not fit the undo history of {}".format(len(changes), self.capacity))
+        if not changes:
+            return
+        now = time.monotonic()
+        if (key is not None and key == self._last_key and len(changes) == 1 and self.can_undo()
+                and self._cursor == self._end and now - self._last_time < POSE_HISTORY_COALESCE_TIME):
+            self._after[(self._cursor - 1) % self.capacity] = changes[0][2]
+            self._last_time = now
+            return
+        self._end = self._cursor  # a new change discards the redo rows
+        for obj_idx, pose_before, pose_after in changes:
+            if self._end - self._start == self.capacity:
+                self._drop_oldest_group()
+            row = self._end % self.capacity
+            self._obj_idxs[row] = obj_idx
+            self._groups[row] = self._next_group
+            self._before[row] = pose_before
+            self._after[row] = pose_after
+            self._reverted[row] = -1
+            self._end += 1
+        self._cursor = self._end
+        self._next_group += 1
+        self._last_key = key
+        self._last_time = now
+
+    def _drop_oldest_group(self):
+        group = self._groups[self._start % self.capacity]
+        while self._start < self._end and self._groups[self._start % self.capacity] == group:
+            self._start += 1
+
+    def undo(self):
+        # [(obj_idx, pose)] to restore, empty if there is nothing to undo
+        restore = []
+        if self.can_undo():
+            group = self._groups[(self._cursor - 1) % self.capacity]
+            while self._cursor > self._start and self._groups[(self._cursor - 1) % self.capacity] == group:
+                self._cursor -= 1
+                row = self._cursor % self.capacity
+                restore.append((int(self._obj_idxs[row]), self._before[row].copy()))
+        self._last_key = None
+        return restore
+
+    def undo_object(self, obj_idx, pose):
+        # undoes the last change of one object (current pose: pose) that is not undone yet.
+        # the undo is recorded as a change, so undo() brings the pose back. [(obj_idx, pose)]
+        # to restore, empty if the object has nothing to undo
+        reverted = set()
+        for i in range(self._cursor - 1, self._start - 1, -1):
+            row = i % self.capacity
+            if self._obj_idxs[row] != obj_idx:
+                continue
+            if self._reverted[row] >= 0:
+                reverted.add(int(self._reverted[row]))
+            elif i not in reverted:
+                before = self._before[row].copy()
+                self.record([(obj_idx, pose, before)])
+                self._reverted[(self._end - 1) % self.capacity] = i
+                self._last_key = None
+                return [(obj_idx, before)]
+        return []
+
+    def redo(self):
+        restore = []
+        if self.can_redo():
+            group = self._groups[self._cursor % self.capacity]
+            while self._cursor < self._end and self._groups[self._cursor % self.capacity] == group:
+                row = self._cursor % self.capacity
+                restore.append((int(self._obj_idxs[row]), self._after[row].copy()))
+                self._cursor += 1
+        self._last_key = None
+        return restore
+
 
 class Settings:
     UNLIT = "defaultUnlit"
@@ -80,7 +1654,14 @@ class Settings:
         self.show_coord_frame = False
         self.show_mesh_names = False
         self.highlight_obj = True
+        self.joint_refine = False
+        self.propose_pose = False
         self.transparency = 0.5
+        self.use_lod = True
+        self.lod_point_budget = 200000  # points of the coarse scene cloud
+        self.lod_obj_point_budget = 4000  # points of each coarse object cloud
+        self.autosave = False
+        self.autosave_delay = 3  # seconds without edits before the annotation is saved
 
         self.apply_material = True  # clear to False after processing
 
@@ -122,75 +1703,44 @@ class AppWindow:
         self._scene.scene.show_axes(self.settings.show_axes)
 
         if self.settings.apply_material:
-            if self._scene.scene.has_geometry("annotation_scene"):
-                self._scene.scene.modify_geometry_material("annotation_scene", self.settings.scene_material)
+            if self._scene_graph.has("annotation_scene"):
+                self._scene_graph.set_material("annotation_scene", self.settings.scene_material)
                 self.settings.apply_material = False
+            if self._scene_graph.has("annotation_scene" + LOD_SUFFIX):
+                self._scene_graph.set_material("annotation_scene" + LOD_SUFFIX, self.settings.scene_material)
         self._show_axes.checked = self.settings.show_axes
         self._highlight_obj.checked = self.settings.highlight_obj
         self._show_coord_frame.checked = self.settings.show_coord_frame
         self._show_mesh_names.checked = self.settings.show_mesh_names
         self._point_size.double_value = self.settings.scene_material.point_size
 
-        if self.settings.show_coord_frame:
-            self._add_coord_frame("obj_coord_frame", size=0.1)
-            self._add_coord_frame("world_coord_frame")
-        else:
-            self._scene.scene.remove_geometry("obj_coord_frame")
-            self._scene.scene.remove_geometry("world_coord_frame")
-            for label in self.coord_labels:
-                self._scene.remove_3d_label(label)
-            self.coord_labels = []
+        self._update_overlays()
 
+    def _update_overlays(self):
+        # object names and the coordinate frames of the active object, moved in place
+        objects = [] if self._annotation_scene is None else self._annotation_scene.get_objects()
         if self.settings.show_mesh_names:
-            try:
-                self._update_and_show_mesh_name()
-            except:
-                self._on_error("Scene not loaded yet. (error at _apply_settings)")
-                pass
+            self._overlays.set_labels("names", [(obj.transform[:3, 3], obj.obj_name) for obj in objects])
         else:
-            for inst_label in self.mesh_names:
-                self._scene.remove_3d_label(inst_label)
-
-    def _update_and_show_mesh_name(self):
-        meshes = self._annotation_scene.get_objects()  # get new list after deletion
-        for inst_label in self.mesh_names:
-            self._scene.remove_3d_label(inst_label)
-        for mesh in meshes:
-            self.mesh_names.append(self._scene.add_3d_label(mesh.transform[:3, 3], mesh.obj_name))
-
-    def _add_coord_frame(self, name="coord_frame", size=0.2, origin=[0, 0, 0]):
-        if self._annotation_scene is None: # shsh
-            self._on_error("Scene not loaded yet. (error at _add_coord_frame)")
-            return
-        objects = self._annotation_scene.get_objects()
-        try:
-            active_obj = objects[self._meshes_used.selected_index]
-        except IndexError:
-            self._on_error("Select an object first. (error at _add_coord_frame)")
-            return
-        self._scene.scene.remove_geometry(name)
-        coord_frame = o3d.geometry.TriangleMesh.create_coordinate_frame(size=size, origin=origin)
-        if "world" in name:
-            pass 
-            transform = np.eye(4)
-            transform[:3, 3] = active_obj.transform[:3, 3]
-            coord_frame.transform(transform)
-            for label in self.coord_labels:
-                self._scene.remove_3d_label(label)
-            self.coord_labels = []
-            size = size * 0.6
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([size, 0, 0]), "D (+)"))
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([-size, 0, 0]), "A (-)"))
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([0, size, 0]), "S (+)"))
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([0, -size, 0]), "W (-)"))
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([0, 0, size]), "Q (+)"))
-            self.coord_labels.append(self._scene.add_3d_label(active_obj.transform[:3, 3] + np.array([0, 0, -size]), "E (-)"))
-
+            self._overlays.set_labels("names", [])
+
+        selected_index = self._meshes_used.selected_index
+        if self.settings.show_coord_frame and 0 <= selected_index < len(objects):
+            active_obj = objects[selected_index]
+            center = active_obj.transform[:3, 3]
+            world_transform = np.eye(4)
+            world_transform[:3, 3] = center
+            self._overlays.set_frames("obj_coord_frame", [active_obj.transform], size=0.1)
+            self._overlays.set_frames("world_coord_frame", [world_transform], size=0.2)
+            size = 0.2 * 0.6
+            self._overlays.set_labels("axes", [
+                (center + np.array([size, 0, 0]), "D (+)"), (center + np.array([-size, 0, 0]), "A (-)"),
+                (center + np.array([0, size, 0]), "S (+)"), (center + np.array([0, -size, 0]), "W (-)"),
+                (center + np.array([0, 0, size]), "Q (+)"), (center + np.array([0, 0, -size]), "E (-)")])
         else:
-            coord_frame.transform(active_obj.transform)
-        self._scene.scene.add_geometry(name, coord_frame, 
-                                        self.settings.coord_material,
-                                        add_downsampled_copy_for_fast_rendering=True) 
+            self._overlays.set_frames("obj_coord_frame", [], size=0.1)
+            self._overlays.set_frames("world_coord_frame", [], size=0.2)
+            self._overlays.set_labels("axes", [])
 
     def _on_layout(self, layout_context):
         r = self.window.content_rect
@@ -225,6 +1775,13 @@ class AppWindow:
         width_obj = 1.5 * width_set
         height_obj = 1.5 * layout_context.theme.font_size
         self._log_panel.frame = gui.Rect(0, r.get_bottom() - height_obj, width_obj, height_obj) 
+        if tracer.enabled:
+            height_timing = min(
+                r.height / 3,
+                self._timing_panel.calc_preferred_size(
+                    layout_context, gui.Widget.Constraints()).height)
+            self._timing_panel.frame = gui.Rect(0, r.get_bottom() - height_obj - height_timing, width_val,
+                                                height_timing)
 
     def __init__(self, width, height):
 
@@ -235,10 +1792,30 @@ class AppWindow:
         self.upscale_responsiveness = False
         self.scene_obj_info = None
         self.bounds = None
-        self.coord_labels = []
-        self.mesh_names = []
         self.settings = Settings()
-        self.ok_delta = 25
+        self.pose_proposer = None
+        self._pose_proposals = {}  # SceneObject -> [ranked proposals, index shown]
+        self.ok_delta = DEPTH_OK_DELTA
+        self._scene_gt = {}
+        self._quality_index = None
+        self._objects_loading = False
+        self._gt_writer = SceneGtWriter()
+        # edits are counted so an autosave only clears the changed flag if nothing changed since
+        self._edit_count = 0
+        self._last_edit_time = 0.0
+        self._autosave_count = 0  # edit count of the last autosave
+        self._autosave_failed = False  # the last autosave of the image failed, its edits are not on disk
+        self._model_loader = ThreadPoolExecutor(max_workers=8)  # bounded pool for model file reads
+        self._scene_lod = None
+        self._model_lods = {}  # id(obj_geometry) -> (obj_geometry, LevelOfDetail), shared by instances
+        self._lod_coarse = False
+        self._last_navigation = 0.0
+        self._pose_history = PoseHistory()
+        # objects moved by keys since the last frame and the log text to show with them
+        self._pending_poses = set()
+        self._pending_log = None
+        self._dataset_num_complete = {}
+        self._dataset_num_images = {}  # scene_num -> number of images, from the dataset manifest
         self.scale_factor = None
 
 
@@ -246,11 +1823,11 @@ class AppWindow:
             "6D Object Pose Annotator", width, height)
         w = self.window  
 
-        self.spl = "\\" if sys.platform.startswith("win") else "/"
-
         # 3D widget
         self._scene = gui.SceneWidget()
         self._scene.scene = rendering.Open3DScene(w.renderer)
+        self._scene_graph = SceneGraph(self._scene.scene)
+        self._overlays = OverlayManager(self._scene, self._scene_graph, self.settings.coord_material)
         em = w.theme.font_size
 
         # ---- Validation panel ----
@@ -261,6 +1838,9 @@ class AppWindow:
         self.scene_obj_info_panel.set_is_open(True)
         self.scene_obj_info_table = gui.ListView()
         self.scene_obj_info_panel.add_child(self.scene_obj_info_table)
+        self.scene_obj_info_panel.add_child(gui.Label("ICP Refinement:"))
+        self.refine_info_table = gui.ListView()
+        self.scene_obj_info_panel.add_child(self.refine_info_table)
         self._validation_panel.add_child(self.scene_obj_info_panel)
 
         self.anno_copy_panel = gui.Vert(
@@ -349,15 +1929,28 @@ class AppWindow:
         grid.add_child(self._point_size)
         grid.add_child(gui.Label("Responsiveness"))
         grid.add_child(self._responsiveness)
+        self._lod_point_budget = gui.Slider(gui.Slider.INT)
+        self._lod_point_budget.set_limits(20, 1000)
+        self._lod_point_budget.int_value = self.settings.lod_point_budget // 1000
+        self._lod_point_budget.set_on_value_changed(self._on_lod_point_budget)
+        grid.add_child(gui.Label("LOD Points (k)"))
+        grid.add_child(self._lod_point_budget)
         view_ctrls.add_child(grid)
 
+        self._use_lod = gui.Checkbox("Coarse Points while Moving")
+        self._use_lod.checked = self.settings.use_lod
+        self._use_lod.set_on_checked(self._on_use_lod)
+        view_ctrls.add_child(self._use_lod)
+
         self._settings_panel.add_child(view_ctrls)
         # ----
         self._images_panel = gui.CollapsableVert("Images", 0.33 * em,
                                                  gui.Margins(em, 0, 0, 0))
-        self._vis_img_proxy = gui.WidgetProxy()
-        self._vis_img_proxy.set_widget(gui.ImageWidget())
-        self._images_panel.add_child(self._vis_img_proxy)
+        # one image widget whose image is replaced in place
+        self._vis_img_widget = gui.ImageWidget()
+        self._vis_layers = []
+        self._vis_buffer = None
+        self._images_panel.add_child(self._vis_img_widget)
         self._images_panel.set_is_open(False)
 
 
@@ -366,12 +1959,23 @@ class AppWindow:
         self._log_panel.add_child(self._log)
         self.window.set_needs_layout()
 
+        # breakdown of the last traced operation, only with POSE_ANNO_TRACE
+        self._timing_panel = gui.CollapsableVert("Timing", 0.25 * em, gui.Margins(em, 0, 0, 0))
+        self._timing_table = gui.ListView()
+        self._timing_panel.add_child(self._timing_table)
+        save_trace_button = gui.Button("Save Trace")
+        save_trace_button.set_on_clicked(self._on_save_trace)
+        self._timing_panel.add_child(save_trace_button)
+        tracer.on_last = self._update_timing_table
+
         # 3D Annotation tool options
         w.add_child(self._scene)
         w.add_child(self._settings_panel)
         w.add_child(self._images_panel)
         w.add_child(self._log_panel)
         w.add_child(self._validation_panel)
+        if tracer.enabled:
+            w.add_child(self._timing_panel)
         w.set_on_layout(self._on_layout)
 
         annotation_objects = gui.CollapsableVert("Annotation Objects", 0.25 * em,
@@ -411,6 +2015,10 @@ class AppWindow:
 
         annotation_objects.add_child(self._meshes_used)
 
+        self._propose_pose = gui.Checkbox("Propose Initial Pose (N: next proposal)")
+        self._propose_pose.set_on_checked(self._on_propose_pose)
+        annotation_objects.add_child(self._propose_pose)
+
         # x, y, z axis
         x_grid = gui.VGrid(3, 0.25 * em)
         self._x_rot = gui.Slider(gui.Slider.DOUBLE)
@@ -489,6 +2097,20 @@ class AppWindow:
         h.add_child(self._next_sample_button)
         h.add_stretch()
         self._scene_control.add_child(h)
+        pre_incomplete_button = gui.Button("Previous")
+        pre_incomplete_button.horizontal_padding_em = 0.8
+        pre_incomplete_button.vertical_padding_em = 0
+        pre_incomplete_button.set_on_clicked(self._on_previous_incomplete_image)
+        next_incomplete_button = gui.Button("Next")
+        next_incomplete_button.horizontal_padding_em = 0.8
+        next_incomplete_button.vertical_padding_em = 0
+        next_incomplete_button.set_on_clicked(self._on_next_incomplete_image)
+        h = gui.Horiz(0.4 * em)  # row 3
+        h.add_child(gui.Label("Incomplete:"))
+        h.add_child(pre_incomplete_button)
+        h.add_child(next_incomplete_button)
+        h.add_stretch()
+        self._scene_control.add_child(h)
 
         self._view_numbers = gui.Horiz(0.4 * em)
         self._image_number = gui.Label("Image: " + f'{0:06}')
@@ -507,6 +2129,8 @@ class AppWindow:
         self._progress_str = gui.Label("Progress: 0.0% [0/0]")
         progress_ctrls.add_child(self._progress_str)
         progress_ctrls.add_child(self._progress)
+        self._quality_progress_str = gui.Label("Complete: scene 0/0, dataset 0/0")
+        progress_ctrls.add_child(self._quality_progress_str)
         self._scene_control.add_child(progress_ctrls)
 
 
@@ -521,6 +2145,26 @@ class AppWindow:
         refine_position.vertical_padding_em = 0.2
         refine_position.set_on_clicked(self._on_refine)
         self._scene_control.add_child(refine_position)
+        refine_all_position = gui.Button("Refine All Poses using ICP (Shift+R)")
+        refine_all_position.horizontal_padding_em = 0.8
+        refine_all_position.vertical_padding_em = 0.2
+        refine_all_position.set_on_clicked(self._on_refine_all)
+        self._scene_control.add_child(refine_all_position)
+        self._joint_refine = gui.Checkbox("Joint Refinement (Occlusion-aware)")
+        self._joint_refine.set_on_checked(self._on_joint_refine)
+        self._scene_control.add_child(self._joint_refine)
+        self._autosave = gui.Checkbox("Autosave")
+        self._autosave.checked = self.settings.autosave
+        self._autosave.set_on_checked(self._on_autosave)
+        self._autosave_delay = gui.Slider(gui.Slider.INT)
+        self._autosave_delay.set_limits(1, 30)
+        self._autosave_delay.int_value = self.settings.autosave_delay
+        self._autosave_delay.set_on_value_changed(self._on_autosave_delay)
+        h = gui.Horiz(0.4 * em)
+        h.add_child(self._autosave)
+        h.add_child(gui.Label("Delay (s)"))
+        h.add_child(self._autosave_delay)
+        self._scene_control.add_child(h)
         generate_save_annotation = gui.Button("Save Annotation")
         generate_save_annotation.horizontal_padding_em = 0.8
         generate_save_annotation.vertical_padding_em = 0.2
@@ -550,6 +2194,7 @@ class AppWindow:
 
         # set callbacks for key control
         self._scene.set_on_key(self._transform)
+        self.window.set_on_tick_event(self._on_tick)
         self._left_shift_modifier = False
         self._scene.set_on_mouse(self._on_mouse)
         self._log.text = "\t Start by opening a file."
@@ -583,47 +2228,22 @@ class AppWindow:
         self._log.text = "Copying the labeling result of image " + source_image_num + " to " + target_image_num + "..."
         self.window.set_needs_layout()
 
-        json_6d_path = os.path.join(self.scenes.scenes_path, f"{self._annotation_scene.scene_num:06}", 'scene_gt.json')
-        if not os.path.exists(json_6d_path):
-            self._on_error('The json file does not exist. (error at _on_copy_button)')
+        scene_path = self.scenes.get_scene_path(self._annotation_scene.scene_num)
+        try:
+            gt_6d_pose_data = read_scene_gt(scene_path)
+        except json.decoder.JSONDecodeError as e:
+            self._on_error("Error loading the json file. (error at _on_copy_button)")
             return
-        with open(json_6d_path, "r") as gt_scene:
-            try:
-                gt_6d_pose_data = json.load(gt_scene)
-            except json.decoder.JSONDecodeError as e:
-                self._on_error("Error loading the json file. (error at _on_copy_button)")
-                return
         
-        se3_base_to_source = np.eye(4)
-        scene_camera_info = copy.deepcopy(self.scene_camera_info)
-        se3_base_to_source[:3, :3] = np.array(scene_camera_info[str(int(self.source_image_num))]["cam_R_w2c"]).reshape(3, 3)
-        se3_base_to_source[:3, 3] = np.array(scene_camera_info[str(int(self.source_image_num))]["cam_t_w2c"])
-
-
-        se3_base_to_target = np.eye(4)
-        se3_base_to_target[:3, :3] = np.array(scene_camera_info[str(int(self.target_image_num))]["cam_R_w2c"]).reshape(3, 3)
-        se3_base_to_target[:3, 3] = np.array(scene_camera_info[str(int(self.target_image_num))]["cam_t_w2c"])
-
-        se3_target_to_source = np.matmul(np.linalg.inv(se3_base_to_target), se3_base_to_source)
-
         if str(int(source_image_num)) not in gt_6d_pose_data:
             self._on_error('The source image number does not exist in the json file. (error at _on_copy_button)')
             return
 
-        with open(json_6d_path, 'w+') as gt_scene:
-            source_data = copy.deepcopy(gt_6d_pose_data[str(int(source_image_num))])
-            target_data = list()
-            for source in source_data:
-                se3_source_to_object = np.eye(4)
-                se3_source_to_object[:3, :3] = copy.deepcopy(np.array(source['cam_R_m2c']).reshape(3, 3))
-                se3_source_to_object[:3, 3] = copy.deepcopy(np.array(source['cam_t_m2c']))
-                se3_target_to_object = np.matmul(se3_target_to_source, copy.deepcopy(se3_source_to_object))
-                target = copy.deepcopy(source)
-                target['cam_R_m2c'] = se3_target_to_object[:3, :3].reshape(9).tolist() 
-                target['cam_t_m2c'] = se3_target_to_object[:3, 3].tolist()
-                target_data.append(target)
-            gt_6d_pose_data[str(int(target_image_num))] = target_data
-            json.dump(gt_6d_pose_data, gt_scene)
+        target_data = transfer_gt(gt_6d_pose_data[str(int(source_image_num))],
+                                  self.scene_camera_info[str(int(self.source_image_num))],
+                                  self.scene_camera_info[str(int(self.target_image_num))])
+        # only the target image is written, other images saved meanwhile are kept
+        self._scene_gt = self._gt_writer.write(scene_path, int(target_image_num), target_data).result()
         self._log.text = "\tCopied the annotation of image " + source_image_num + " to " + target_image_num + "."
         self.window.set_needs_layout()
 
@@ -644,9 +2264,7 @@ class AppWindow:
             if obj_inst_name in self.depth_diff_means.keys():
                 err = abs(self.depth_diff_means[obj_inst_name]) 
             
-            ok_delta = self.ok_delta 
-            ok_delta *= camera_idx_to_thresh_factor[self.current_image_idx % 4]
-            if err <= ok_delta :
+            if is_depth_diff_ok(err, self.current_image_idx, self.ok_delta):
                 text = "Complete"
             else:
                 text = "Incomplete"
@@ -659,6 +2277,50 @@ class AppWindow:
             scene_obj_info_table.append(row)
         self.scene_obj_info_table.set_items(scene_obj_info_table)
 
+        # the results belong to the saved annotation, so they are indexed by its pose hash
+        image_key = str(self._annotation_scene.image_num)
+        if self._quality_index is not None and image_key in self._scene_gt:
+            objects = [{"name": name, "depth_diff_mean": float(err), "status": text}
+                       for name, text, err in self.scene_obj_info_table_data]
+            self._quality_index.update(image_key, self._scene_gt[image_key], objects,
+                                       len(self._annotation_scene.get_objects()))
+        self._update_quality_progress()
+
+    def _update_quality_progress(self):
+        if self._quality_index is None:
+            return
+        num_complete = sum(self._quality_index.is_complete(image_num, self._scene_gt[str(image_num)])
+                           for image_num in self.image_num_lists if str(image_num) in self._scene_gt)
+        self._dataset_num_complete[self._annotation_scene.scene_num] = num_complete
+        num_images = len(self.image_num_lists)
+        self._dataset_num_images[self._annotation_scene.scene_num] = num_images
+        # the image counts of the other scenes arrive with _load_dataset_quality
+        dataset_num_images = sum(self._dataset_num_images.values()) \
+            if len(self._dataset_num_images) >= len(self.scene_num_lists) else "?"
+        self._quality_progress_str.text = "Complete: scene {}/{}, dataset {}/{}".format(
+            num_complete, num_images, sum(self._dataset_num_complete.values()), dataset_num_images)
+
+    def _load_dataset_quality(self):
+        # complete images of the other scenes, read from their quality indices in the background
+        scene_nums = list(self.scene_num_lists)
+
+        def count():
+            counts = {scene_num: QualityIndex(self.scenes.get_scene_path(scene_num)).num_complete()
+                      for scene_num in scene_nums}
+            image_counts = {scene_num: len(self.scenes.get_image_nums(scene_num)) for scene_num in scene_nums}
+            gui.Application.instance.post_to_main_thread(self.window, lambda: on_counted(counts, image_counts))
+
+        def on_counted(counts, image_counts):
+            for scene_num, num_complete in counts.items():
+                # the current scene is counted with checked pose hashes
+                self._dataset_num_complete.setdefault(scene_num, num_complete)
+            self._dataset_num_images.update(image_counts)
+            self._update_quality_progress()
+
+        self._dataset_num_complete = {}
+        self._dataset_num_images = {}
+        threading.Thread(target=count, daemon=True).start()
+
     def _on_x_rot(self, new_val):
         try:
             self.move( 0, 0, 0, new_val * np.pi / 180, 0, 0)
@@ -692,12 +2354,14 @@ class AppWindow:
             return
         self._annotation_scene.get_objects()[idx].obj_instance = int(new_val)
         self._annotation_scene.get_objects()[idx].obj_name = "obj_" + obj_name.split("_")[1] + "_" + str(int(new_val))
+        # geometries are named after the object
+        self._remove_obj_geometry(obj_name)
+        self._add_obj_geometry(self._annotation_scene.get_objects()[idx])
         meshes = self._annotation_scene.get_objects()  # update list after adding current object
         meshes = [i.obj_name for i in meshes]
         self._meshes_used.set_items(meshes)
         self._meshes_used.selected_index = idx
-        if self.settings.show_mesh_names:
-            self._update_and_show_mesh_name()
+        self._update_overlays()
         self._log.text = "\tChanged the instance ID of the object."
         self.window.set_needs_layout()
 
@@ -723,19 +2387,15 @@ class AppWindow:
 
         start_scene_num = int(basename(str(Path(path).parent.parent)))
         start_image_num = int(basename(path)[:-4])
-        self.scene_num_lists = sorted([int(basename(x)) for x in glob.glob(dirname(str(Path(path).parent.parent)) + self.spl + "*") if os.path.isdir(x)])
+        self.scene_num_lists = self.scenes.get_scene_nums()
         self.current_scene_idx = self.scene_num_lists.index(start_scene_num)
-        self.image_num_lists = sorted([int(basename(x).split(".")[0]) for x in glob.glob(dirname(str(Path(path))) + self.spl + "*.png")])
-        if len(self.image_num_lists) == 0:
-            self.image_num_lists = sorted([int(basename(x).split(".")[0]) for x in glob.glob(dirname(str(Path(path))) + self.spl + "*.jpg")])
+        self.image_num_lists = self.scenes.get_image_nums(start_scene_num)
         self.current_image_idx = self.image_num_lists.index(start_image_num)
         if os.path.exists(self.scenes.scenes_path) and os.path.exists(self.scenes.objects_path):
             self.update_obj_list()
+            self._load_dataset_quality()
             self.scene_load(self.scenes.scenes_path, start_scene_num, start_image_num)
-            self._progress.value = (self.current_image_idx + 1) / len(self.image_num_lists) 
-            self._progress_str.text = "Progress: {:.1f}% [{}/{}]".format(
-                100 * (self.current_image_idx + 1) / len(self.image_num_lists), 
-                self.current_image_idx + 1, len(self.image_num_lists))
+            self._update_progress()
         self.window.close_dialog()
         self._log.text = "\tLoad a scene to start annotating."
         self.window.set_needs_layout()
@@ -745,34 +2405,247 @@ class AppWindow:
         self._image_number.text = "Image: " + f'{self._annotation_scene.image_num:06}'
 
     def move(self, x, y, z, rx, ry, rz):
-        self._annotation_changed = True
+        # only the pose of the object is updated here; the scene, overlays and log are synced
+        # once per frame in _on_tick, so held keys cannot queue up more work than is rendered
+        self._on_navigation()
+        self._mark_annotation_changed()
         objects = self._annotation_scene.get_objects()
         active_obj = objects[self._meshes_used.selected_index]
         # translation or rotation
-        if x != 0 or y != 0 or z != 0:
-            h_transform = np.array([[1, 0, 0, x], [0, 1, 0, y], [0, 0, 1, z], [0, 0, 0, 1]])
-        else: 
-            center = active_obj.obj_geometry.get_center()
-            rot_mat_obj_center = active_obj.obj_geometry.get_rotation_matrix_from_xyz((rx, ry, rz))
-            T_neg = np.vstack((np.hstack((np.identity(3), -center.reshape(3, 1))), [0, 0, 0, 1]))
-            R = np.vstack((np.hstack((rot_mat_obj_center, [[0], [0], [0]])), [0, 0, 0, 1]))
-            T_pos = np.vstack((np.hstack((np.identity(3), center.reshape(3, 1))), [0, 0, 0, 1]))
-            h_transform = np.matmul(T_pos, np.matmul(R, T_neg))
-            
+        h_transform = move_delta(active_obj.get_center(), x, y, z, rx, ry, rz)
+        pose_before = active_obj.transform.copy()
         active_obj.set_transform(h_transform)
-        center = active_obj.obj_geometry.get_center()
-        self._scene.scene.remove_geometry(active_obj.obj_name)
-        self._scene.scene.add_geometry(active_obj.obj_name, active_obj.obj_geometry,
-                                        self.settings.annotation_active_obj_material,
-                                        add_downsampled_copy_for_fast_rendering=True)
-                                    
-        # update values stored of object
-        if self.settings.show_coord_frame:
-            self._add_coord_frame("obj_coord_frame", size=0.1)
-            self._add_coord_frame("world_coord_frame")
-        if self.settings.show_mesh_names:
-            self._update_and_show_mesh_name()
+        self._pending_poses.add(active_obj)
+        # a held key is undone as one step
+        self._pose_history.record([(self._meshes_used.selected_index, pose_before, active_obj.transform)],
+                                  key=("move", self._meshes_used.selected_index))
 
+    def _restore_poses(self, restore):
+        # poses of undo/redo go through the pose-only scene update
+        objects = self._annotation_scene.get_objects()
+        for obj_idx, pose in restore:
+            obj = objects[obj_idx]
+            obj.set_transform(np.matmul(pose, np.linalg.inv(obj.transform)))
+            self._update_obj_pose(obj)
+        self._update_overlays()
+        self._mark_annotation_changed()
+
+    def _on_undo(self):
+        if self._objects_loading:
+            self._log.text = "\tThe annotated objects are still loading."
+            self.window.set_needs_layout()
+            return
+        restore = self._pose_history.undo() if self._annotation_scene is not None else []
+        if not restore:
+            self._log.text = "\tNothing to undo."
+        else:
+            self._restore_poses(restore)
+            self._log.text = "\tUndid the pose change of {} object(s).".format(len(restore))
+        self.window.set_needs_layout()
+
+    def _on_undo_object(self):
+        if self._objects_loading:
+            self._log.text = "\tThe annotated objects are still loading."
+            self.window.set_needs_layout()
+            return
+        if self._annotation_scene is None or self._meshes_used.selected_index == -1:
+            self._on_error("Select an object first. (error at _on_undo_object)")
+            return
+        obj_idx = self._meshes_used.selected_index
+        obj = self._annotation_scene.get_objects()[obj_idx]
+        restore = self._pose_history.undo_object(obj_idx, obj.transform.copy())
+        if not restore:
+            self._log.text = "\tNothing to undo for {}.".format(obj.obj_name)
+        else:
+            self._restore_poses(restore)
+            self._log.text = "\tUndid the last pose change of {}.".format(obj.obj_name)
+        self.window.set_needs_layout()
+
+    def _on_redo(self):
+        if self._objects_loading:
+            self._log.text = "\tThe annotated objects are still loading."
+            self.window.set_needs_layout()
+            return
+        restore = self._pose_history.redo() if self._annotation_scene is not None else []
+        if not restore:
+            self._log.text = "\tNothing to redo."
+        else:
+            self._restore_poses(restore)
+            self._log.text = "\tRedid the pose change of {} object(s).".format(len(restore))
+        self.window.set_needs_layout()
+
+    def _apply_pending_poses(self):
+        if not self._pending_poses and self._pending_log is None:
+            return False
+        objects = self._annotation_scene.get_objects() if self._annotation_scene is not None else []
+        for obj in self._pending_poses:
+            # objects removed since the key press are skipped
+            if any(obj is o for o in objects) and self._scene_graph.has(obj.obj_name):
+                self._update_obj_pose(obj)
+        if self._pending_poses:
+            self._update_overlays()
+        self._pending_poses = set()
+        if self._pending_log is not None and self._log.text != self._pending_log:
+            self._log.text = self._pending_log
+            self.window.set_needs_layout()
+        self._pending_log = None
+        return True
+
+    def _add_obj_geometry(self, obj, material=None):
+        # uploads the object cloud (and its coarse copy) unless it is already in the scene
+        material = self._obj_material(obj) if material is None else material
+        self._scene_graph.add(obj.obj_name, obj.obj_geometry.to_tensor(), material, obj.transform,
+                              source=obj.obj_geometry)
+        if self.settings.use_lod:
+            key = id(obj.obj_geometry)
+            if key not in self._model_lods:
+                self._model_lods[key] = (obj.obj_geometry, LevelOfDetail(obj.obj_geometry))
+            lod_geometry = self._model_lods[key][1].get_level(self.settings.lod_obj_point_budget)
+            self._scene_graph.add(obj.obj_name + LOD_SUFFIX, lod_geometry.to_tensor(), material, obj.transform,
+                                  source=lod_geometry, downsampled=False)
+        else:
+            self._scene_graph.remove(obj.obj_name + LOD_SUFFIX)
+        self._show_lod(obj.obj_name)
+
+    def _remove_obj_geometry(self, obj_name):
+        self._scene_graph.remove(obj_name)
+        self._scene_graph.remove(obj_name + LOD_SUFFIX)
+
+    def _obj_material(self, obj):
+        objects = self._annotation_scene.get_objects()
+        selected_index = self._meshes_used.selected_index
+        if 0 <= selected_index < len(objects) and objects[selected_index] is obj:
+            return self.settings.annotation_active_obj_material
+        return self.settings.annotation_obj_material
+
+    def _update_obj_materials(self):
+        # only objects whose material actually changes are updated
+        for obj in self._annotation_scene.get_objects():
+            for name in [obj.obj_name, obj.obj_name + LOD_SUFFIX]:
+                if self._scene_graph.has(name):
+                    self._scene_graph.set_material(name, self._obj_material(obj))
+
+    def _update_obj_pose(self, obj):
+        # pose-only update, the uploaded geometry is left untouched
+        self._scene_graph.set_transform(obj.obj_name, obj.transform)
+        if self._scene_graph.has(obj.obj_name + LOD_SUFFIX):
+            self._scene_graph.set_transform(obj.obj_name + LOD_SUFFIX, obj.transform)
+
+    def _build_scene_lod_async(self, annotation_scene):
+        # downsampling a full-resolution scene cloud takes a while, so the coarse levels are
+        # built in the background; the full cloud is shown until they are ready
+        self._scene_lod = None
+        self._model_lods = {}
+        self._lod_coarse = False
+
+        def on_built(scene_lod):
+            if self._annotation_scene is annotation_scene:
+                self._scene_lod = scene_lod
+                self._add_scene_lod()
+
+        def build():
+            scene_lod = LevelOfDetail(annotation_scene.annotation_scene)
+            gui.Application.instance.post_to_main_thread(self.window, lambda: on_built(scene_lod))
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def _add_scene_lod(self):
+        if self.settings.use_lod and self._scene_lod is not None:
+            lod_geometry = self._scene_lod.get_level(self.settings.lod_point_budget)
+            self._scene_graph.add("annotation_scene" + LOD_SUFFIX, lod_geometry.to_tensor(),
+                                  self.settings.scene_material, source=lod_geometry, downsampled=False)
+        else:
+            self._scene_graph.remove("annotation_scene" + LOD_SUFFIX)
+        self._show_lod("annotation_scene")
+
+    def _show_lod(self, name):
+        # either the full or the coarse copy of a geometry is visible
+        has_lod = self._scene_graph.has(name + LOD_SUFFIX)
+        coarse = self._lod_coarse and self.settings.use_lod and has_lod
+        if self._scene_graph.has(name):
+            self._scene_graph.set_visible(name, not coarse)
+        if has_lod:
+            self._scene_graph.set_visible(name + LOD_SUFFIX, coarse)
+
+    def _set_lod_coarse(self, coarse):
+        self._lod_coarse = coarse
+        if self._annotation_scene is None:
+            return
+        self._show_lod("annotation_scene")
+        for obj in self._annotation_scene.get_objects():
+            self._show_lod(obj.obj_name)
+
+    def _on_navigation(self):
+        # the coarse level of detail is shown while the camera or an object moves
+        self._last_navigation = time.monotonic()
+        if self.settings.use_lod and not self._lod_coarse:
+            self._set_lod_coarse(True)
+
+    def _mark_annotation_changed(self):
+        self._annotation_changed = True
+        self._edit_count += 1
+        self._last_edit_time = time.monotonic()
+
+    def _snapshot_gt(self):
+        gt_objs = []
+        for obj in self._annotation_scene.get_objects():
+            obj_id = int(obj.obj_name.split("_")[1])  # assuming object name is formatted as obj_000001
+            inst_id = int(obj.obj_name.split("_")[2])
+            gt_objs.append(gt_from_pose(obj.transform, obj_id, inst_id))
+        return gt_objs
+
+    def _autosave(self):
+        # the poses are snapshotted here and written in the background without validation,
+        # the full validation still runs on an explicit save (F / Save Annotation)
+        annotation_scene = self._annotation_scene
+        edit_count = self._edit_count
+        self._autosave_count = edit_count
+        future = self._gt_writer.write(self.scenes.get_scene_path(annotation_scene.scene_num),
+                                       annotation_scene.image_num, self._snapshot_gt())
+
+        def on_saved(future):
+            try:
+                scene_gt = future.result()
+            except Exception as e:
+                if self._annotation_scene is annotation_scene and self._autosave_count == edit_count:
+                    # retried after the autosave delay; navigation asks to save first until it succeeds
+                    self._autosave_count = -1
+                    self._last_edit_time = time.monotonic()
+                    if self._autosave_failed:
+                        self._log.text = "\tAutosave failed again: {}".format(e)
+                        self.window.set_needs_layout()
+                        return
+                    self._autosave_failed = True
+                self._on_error("Autosave of scene {} image {} failed: {} (error at _autosave)".format(
+                    annotation_scene.scene_num, annotation_scene.image_num, e))
+                return
+            if self._annotation_scene is annotation_scene:
+                self._autosave_failed = False
+            if self._annotation_scene is None or self._annotation_scene.scene_num != annotation_scene.scene_num:
+                return  # another scene was opened meanwhile
+            image_key = str(annotation_scene.image_num)
+            self._scene_gt[image_key] = scene_gt[image_key]
+            if self._annotation_scene is annotation_scene and self._edit_count == edit_count:
+                self._annotation_changed = False
+                self._log.text = "\tAutosaved the annotation."
+                self.window.set_needs_layout()
+
+        future.add_done_callback(
+            lambda future: gui.Application.instance.post_to_main_thread(self.window, lambda: on_saved(future)))
+
+    def _autosave_due(self):
+        return (self.settings.autosave and self._annotation_changed and self._annotation_scene is not None
+                and not self._objects_loading and self._edit_count != self._autosave_count)
+
+    def _on_tick(self):
+        redraw = self._apply_pending_poses()
+        if self._autosave_due() and time.monotonic() - self._last_edit_time >= self.settings.autosave_delay:
+            self._autosave()
+        # back to full detail once idle; ICP and validation always use the full clouds
+        if self._lod_coarse and time.monotonic() - self._last_navigation > LOD_IDLE_TIME:
+            self._set_lod_coarse(False)
+            redraw = True
+        return redraw
 
     def _transform(self, event):
         if event.key == gui.KeyName.ESCAPE:
@@ -800,11 +2673,29 @@ class AppWindow:
             return gui.Widget.EventCallbackResult.HANDLED
 
         if event.key == gui.KeyName.R and event.type == gui.KeyEvent.DOWN:
-            self._on_refine()
+            if self._left_shift_modifier:
+                self._on_refine_all()
+            else:
+                self._on_refine()
             return gui.Widget.EventCallbackResult.HANDLED
         if event.key == gui.KeyName.T and event.type == gui.KeyEvent.DOWN:
             self._on_initial_viewpoint()
             return gui.Widget.EventCallbackResult.HANDLED
+        if event.key == gui.KeyName.N and event.type == gui.KeyEvent.DOWN:
+            self._on_next_pose_proposal()
+            return gui.Widget.EventCallbackResult.HANDLED
+        if event.key == gui.KeyName.Z and event.type == gui.KeyEvent.DOWN:
+            if self._left_shift_modifier:
+                self._on_redo()
+            else:
+                self._on_undo()
+            return gui.Widget.EventCallbackResult.HANDLED
+        if event.key == gui.KeyName.Y and event.type == gui.KeyEvent.DOWN:
+            self._on_redo()
+            return gui.Widget.EventCallbackResult.HANDLED
+        if event.key == gui.KeyName.X and event.type == gui.KeyEvent.DOWN:
+            self._on_undo_object()
+            return gui.Widget.EventCallbackResult.HANDLED
         if event.key == gui.KeyName.F and event.type == gui.KeyEvent.DOWN:
             self._on_generate()
             return gui.Widget.EventCallbackResult.HANDLED      
@@ -832,17 +2723,6 @@ class AppWindow:
 
 
         if event.key in [gui.KeyName.I, gui.KeyName.J, gui.KeyName.K, gui.KeyName.L, gui.KeyName.U, gui.KeyName.O, gui.KeyName.P] and self.scale_factor is not None:
-            def translate(tx=0, ty=0):
-                T = np.eye(3)
-                T[0:2,2] = [tx, ty]
-                return T
-            def scale(s=1, sx=1, sy=1):
-                T = np.diag([s*sx, s*sy, 1])
-                return T
-            def rotate(degrees):
-                T = np.eye(3)
-                T[0:2] = cv2.getRotationMatrix2D(center=(0,0), angle=-degrees, scale=1.0)
-                return T
             translate_factor = 10
             if event.key == gui.KeyName.I:
                 self.icy -= translate_factor
@@ -871,16 +2751,7 @@ class AppWindow:
                 self.scale_factor = 0.1
             if self.scale_factor > 10:
                 self.scale_factor = 10
-            (ow, oh) = (self.W, self.H)
-            (ocx, ocy) = ((ow-1)/2, (oh-1)/2)
-            H = translate(+ocx, +ocy) @ rotate(degrees=0) @ scale(self.scale_factor) @ translate(-self.icx, -self.icy)
-            M = H[0:2]
-            
-            rgb_img = cv2.resize(self.rgb_img.copy(), self.diff_img.shape[:2][::-1])
-            rgb_img = cv2.warpAffine(rgb_img, dsize=(ow,oh), M=M, flags=cv2.INTER_NEAREST)
-            diff_img = cv2.warpAffine(self.diff_img.copy(), dsize=(ow,oh), M=M, flags=cv2.INTER_NEAREST)
-            mask_img = cv2.warpAffine(self.mask_img.copy(), dsize=(ow,oh), M=M, flags=cv2.INTER_NEAREST)
-            self._update_vis_img(rgb_img, diff_img, mask_img)
+            self._compose_vis_img()
             return gui.Widget.EventCallbackResult.HANDLED
 
         # if no active_mesh selected print error
@@ -890,8 +2761,7 @@ class AppWindow:
 
         # Translation
         if not self._left_shift_modifier:
-            self._log.text = "\tAdjusting the object position."
-            self.window.set_needs_layout()
+            self._pending_log = "\tAdjusting the object position."
             if event.key == gui.KeyName.D:
                 self.move( self.dist, 0, 0, 0, 0, 0)
             elif event.key == gui.KeyName.A:
@@ -906,8 +2776,7 @@ class AppWindow:
                 self.move( 0, 0, -self.dist, 0, 0, 0)
         # Rotation - keystrokes are not in same order as translation to make movement more human intuitive
         else:
-            self._log.text = "\tAdjusting the object orientation."
-            self.window.set_needs_layout()
+            self._pending_log = "\tAdjusting the object orientation."
             if event.key == gui.KeyName.E:
                 self.move( 0, 0, 0, 0, 0, self.deg * np.pi / 180)
             elif event.key == gui.KeyName.Q:
@@ -925,45 +2794,38 @@ class AppWindow:
 
 
     def _on_mouse(self, event):
-        
+        if event.type in (gui.MouseEvent.Type.DRAG, gui.MouseEvent.Type.WHEEL):
+            self._on_navigation()
+
         if event.type == gui.MouseEvent.Type.BUTTON_DOWN and event.is_modifier_down(
                 gui.KeyModifier.ALT):
             try:
                 objects = self._annotation_scene.get_objects()
                 active_obj = objects[self._meshes_used.selected_index]
-            except IndexError:
+            except (IndexError, AttributeError):
                 self._on_error("Select an object first. (error at _on_mouse)")
                 return gui.Widget.EventCallbackResult.HANDLED
 
-            def depth_callback(depth_image):
-                x = event.x - self._scene.frame.x
-                y = event.y - self._scene.frame.y
-                # Note that np.asarray() reverses the axes.
-                depth = np.asarray(depth_image)[y, x]
-
-                if depth == 1.0:  # clicked on nothing (i.e. the far plane)
-                    pass
-                else:
-                    target_xyz = self._scene.scene.camera.unproject(
-                        event.x, event.y, depth, self._scene.frame.width,
-                        self._scene.frame.height)
-                    target_xyz = np.array(target_xyz)
-                    objects = self._annotation_scene.get_objects()
-                    active_obj = objects[self._meshes_used.selected_index]
-                    h_transform = np.eye(4)
-                    h_transform[:3, 3] = target_xyz - active_obj.obj_geometry.get_center()
-                    active_obj.set_transform(h_transform)
-                    self._scene.scene.remove_geometry(active_obj.obj_name)
-                    self._scene.scene.add_geometry(active_obj.obj_name, active_obj.obj_geometry,
-                                                self.settings.annotation_active_obj_material,
-                                                add_downsampled_copy_for_fast_rendering=True)
-                    # update values stored of object
-                    if self.settings.show_coord_frame:
-                        self._add_coord_frame("obj_coord_frame", size=0.1)
-                        self._add_coord_frame("world_coord_frame")
-                    if self.settings.show_mesh_names:
-                        self._update_and_show_mesh_name()
-            self._scene.scene.scene.render_to_depth_image(depth_callback)
+            # cast a ray from the current camera through the clicked pixel
+            x = event.x - self._scene.frame.x
+            y = event.y - self._scene.frame.y
+            camera = self._scene.scene.camera
+            ray_near = np.array(camera.unproject(x, y, 0.0, self._scene.frame.width, self._scene.frame.height))
+            ray_far = np.array(camera.unproject(x, y, 1.0, self._scene.frame.width, self._scene.frame.height))
+            ray_dir = (ray_far - ray_near) / np.linalg.norm(ray_far - ray_near)
+            t_hit = self._annotation_scene.cast_ray(ray_near, ray_dir, exclude=active_obj)
+            if not np.isfinite(t_hit):  # clicked on nothing
+                return gui.Widget.EventCallbackResult.HANDLED
+            target_xyz = ray_near + t_hit * ray_dir
+            h_transform = np.eye(4)
+            h_transform[:3, 3] = target_xyz - active_obj.get_center()
+            pose_before = active_obj.transform.copy()
+            active_obj.set_transform(h_transform)
+            self._pose_history.record([(self._meshes_used.selected_index, pose_before, active_obj.transform)])
+            self._update_obj_pose(active_obj)
+            self._mark_annotation_changed()
+            # update values stored of object
+            self._update_overlays()
             self._log.text = "\tAdjusting the object position using mouse click."
             self.window.set_needs_layout()
             return gui.Widget.EventCallbackResult.HANDLED
@@ -974,197 +2836,160 @@ class AppWindow:
         self._log.text = "\tSelected object: " + str(self._meshes_used.selected_index)
         self.window.set_needs_layout()
         objects = self._annotation_scene.get_objects()
-        for obj in objects:
-            self._scene.scene.remove_geometry(obj.obj_name)
-            self._scene.scene.add_geometry(obj.obj_name, obj.obj_geometry,
-                                        self.settings.annotation_obj_material,
-                                        add_downsampled_copy_for_fast_rendering=True)
+        self._update_obj_materials()
         active_obj = objects[self._meshes_used.selected_index]
-        self._scene.scene.remove_geometry(active_obj.obj_name)
-        self._scene.scene.add_geometry(active_obj.obj_name, active_obj.obj_geometry,
-                                    self.settings.annotation_active_obj_material,
-                                    add_downsampled_copy_for_fast_rendering=True)
         self.inst_id_edit.set_value(int(active_obj.obj_name.split("_")[-1]))
         self._apply_settings()
 
+    @tracer.traced()
     def _on_refine(self):
         self._log.text = "\tRefining the pose using ICP..."
         self.window.set_needs_layout()
-        self._annotation_changed = True
+        self._mark_annotation_changed()
 
         # if no active_mesh selected print error
         if self._meshes_used.selected_index == -1:
             self._on_error("Select an object first. (error at _on_refine)")
             return gui.Widget.EventCallbackResult.HANDLED
 
-        target = self._annotation_scene.annotation_scene
         objects = self._annotation_scene.get_objects()
         active_obj = objects[self._meshes_used.selected_index]
-        source = active_obj.obj_geometry
-
-        trans_init = np.identity(4)
-        threshold = 0.004
-        reg = o3d.pipelines.registration.registration_icp(source, target, threshold, trans_init,
-                                                          o3d.pipelines.registration.TransformationEstimationPointToPlane(),
-                                                          o3d.pipelines.registration.ICPConvergenceCriteria(
-                                                              max_iteration=50))
-        if np.sum(np.abs(reg.transformation[:3, 3])) < 0.25:
-            active_obj.set_transform(reg.transformation)
-            self._scene.scene.remove_geometry(active_obj.obj_name)
-            self._scene.scene.add_geometry(active_obj.obj_name, active_obj.obj_geometry,
-                                        self.settings.annotation_active_obj_material,
-                                        add_downsampled_copy_for_fast_rendering=True)
-
-            if self.settings.show_coord_frame:
-                self._add_coord_frame("obj_coord_frame", size=0.1)
-                self._add_coord_frame("world_coord_frame")
-            if self.settings.show_mesh_names:
-                self._update_and_show_mesh_name()
+
+        transformation, fitness, _ = refine_objects(self._annotation_scene, [active_obj])[0]
+        if is_refine_accepted(transformation, fitness):
+            with tracer.span("apply poses"):
+                pose_before = active_obj.transform.copy()
+                active_obj.set_transform(transformation)
+                self._pose_history.record([(self._meshes_used.selected_index, pose_before, active_obj.transform)])
+                self._update_obj_pose(active_obj)
+                self._update_overlays()
             self._log.text = "\tSuccess to refine the pose using ICP."
             self.window.set_needs_layout()
         else:
             self._log.text = "\tFailed to refine the pose. Try again or adjust it manually."
             self.window.set_needs_layout()
 
+    @tracer.traced()
+    def _on_refine_all(self):
+        if self._annotation_scene is None:
+            self._on_error("Select a scene to refine. (error at _on_refine_all)")
+            return
+        objects = self._annotation_scene.get_objects()
+        if not objects:
+            self._on_error("There is no object to refine. (error at _on_refine_all)")
+            return
+        self._log.text = "\tRefining all object poses using ICP..."
+        self.window.set_needs_layout()
+        self._mark_annotation_changed()
+
+        results = refine_objects(self._annotation_scene, objects, self.settings.joint_refine)
+
+        with tracer.span("apply poses"):
+            # apply all pose updates in one batched scene update
+            refine_info_table = []
+            num_success = 0
+            changes = []
+            for obj_idx, (obj, (transformation, fitness, inlier_rmse)) in enumerate(zip(objects, results)):
+                if is_refine_accepted(transformation, fitness):
+                    pose_before = obj.transform.copy()
+                    obj.set_transform(transformation)
+                    changes.append((obj_idx, pose_before, obj.transform))
+                    self._update_obj_pose(obj)
+                    num_success += 1
+                    refine_info_table.append("{}: Success (rmse {:.1f})".format(obj.obj_name, inlier_rmse * 1000))
+                else:
+                    refine_info_table.append("{}: Failed".format(obj.obj_name))
+            try:
+                self._pose_history.record(changes)  # undone as one step
+                history_info = ""
+            except ValueError:
+                # the refinement cannot be undone, and the older steps would restore other poses
+                self._pose_history.clear()
+                history_info = " Too many objects to undo, the undo history was cleared."
+            self._update_overlays()
+        self.refine_info_table.set_items(refine_info_table)
+        self._log.text = "\tRefined {}/{} object poses using ICP.{}".format(num_success, len(objects), history_info)
+        self.window.set_needs_layout()
+
+    @tracer.traced()
     def _on_generate(self):
         self._log.text = "\tSaving the annotation results..."
         self.window.set_needs_layout()
         if self._annotation_scene is None: # shsh
             self._on_error("Select a scene to save the annotation results. (error at _on_generate)")
             return
+        if self._objects_loading:
+            self._on_error("The annotated objects are still loading. (error at _on_generate)")
+            return
 
         image_num = self._annotation_scene.image_num
-        json_6d_path = os.path.join(self.scenes.scenes_path, f"{self._annotation_scene.scene_num:06}", 'scene_gt.json')
+        scene_path = self.scenes.get_scene_path(self._annotation_scene.scene_num)
+        view_angle_data = self._snapshot_gt()
 
-        if os.path.exists(json_6d_path):
-            with open(json_6d_path, "r") as gt_scene:
-                try:
-                    gt_6d_pose_data = json.load(gt_scene)
-                except json.decoder.JSONDecodeError as e:
-                    date_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    backup_path = json_6d_path.replace(".json", "_backup_{}.json".format(date_time))
-                    shutil.copy(json_6d_path, backup_path)
-                    self._on_error("Failed to load the json file. The file is saved as a backup file. (error at _on_generate)")
-                    gt_6d_pose_data = {}
-        else:
-            gt_6d_pose_data = {}
-
-        # write/update "scene_gt.json"
+        # write/update "scene_gt.json" (or the image's shard) on the writer thread shared with autosave
         try:
-            with open(json_6d_path, 'w+') as gt_scene:
-                view_angle_data = list()
-                for obj in self._annotation_scene.get_objects():
-                    transform_cam_to_object = obj.transform
-                    translation = np.array(transform_cam_to_object[0:3, 3] * 1000, dtype=np.float32).tolist()  # convert meter to mm
-                    model_names = self.load_model_names()
-                    obj_id = int(obj.obj_name.split("_")[1])  # assuming object name is formatted as obj_000001
-                    inst_id = int(obj.obj_name.split("_")[2])
-                    obj_data = {
-                        "cam_R_m2c": transform_cam_to_object[0:3, 0:3].tolist(),  # rotation matrix
-                        "cam_t_m2c": translation,  # translation
-                        "obj_id": obj_id,
-                        "inst_id": inst_id
-                    }
-                    view_angle_data.append(obj_data)
-                if str(image_num) in gt_6d_pose_data.keys():
-                    del gt_6d_pose_data[str(image_num)]
-                gt_6d_pose_data[str(image_num)] = view_angle_data
-                json.dump(gt_6d_pose_data, gt_scene)
+            with tracer.span("write scene_gt"):
+                self._scene_gt = self._gt_writer.write(scene_path, image_num, view_angle_data).result()
             self._log.text = "\tSave the annotation results successfully."
             self.window.set_needs_layout()
         except Exception as e:
             date_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             json_6d_path = os.path.join(self.scenes.scenes_path, f"{self._annotation_scene.scene_num:06}", "scene_gt_backup_{}.json".format(date_time))
+            gt_6d_pose_data = dict(self._scene_gt)
+            gt_6d_pose_data[str(image_num)] = view_angle_data
             with open(json_6d_path, 'w+') as gt_scene:
-                view_angle_data = list()
-                for obj in self._annotation_scene.get_objects():
-                    transform_cam_to_object = obj.transform
-                    translation = list(transform_cam_to_object[0:3, 3] * 1000)  # convert meter to mm
-                    model_names = self.load_model_names()
-                    obj_id = int(obj.obj_name.split("_")[1])  # assuming object name is formatted as obj_000001
-                    inst_id = int(obj.obj_name.split("_")[2])
-                    obj_data = {
-                        "cam_R_m2c": transform_cam_to_object[0:3, 0:3].tolist(),  # rotation matrix
-                        "cam_t_m2c": translation,  # translation
-                        "obj_id": obj_id,
-                        "inst_id": inst_id
-                    }
-                    view_angle_data.append(obj_data)
-                gt_6d_pose_data[str(image_num)] = view_angle_data
                 json.dump(gt_6d_pose_data, gt_scene)
+            self._scene_gt.pop(str(image_num), None)  # scene_gt.json no longer holds the saved annotation
             self._log.text = "\tFailed to save the annotation results. The results are saved as a backup file."
             self.window.set_needs_layout()
+        self._autosave_count = self._edit_count
+        self._autosave_failed = False
         self._annotation_changed = False
         self._validate_anno()
         self.update_scene_obj_info_table()
 
+    def _get_validation_renderer(self):
+        # the offscreen renderer is reused as long as the validation camera does not change
+        intrinsic = np.array(self.cam_K).reshape((3, 3)) / VALIDATION_DOWNSCALE
+        intrinsic[2, 2] = 1
+        key = (self.W, self.H, tuple(intrinsic.reshape(-1)))
+        if getattr(self, '_validation_renderer_key', None) != key:
+            self._validation_renderer = make_validation_renderer(self.W, self.H, intrinsic)
+            self._validation_renderer_key = key
+        return self._validation_renderer
+
+    def _load_captured_depth(self):
+        # captured depth (mm) of the current image at the validation resolution
+        depth_captured = cv2.imread(self.depth_path, -1)
+        depth_captured = cv2.resize(depth_captured, (self.W, self.H), interpolation=cv2.INTER_NEAREST)
+        return np.float32(depth_captured) * self.scene_camera_info[str(self._annotation_scene.image_num)]["depth_scale"]
+
+    def score_pose_hypotheses(self, obj_index, poses):
+        # render-and-compare K candidate poses (4x4, camera frame) of one object against the
+        # captured depth. returns [(index in poses, depth_diff_mean, ratio_delta_1, ratio_delta_2)], best first
+        objects = self._annotation_scene.get_objects()
+        obj = objects[obj_index]
+        others = [other for other in objects if other is not obj]
+        order, scores = rank_pose_hypotheses(self._get_validation_renderer(), obj.obj_mesh, poses,
+                                             [other.obj_mesh for other in others],
+                                             [other.transform for other in others],
+                                             self._load_captured_depth())
+        depth_diff_mean, ratio_delta_1, ratio_delta_2, _ = scores
+        return [(i, depth_diff_mean[i], ratio_delta_1[i], ratio_delta_2[i]) for i in order]
+
+    @tracer.traced()
     def _validate_anno(self):
          # annotation validator
         self._log.text = "\tGenerating validation results..."
         self.window.set_needs_layout()   
-        render = rendering.OffscreenRenderer(width=self.W, height=self.H)
-        render.scene.set_background([0, 0, 0, 1])
-        # adjust cam_K to render size
-        intrinsic = np.array(self.cam_K).reshape((3, 3))
-        intrinsic[0, 0] *= 1 / 4
-        intrinsic[1, 1] *= 1 / 4
-        intrinsic[0, 2] *= 1 / 4
-        intrinsic[1, 2] *= 1 / 4
-
-        # set camera intrinsic
-        extrinsic = np.eye(4)
-        render.setup_camera(intrinsic, extrinsic, self.W, self.H)
-        # set camera pose
-        center = [0, 0, 1]  # look_at target
-        eye = [0, 0, 0]  # camera position
-        up = [0, -1, 0]  # camera orientation
-        render.scene.camera.look_at(center, eye, up)
-        render.scene.camera.set_projection(intrinsic, 0.01, 3.0, self.W, self.H)
-        
         objects = self._annotation_scene.get_objects()
-        # generate object material
-        obj_mtl = o3d.visualization.rendering.MaterialRecord()
-        obj_mtl.base_color = [1.0, 1.0, 1.0, 1.0]
-        obj_mtl.shader = "defaultUnlit"
-        for obj in objects:
-            obj = copy.deepcopy(obj)
-            obj.obj_mesh.paint_uniform_color([1, 1, 1])
-            render.scene.add_geometry(obj.obj_name, obj.obj_mesh, obj_mtl,                              
-                                  add_downsampled_copy_for_fast_rendering=False)
-        
-
-        depth_rendered = render.render_to_depth_image(z_in_view_space=True)
-        depth_rendered = np.array(depth_rendered, dtype=np.float32)
-        depth_rendered[np.isposinf(depth_rendered)] = 0
-        depth_rendered *= 1000 # convert meter to mm
-        render.scene.clear_geometry()
-
-        # rendering object masks #
-        obj_masks = {}
-        for source_obj in objects:
-            # add geometry and set color (target object as white / others as black)
-            for target_obj in objects:
-                target_obj = copy.deepcopy(target_obj)
-                color = [1,1,1] if source_obj.obj_name == target_obj.obj_name else [0,0,0]
-                target_obj.obj_mesh.paint_uniform_color(color)
-                render.scene.add_geometry("mask_{}_to_{}".format(
-                                                source_obj.obj_name, target_obj.obj_name), 
-                                        target_obj.obj_mesh, obj_mtl,                              
-                                        add_downsampled_copy_for_fast_rendering=True)
-            # render mask as RGB
-            mask_obj = render.render_to_image()
-            mask_obj = np.array(mask_obj)
-            obj_masks[source_obj.obj_name] = mask_obj.copy()
-            render.scene.clear_geometry()
-
-
-        depth_captured = cv2.imread(self.depth_path, -1)
-        depth_captured = cv2.resize(depth_captured, (self.W, self.H), interpolation=cv2.INTER_NEAREST)
-        depth_captured = np.float32(depth_captured) * self.scene_camera_info[str(self.image_num_lists[self.current_image_idx])]["depth_scale"] 
-        valid_depth_mask = np.array(depth_captured > 200, dtype=bool)
-
-        rgb_img = cv2.imread(self.rgb_path)
-        rgb_img = cv2.resize(rgb_img, (self.W, self.H))
+        with tracer.span("render", num_objects=len(objects)):
+            depth_rendered, labels = self._get_validation_renderer().render_labels(
+                [obj.obj_mesh for obj in objects], [obj.transform for obj in objects])
+        with tracer.span("decode images"):
+            depth_captured = self._load_captured_depth()
+            rgb_img = cv2.imread(self.rgb_path)
+            rgb_img = cv2.resize(rgb_img, (self.W, self.H))
         diff_vis = np.zeros((self.H, self.W, 3), dtype=np.uint8)
         ########################################
         # calculate depth difference with mask #
@@ -1172,79 +2997,71 @@ class AppWindow:
         ########################################
         texts = []
         is_oks = []
-        # self.H, self.W, _ = diff_vis.shape
         self.icx, self.icy = self.W / 2, self.H / 2
         self.scale_factor = 1
         self.depth_diff_means = {}
         amodal_masks = []
         bboxes = []
         cmap = matplotlib.cm.get_cmap('hsv')
-        for i, (obj_name, obj_mask) in enumerate(obj_masks.items()):
-            obj_mask = np.where(obj_mask > 125, 255, 0).astype(np.uint8)[..., 0]
-            valid_mask = obj_mask * copy.deepcopy(valid_depth_mask)
-            valid_mask = np.array(valid_mask > 0, dtype=bool).astype(np.uint8)
-
-            depth_captured_obj = depth_captured.copy()
-            depth_rendered_obj = depth_rendered.copy()
-
-            depth_diff = depth_captured_obj - depth_rendered_obj
-            inlier_mask = np.abs(np.copy(depth_diff)) < 100
-            depth_diff = depth_diff * valid_mask
-            depth_diff_abs = np.abs(np.copy(depth_diff))
-            
-            if np.sum(inlier_mask) == 0:
-                depth_diff = np.ones_like(depth_diff) * 1000
-                depth_diff_abs = np.ones_like(depth_diff_abs) * 1000
-
-            delta_1 = 5 # mm, threshold for high-quality annotation 
-            delta_2 = 15 ## mm, threshold for ok-ish annotation
-            below_delta_1 = valid_mask * (depth_diff_abs < delta_1)
-            below_delta_2 = valid_mask * (depth_diff_abs < delta_2) * (depth_diff_abs > delta_1)
-            above_delta = valid_mask * (depth_diff_abs > delta_2)
-            below_delta_1_vis = (below_delta_1).astype(np.uint8)
-            below_delta_2_vis = (below_delta_2).astype(np.uint8)
-            above_delta_vis = (above_delta).astype(np.uint8)
-            depth_diff_mean = np.sum(depth_diff[valid_mask > 0]) / np.sum(valid_mask)
-            depth_diff_vis = np.stack([below_delta_2_vis, below_delta_1_vis, above_delta_vis], axis=-1) * 255
+        with tracer.span("depth difference"):
+            for i, obj in enumerate(objects):
+                obj_name = obj.obj_name
+                obj_mask = labels == i + 1
+                depth_diff_mean, depth_diff_abs, valid_mask = compute_depth_diff(depth_captured, depth_rendered,
+                                                                                 obj_mask)
+                if not np.any(valid_mask):
+                    self._on_error("Object {} is out of camera view or too far from point cloud.".format(obj_name))
+                    continue
+
+                below_delta_1 = valid_mask * (depth_diff_abs < DEPTH_DELTA_1)
+                below_delta_2 = valid_mask * (depth_diff_abs < DEPTH_DELTA_2) * (depth_diff_abs > DEPTH_DELTA_1)
+                above_delta = valid_mask * (depth_diff_abs > DEPTH_DELTA_2)
+                depth_diff_vis = np.stack([below_delta_2, below_delta_1, above_delta],
+                                          axis=-1).astype(np.uint8) * 255
+                diff_vis[valid_mask] = depth_diff_vis[valid_mask]
+
+                text = "{}_{}".format(int(obj_name.split("_")[1]), int(obj_name.split("_")[2]))
+                texts.append(text)
+                ys, xs = valid_mask.nonzero()
+                bbox = [np.min(xs), np.min(ys), np.max(xs), np.max(ys)]
+
+                self.depth_diff_means[obj_name] = depth_diff_mean
+                is_ok = is_depth_diff_ok(depth_diff_mean, self.current_image_idx, self.ok_delta)
+                color = (0, 255, 0) if is_ok else (0, 0, 255)
+                cv2.rectangle(diff_vis, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 1)
+
+                is_oks.append(is_ok)
+                amodal_masks.append(obj_mask)
+                bboxes.append(bbox)
+        with tracer.span("update images"):
+            # Pre-compute the colors and the text overlay positions once, outside the loop
+            colors = [np.array(cmap(i / len(amodal_masks))[:3]) * 255 for i in range(len(amodal_masks))]
+
+            # Create a copy of the original image to apply masks
+            mask_img = np.zeros_like(rgb_img)
+            # draw amodal masks
+            for amodal_mask, text, bbox, color in zip(amodal_masks, texts, bboxes, colors):
+                mask_img[amodal_mask > 0] = color
+                cv2.putText(mask_img, text, (bbox[0], bbox[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+                cv2.rectangle(mask_img, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 1)
+
+            mask_img = cv2.addWeighted(rgb_img, 0.5, mask_img, 1.0, 0)
+            diff_img = cv2.addWeighted(rgb_img, 0.5, diff_vis, 0.8, 0)
+            self._update_vis_img(rgb_img, diff_img, mask_img)
 
-            try:
-                diff_vis[valid_mask>0] = depth_diff_vis[valid_mask>0]
-            except Exception as e:
-                print(e)
-                self._on_error("Object {} is out of camera view or too far from point cloud.".format(obj_name))
-                continue
-            text = "{}_{}".format(int(obj_name.split("_")[1]), int(obj_name.split("_")[2]))
-            texts.append(text)
-            ys, xs = valid_mask.nonzero()
-            bbox = [np.min(xs), np.min(ys), np.max(xs), np.max(ys)]
-
-            self.depth_diff_means[obj_name] = abs(depth_diff_mean)
-            ok_delta = self.ok_delta
-            ok_delta *= camera_idx_to_thresh_factor[self.current_image_idx % 4]
-            is_ok = abs(depth_diff_mean) < ok_delta
-            color = (0, 255, 0) if is_ok else (0, 0, 255)
-            cv2.rectangle(diff_vis, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 1)
-
-            is_oks.append(is_ok)
-            amodal_masks.append(obj_mask)
-            bboxes.append(bbox)
-        # Pre-compute the colors and the text overlay positions once, outside the loop
-        colors = [np.array(cmap(i / len(amodal_masks))[:3]) * 255 for i in range(len(amodal_masks))]
-        text_positions = [(bbox[0], bbox[1]) for bbox in bboxes]
-
-        # Create a copy of the original image to apply masks
-        mask_img = np.zeros_like(rgb_img)
-        # draw amodal masks
-        for amodal_mask, text_position, color in zip(amodal_masks, text_positions, colors):
-            mask_img[amodal_mask > 0] = color
-            cv2.putText(mask_img, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            cv2.rectangle(mask_img, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color, 1)
-
-        mask_img = cv2.addWeighted(rgb_img, 0.5, mask_img, 1.0, 0)
-        self.mask_img = mask_img
-        diff_img = cv2.addWeighted(rgb_img, 0.5, diff_vis, 0.8, 0)
-        self.diff_img = diff_img
-        self._update_vis_img(rgb_img, diff_img, mask_img)
+    def _update_timing_table(self, spans):
+        self._timing_table.set_items(["{}{}: {:.1f} ms, {:+.0f} KB".format("    " * depth, name, ms, kb)
+                                      for depth, name, ms, kb in spans])
+        self.window.set_needs_layout()
+
+    def _on_save_trace(self):
+        try:
+            path = tracer.export()
+        except OSError as e:
+            self._on_error("Failed to save the trace: {} (error at _on_save_trace)".format(e))
+            return
+        self._log.text = "\tSaved the trace to {}.".format(os.path.abspath(path))
+        self.window.set_needs_layout()
 
     def _on_error(self, err_msg):
         dlg = gui.Dialog("Error")
@@ -1277,6 +3094,30 @@ class AppWindow:
         self.settings.show_mesh_names = show
         self._apply_settings()
 
+    def _on_joint_refine(self, joint):
+        self.settings.joint_refine = joint
+        if joint:
+            self._log.text = "\t Refining all objects jointly."
+        else:
+            self._log.text = "\t Refining each object independently."
+        self.window.set_needs_layout()
+
+    def _on_autosave(self, autosave):
+        self.settings.autosave = autosave
+        if autosave:
+            self._log.text = "\t Saving the annotation {} s after the last edit.".format(self.settings.autosave_delay)
+        else:
+            self._log.text = "\t Autosave disabled."
+        self.window.set_needs_layout()
+
+    def _on_autosave_delay(self, delay):
+        self.settings.autosave_delay = int(delay)
+
+    def _on_propose_pose(self, propose):
+        self.settings.propose_pose = propose
+        if propose and self.pose_proposer is not None:
+            self.pose_proposer.precompute(self.load_model_names())
+
     def _on_highlight_obj(self, light):
         self.settings.highlight_obj = light
         if light:
@@ -1296,11 +3137,7 @@ class AppWindow:
         if self._annotation_scene is None: 
             self._on_error("Select the annotation object file. (error at _on_highlight_obj)")
             return
-        meshes = self._annotation_scene.get_objects()
-        for mesh in meshes:
-            self._scene.scene.modify_geometry_material(mesh.obj_name, self.settings.annotation_obj_material)
-        active_obj = meshes[self._meshes_used.selected_index]
-        self._scene.scene.modify_geometry_material(active_obj.obj_name, self.settings.annotation_active_obj_material)
+        self._update_obj_materials()
 
 
     def _on_transparency(self, transparency): 
@@ -1313,21 +3150,24 @@ class AppWindow:
         self.settings.annotation_obj_material.base_color = [0.9, 0.3 + 0.6*transparency, 0.3 + 0.6*transparency, 1]
         self.settings.annotation_active_obj_material.base_color = [0.3 + 0.6*transparency, 0.9, 0.3 + 0.6*transparency, 1]
 
-        objects = self._annotation_scene.get_objects()
-        for obj in objects:
-            self._scene.scene.remove_geometry(obj.obj_name)
-            self._scene.scene.add_geometry(obj.obj_name, obj.obj_geometry,
-                                            self.settings.annotation_obj_material,
-                                            add_downsampled_copy_for_fast_rendering=True)
-
-        active_obj = objects[self._meshes_used.selected_index]
-        self._scene.scene.remove_geometry(active_obj.obj_name)
-        self._scene.scene.add_geometry(active_obj.obj_name, active_obj.obj_geometry,
-                                        self.settings.annotation_active_obj_material,
-                                        add_downsampled_copy_for_fast_rendering=True)                       
+        self._update_obj_materials()
         self._apply_settings()
 
 
+    def _on_use_lod(self, use_lod):
+        self.settings.use_lod = use_lod
+        self._set_lod_coarse(False)
+        if self._annotation_scene is None:
+            return
+        self._add_scene_lod()
+        for obj in self._annotation_scene.get_objects():
+            self._add_obj_geometry(obj)  # adds or removes the coarse copy
+
+    def _on_lod_point_budget(self, budget):
+        self.settings.lod_point_budget = int(budget) * 1000
+        if self._annotation_scene is not None:
+            self._add_scene_lod()
+
     def _on_point_size(self, size):
         self.settings.scene_material.point_size = int(size)
         self.settings.apply_material = True
@@ -1377,9 +3217,13 @@ class AppWindow:
         if self._annotation_scene is None: 
             self._on_error("Select the file to annotate. (error at _add_mesh)") 
             return
+        if self._objects_loading:
+            # the instance ids and list positions of the loading objects are not known yet
+            self._on_error("The annotated objects are still loading. (error at _add_mesh)")
+            return
 
         mesh_name_to_add = f'obj_{self._meshes_available.int_value:06}'
-        if not os.path.exists(os.path.join(self.scenes.objects_path, mesh_name_to_add + '.ply')):
+        if self._meshes_available.int_value not in self.scenes.get_obj_ids():
             self._on_error("The object does not exist. (error at _add_mesh)")
             return
 
@@ -1387,14 +3231,8 @@ class AppWindow:
         self.window.set_needs_layout()
         meshes = self._annotation_scene.get_objects()
         meshes = [i.obj_name for i in meshes]
-        object_geometry = o3d.io.read_point_cloud(
-            os.path.join(self.scenes.objects_path, mesh_name_to_add + '.ply'))
-        object_geometry.points = o3d.utility.Vector3dVector(
-            np.array(object_geometry.points) / 1000)  # convert mm to meter
-        object_mesh = o3d.io.read_triangle_mesh(
-                os.path.join(self.scenes.mesh_path, mesh_name_to_add + '.obj'))
-        object_mesh.vertices = o3d.utility.Vector3dVector(
-                np.array(object_mesh.vertices) / 1000)  # convert mm to meter
+        object_geometry = self.scenes.load_obj_geometry(self._meshes_available.int_value)
+        object_mesh = self.scenes.load_obj_mesh(self._meshes_available.int_value)
         init_trans = np.identity(4)
         center = self._annotation_scene.annotation_scene.get_center()
         center[2] -= 0.2
@@ -1402,22 +3240,91 @@ class AppWindow:
         # object_geometry.transform(init_trans)
         new_mesh_instance = self._obj_instance_count(mesh_name_to_add, meshes)
         new_mesh_name = mesh_name_to_add + '_' + str(new_mesh_instance)
-        self._scene.scene.add_geometry(new_mesh_name, object_geometry, self.settings.annotation_obj_material,
-                                       add_downsampled_copy_for_fast_rendering=True)
         self._annotation_scene.add_obj(object_geometry, object_mesh, new_mesh_name, new_mesh_instance, transform=init_trans)
-        if self.settings.show_mesh_names:
-            self.mesh_names.append(self._scene.add_3d_label(center, f"{new_mesh_name}"))
+        self._add_obj_geometry(self._annotation_scene.get_objects()[-1], self.settings.annotation_obj_material)
 
         meshes = self._annotation_scene.get_objects()  # update list after adding current object
         meshes = [i.obj_name for i in meshes]
         self._meshes_used.set_items(meshes)
         self._meshes_used.selected_index = len(meshes) - 1
-        self._annotation_changed = True
+        self._update_overlays()
+        self._mark_annotation_changed()
+        if self.settings.propose_pose:
+            self._request_pose_proposals(self._annotation_scene.get_objects()[-1], mesh_name_to_add)
+
+    def _request_pose_proposals(self, obj, model_name):
+        self._log.text = "\t Proposing initial poses for {}...".format(obj.obj_name)
+        self.window.set_needs_layout()
+        annotation_scene = self._annotation_scene
+        pose_requested = obj.transform.copy()
+        if annotation_scene.scene_features is None:
+            scene_pcd = annotation_scene.annotation_scene
+            annotation_scene.scene_features = BackgroundTask(
+                lambda: self.pose_proposer.compute_scene_features(scene_pcd))
+
+        def propose():
+            try:
+                proposals = self.pose_proposer.propose(model_name, annotation_scene.scene_features.result())
+            except Exception as e:
+                print("[WARNING] Failed to propose poses:", e)
+                proposals = []
+            gui.Application.instance.post_to_main_thread(
+                self.window, lambda: self._on_pose_proposals(annotation_scene, obj, proposals, pose_requested))
+        threading.Thread(target=propose, daemon=True).start()
+
+    def _on_pose_proposals(self, annotation_scene, obj, proposals, pose_requested):
+        # the scene or the object may be gone by the time the proposals arrive
+        if annotation_scene is not self._annotation_scene or obj not in annotation_scene.get_objects():
+            return
+        if not proposals:
+            self._log.text = "\t No pose proposal found for {}.".format(obj.obj_name)
+            self.window.set_needs_layout()
+            return
+        # order the candidates by how well they explain the captured depth
+        ranked = self.score_pose_hypotheses(annotation_scene.get_objects().index(obj),
+                                            [pose for pose, _, _ in proposals])
+        proposals = [proposals[i] for i, _, _, _ in ranked]
+        # proposals are kept per object, so renaming (instance id) keeps them with their object
+        self._pose_proposals[obj] = [proposals, -1]
+        if not np.array_equal(obj.transform, pose_requested):
+            # the object was moved meanwhile; the move is kept and the proposals are offered on N
+            self._log.text = "\t {} pose proposals for {}, press N to apply.".format(len(proposals), obj.obj_name)
+            self.window.set_needs_layout()
+            return
+        self._show_pose_proposal(obj)
+
+    def _show_pose_proposal(self, obj):
+        proposals, idx = self._pose_proposals[obj]
+        idx = (idx + 1) % len(proposals)
+        self._pose_proposals[obj][1] = idx
+        pose, fitness, _ = proposals[idx]
+        pose_before = obj.transform.copy()
+        obj.set_transform(np.matmul(pose, np.linalg.inv(obj.transform)))
+        self._pose_history.record([(self._annotation_scene.get_objects().index(obj), pose_before, obj.transform)])
+        self._update_obj_pose(obj)
+        self._update_overlays()
+        self._mark_annotation_changed()
+        self._log.text = "\t Pose proposal {}/{} for {} (fitness {:.2f}).".format(
+            idx + 1, len(proposals), obj.obj_name, fitness)
+        self.window.set_needs_layout()
+
+    def _on_next_pose_proposal(self):
+        if self._annotation_scene is None or self._meshes_used.selected_index == -1:
+            self._on_error("Select an object first. (error at _on_next_pose_proposal)")
+            return
+        active_obj = self._annotation_scene.get_objects()[self._meshes_used.selected_index]
+        if active_obj not in self._pose_proposals:
+            self._on_error("No pose proposal for the selected object. (error at _on_next_pose_proposal)")
+            return
+        self._show_pose_proposal(active_obj)
 
     def _remove_mesh(self):
         if self._annotation_scene is None: 
             self._on_error("Select the file to annotate. (error at _remove_mesh)")
             return
+        if self._objects_loading:
+            self._on_error("The annotated objects are still loading. (error at _remove_mesh)")
+            return
         if not self._annotation_scene.get_objects():
             self._on_error("There is no object to remove. (error at _remove_mesh)")
             return
@@ -1425,49 +3332,51 @@ class AppWindow:
         self.window.set_needs_layout()
         meshes = self._annotation_scene.get_objects()
         active_obj = meshes[self._meshes_used.selected_index]
-        self._scene.scene.remove_geometry(active_obj.obj_name)  # remove mesh from scene
+        self._remove_obj_geometry(active_obj.obj_name)  # remove mesh from scene
         self._annotation_scene.remove_obj(self._meshes_used.selected_index)  # remove mesh from class list
+        self._pose_proposals.pop(active_obj, None)
+        self._pose_history.clear()  # the history refers to objects by index
         # update list after adding removing object
         meshes = self._annotation_scene.get_objects()  # get new list after deletion
         meshes = [i.obj_name for i in meshes]
         self._meshes_used.set_items(meshes)
-        if self.settings.show_mesh_names:
-            self._update_and_show_mesh_name()
-        self._annotation_changed = True
-
-    def _make_point_cloud(self, rgb_img, depth_img, cam_K):
-        # convert images to open3d types
-        rgb_img_o3d = o3d.geometry.Image(cv2.cvtColor(rgb_img, cv2.COLOR_BGR2RGB))
-        depth_img_o3d = o3d.geometry.Image(depth_img)
-
-        # convert image to point cloud
-        intrinsic = o3d.camera.PinholeCameraIntrinsic(rgb_img.shape[0], rgb_img.shape[1],
-                                                      cam_K[0, 0], cam_K[1, 1], cam_K[0, 2], cam_K[1, 2])
-        rgbd = o3d.geometry.RGBDImage.create_from_color_and_depth(rgb_img_o3d, depth_img_o3d,
-                                                                  depth_scale=1, convert_rgb_to_intensity=False)
-        pcd = o3d.geometry.PointCloud.create_from_rgbd_image(rgbd, intrinsic)
-
-        return pcd
+        self._update_overlays()
+        self._mark_annotation_changed()
 
     def _update_vis_img(self, rgb_img, diff_img, mask_img):
-        
-        width = 512
-        ratio = width / self.W
-        rgb_img = cv2.resize(rgb_img, (width, int(self.H*ratio)))
-        diff_img = cv2.resize(diff_img, (width, int(self.H*ratio)))
-        mask_img = cv2.resize(mask_img, (width, int(self.H*ratio)))
-        
-        vis_img = np.vstack([rgb_img, diff_img, mask_img])
-        _vis_img = o3d.geometry.Image(cv2.cvtColor(vis_img, cv2.COLOR_BGR2RGB))
-        self._vis_img_proxy.set_widget(gui.ImageWidget(_vis_img))
+        # the layers are cached at validation resolution (RGB order); panning and zooming only
+        # warps them into the panel-sized buffer, see _compose_vis_img
+        size = (self.W, self.H)
+        self._vis_layers = [cv2.cvtColor(cv2.resize(img, size) if img.shape[1::-1] != size else img,
+                                         cv2.COLOR_BGR2RGB) for img in [rgb_img, diff_img, mask_img]]
+        self._compose_vis_img()
         self._log.text = "\t Updated visualization images."
-        self.window.set_needs_layout()   
-
+        self.window.set_needs_layout()
 
+    def _compose_vis_img(self):
+        width = IMAGE_PANEL_WIDTH
+        height = int(self.H * width / self.W)
+        if self._vis_buffer is None or self._vis_buffer.shape != (3 * height, width, 3):
+            self._vis_buffer = np.zeros((3 * height, width, 3), dtype=np.uint8)
+        # zoom by scale_factor around (icx, icy), then scale from validation to panel resolution
+        ratio = width / self.W
+        scale_factor = 1.0 if self.scale_factor is None else self.scale_factor
+        icx, icy = (self.W / 2, self.H / 2) if self.scale_factor is None else (self.icx, self.icy)
+        M = np.array([[ratio * scale_factor, 0, ratio * ((self.W - 1) / 2 - scale_factor * icx)],
+                      [0, ratio * scale_factor, ratio * ((self.H - 1) / 2 - scale_factor * icy)]])
+        for i, layer in enumerate(self._vis_layers):
+            cv2.warpAffine(layer, M, (width, height), dst=self._vis_buffer[i * height:(i + 1) * height],
+                           flags=cv2.INTER_LINEAR)
+        self._vis_img_widget.update_image(o3d.geometry.Image(self._vis_buffer))
+
+    @tracer.traced()
     def scene_load(self, scenes_path, scene_num, image_num):
 
         self._annotation_changed = False
-        self._scene.scene.clear_geometry()
+        self._autosave_failed = False
+        self._objects_loading = False
+        self._scene_graph.clear()
+        self._pose_history.clear()
         geometry = None
 
         scene_path = os.path.join(scenes_path, f'{scene_num:06}')
@@ -1477,103 +3386,134 @@ class AppWindow:
             cam_K = self.scene_camera_info[str(image_num)]['cam_K']
             self.cam_K = np.array(cam_K).reshape((3, 3))
             depth_scale = self.scene_camera_info[str(image_num)]['depth_scale']
-        if image_num < 0:
-            self.rgb_path = os.path.join(scene_path, 'rgb', f'{image_num:07}.png')
-            self.depth_path = os.path.join(scene_path, 'depth', f'{image_num:07}.png')
-        else:
-            self.rgb_path = os.path.join(scene_path, 'rgb', f'{image_num:06}.png')
-            self.depth_path = os.path.join(scene_path, 'depth', f'{image_num:06}.png')
-        if not os.path.exists(self.rgb_path):
-            self.rgb_path = os.path.join(scene_path, 'rgb', f'{image_num:06}.jpg')
-
-        self.rgb_img = cv2.imread(self.rgb_path)
-        depth_img = cv2.imread(self.depth_path, -1)
-        depth_img = np.float32(depth_img) / 1000 * depth_scale
+        self.rgb_path = self.scenes.get_rgb_path(scene_num, image_num)
+        self.depth_path = self.scenes.get_image_path(scene_num, image_num, 'depth')
+        # image numbers of the opened scene from the dataset manifest, so image navigation and
+        # the quality counts follow scene changes
+        self.image_num_lists = self.scenes.get_image_nums(scene_num)
+        if image_num in self.image_num_lists:
+            self.current_image_idx = self.image_num_lists.index(image_num)
+
+        with tracer.span("decode images"):
+            self.rgb_img = cv2.imread(self.rgb_path)
+            depth_img = cv2.imread(self.depth_path, -1)
+            depth_img = np.float32(depth_img) / 1000 * depth_scale
         self.H, self.W, _ = self.rgb_img.shape
-        self.H, self.W = self.H // 4, self.W // 4
-        rgb_img = self.rgb_img.copy()
-        diff_img = np.zeros_like(rgb_img)
-        mask_img = np.zeros_like(rgb_img)
-        self._update_vis_img(rgb_img, diff_img, mask_img)
-
-        geometry = self._make_point_cloud(self.rgb_img, depth_img, self.cam_K)
-
-        if geometry is not None:
-            print("[Info] Successfully read scene ", scene_num)
-            if not geometry.has_normals():
-                geometry.estimate_normals()
-            geometry.normalize_normals()
-        else:
-            print("[WARNING] Failed to read points")
-        self._scene.scene.add_geometry("annotation_scene", geometry, self.settings.scene_material,
-                                        add_downsampled_copy_for_fast_rendering=True)
-        self.bounds = geometry.get_axis_aligned_bounding_box()
-        self._on_initial_viewpoint()
+        self.H, self.W = self.H // VALIDATION_DOWNSCALE, self.W // VALIDATION_DOWNSCALE
+        with tracer.span("update images"):
+            rgb_img = self.rgb_img.copy()
+            diff_img = np.zeros_like(rgb_img)
+            mask_img = np.zeros_like(rgb_img)
+            self._update_vis_img(rgb_img, diff_img, mask_img)
+
+        geometry = backproject_depth(self.rgb_img, depth_img, self.cam_K)
+        print("[Info] Successfully read scene ", scene_num)
+        with tracer.span("upload scene", num_points=len(geometry.points)):
+            self._scene_graph.add("annotation_scene", geometry.to_tensor(), self.settings.scene_material,
+                                  source=geometry)
+            self.bounds = geometry.get_axis_aligned_bounding_box()
+            self._on_initial_viewpoint()
 
         self._annotation_scene = AnnotationScene(geometry, scene_num, image_num)
+        self._annotation_scene.build_scene_tree_async()
+        self._build_scene_lod_async(self._annotation_scene)
+        self._pose_proposals = {}
+        self._annotation_scene.build_raycaster_async(depth_img, self.cam_K)
         self._meshes_used.set_items([])  # clear list from last loaded scene
 
-        # load values if an annotation already exists
-        scene_gt_path = os.path.join(self.scenes.scenes_path, f"{self._annotation_scene.scene_num:06}", 'scene_gt.json')
-        if os.path.exists(scene_gt_path):
-            with open(scene_gt_path) as scene_gt_file:
-                try:
-                    data = json.load(scene_gt_file)
-                except json.decoder.JSONDecodeError:
-                    self._on_error("Failed to load annotation file. (error at scene_load)")
-                    return
-                if str(image_num) in data.keys():
-                    scene_data = data[str(image_num)]
-                    active_meshes = list()
-                    sorted_scene_data = sorted(scene_data, key=lambda d: int(d['obj_id']))
-                    for i, obj in enumerate(sorted_scene_data):
-                        # add object to annotation_scene object
-                        obj_geometry = o3d.io.read_point_cloud(
-                            os.path.join(self.scenes.objects_path, 'obj_' + f"{int(obj['obj_id']):06}" + '.ply'))
-                        obj_geometry.points = o3d.utility.Vector3dVector(
-                            np.array(obj_geometry.points) / 1000)  # convert mm to meter
-                        obj_mesh = o3d.io.read_triangle_mesh(
-                            os.path.join(self.scenes.mesh_path, 'obj_' + f"{int(obj['obj_id']):06}" + '.obj'))
-                        obj_mesh.vertices = o3d.utility.Vector3dVector(
-                            np.array(obj_mesh.vertices) / 1000)  # convert mm to meter
-                        
-                        model_name = 'obj_' + f'{ + obj["obj_id"]:06}'
-                        if "inst_id" in obj.keys():
-                            obj_instance = int(obj["inst_id"])
-                        else:
-                            obj_instance = self._obj_instance_count(model_name, active_meshes)
-                        obj_name = model_name + '_' + str(obj_instance)
-                        translation = np.array(np.array(obj['cam_t_m2c']), dtype=np.float64) / 1000  # convert to meter
-                        orientation = np.array(np.array(obj['cam_R_m2c']), dtype=np.float64)
-                        transform = np.concatenate((orientation.reshape((3, 3)), translation.reshape(3, 1)), axis=1)
-                        transform_cam_to_obj = np.concatenate(
-                            (transform, np.array([0, 0, 0, 1]).reshape(1, 4)))  # homogeneous transform
-
-                        self._annotation_scene.add_obj(obj_geometry, obj_mesh, obj_name, obj_instance, transform_cam_to_obj)
-                        # obj_geometry.transform(transform_cam_to_obj)
-                        self._scene.scene.add_geometry(obj_name, obj_geometry, self.settings.annotation_obj_material,
-                                                        add_downsampled_copy_for_fast_rendering=True)
-                        active_meshes.append(obj_name)
-                    self._meshes_used.set_items(active_meshes)
+        if self._quality_index is None or self._quality_index.path != os.path.join(scene_path, QualityIndex.FILE_NAME):
+            self._quality_index = QualityIndex(scene_path)
 
+        # load values if an annotation already exists
+        self._scene_gt = {}
+        try:
+            with tracer.span("load scene_gt"):
+                self._scene_gt = self.scenes.load_scene_gt(scene_num)
+        except json.decoder.JSONDecodeError:
+            self._on_error("Failed to load annotation file. (error at scene_load)")
+            return
 
         self._update_scene_numbers()
-        self._validate_anno()
-
-        self.update_scene_obj_info_table()
-
         self._scene.set_view_controls(gui.SceneWidget.Controls.FLY)
         self._scene.set_view_controls(gui.SceneWidget.Controls.ROTATE_CAMERA)
 
-        current_scene_num = self.scene_num_lists[self.current_scene_idx]
+        if self._scene_gt.get(str(image_num)):
+            self._load_annotated_objects(self._scene_gt[str(image_num)])
+        else:
+            self._on_objects_loaded()
+
+    def _load_annotated_objects(self, scene_data):
+        # the models of all annotated objects are read concurrently on the model loader pool,
+        # each model once even if it has several instances. objects are added in obj_id order
+        # as their models arrive; the annotation is validated when all of them are in the scene
+        annotation_scene = self._annotation_scene
+        entries = []
+        active_meshes = list()
+        for obj in sorted(scene_data, key=lambda d: int(d['obj_id'])):
+            model_name = 'obj_' + f'{ + obj["obj_id"]:06}'
+            if "inst_id" in obj.keys():
+                obj_instance = int(obj["inst_id"])
+            else:
+                obj_instance = self._obj_instance_count(model_name, active_meshes)
+            obj_name = model_name + '_' + str(obj_instance)
+            active_meshes.append(obj_name)
+            entries.append((int(obj['obj_id']), obj_name, obj_instance, pose_from_gt(obj)))
+        added = [False] * len(entries)
+        pending = set(entry[0] for entry in entries)
+        self._objects_loading = True
+        self._log.text = "\t Loading {} objects...".format(len(entries))
+        self.window.set_needs_layout()
+
+        def on_model_loaded(obj_id, models):
+            if self._annotation_scene is not annotation_scene:
+                return  # another image was opened meanwhile
+            pending.discard(obj_id)
+            if isinstance(models, Exception):
+                self._on_error("Failed to load the model of obj_{:06}: {} (error at _load_annotated_objects)".format(
+                    obj_id, models))
+            else:
+                for i, (entry_obj_id, obj_name, obj_instance, transform) in enumerate(entries):
+                    if entry_obj_id != obj_id:
+                        continue
+                    index = sum(added[:i])  # keep the obj_id order of the list
+                    annotation_scene.add_obj(models[0], models[1], obj_name, obj_instance, transform, index=index)
+                    self._pose_history.clear()  # the inserted object shifts the indices
+                    self._add_obj_geometry(annotation_scene.get_objects()[index], self.settings.annotation_obj_material)
+                    added[i] = True
+                self._meshes_used.set_items([obj.obj_name for obj in annotation_scene.get_objects()])
+                self.window.post_redraw()
+            if not pending:
+                self._objects_loading = False
+                self._on_objects_loaded()
+
+        def load(obj_id):
+            try:
+                with tracer.span("load model", obj_id=obj_id):
+                    models = (self.scenes.load_obj_geometry(obj_id), self.scenes.load_obj_mesh(obj_id))
+            except Exception as e:
+                models = e
+            gui.Application.instance.post_to_main_thread(self.window, lambda: on_model_loaded(obj_id, models))
+
+        for obj_id in sorted(pending):
+            self._model_loader.submit(load, obj_id)
+
+    def _on_objects_loaded(self):
+        self._validate_anno()
+        self.update_scene_obj_info_table()
+        self._log.text = "\t Loaded the annotation of {} objects.".format(len(self._annotation_scene.get_objects()))
+        self.window.set_needs_layout()
 
     def update_obj_list(self):
         model_names = self.load_model_names()
         max_obj_id = max([int(x.split('_')[-1]) for x in model_names])
         self._meshes_available.set_limits(1, max_obj_id)
+        if self.pose_proposer is None or self.pose_proposer.objects_path != self.scenes.objects_path:
+            self.pose_proposer = PoseProposer(self.scenes.objects_path)
+        if self.settings.propose_pose:
+            self.pose_proposer.precompute(model_names)
 
     def load_model_names(self):
-        self.obj_ids = sorted([int(os.path.basename(x)[5:-4]) for x in glob.glob(self.scenes.objects_path + self.spl + '*.ply')])
+        self.obj_ids = self.scenes.get_obj_ids()
         model_names = ['obj_' + f'{ + obj_id:06}' for obj_id in self.obj_ids]
         return model_names
 
@@ -1586,7 +3526,8 @@ class AppWindow:
 
         intrinsic = np.array(self.cam_K).reshape((3, 3))
         extrinsic = np.eye(4)
-        self._scene.setup_camera(intrinsic, extrinsic, int(self.W*4), int(self.H*4), self.bounds)
+        self._scene.setup_camera(intrinsic, extrinsic, int(self.W * VALIDATION_DOWNSCALE),
+                                 int(self.H * VALIDATION_DOWNSCALE), self.bounds)
         center = [0, 0, 1]  # look_at target
         eye = [0, 0, -0.5]  # camera position
         up = [0, -1, 0]  # camera orientation
@@ -1596,6 +3537,12 @@ class AppWindow:
         self._scene.set_view_controls(gui.SceneWidget.Controls.ROTATE_CAMERA)
 
     def _check_changes(self):
+        if self._autosave_due() and not self._autosave_failed:
+            # saved in the background, navigation goes on without waiting for it
+            self._autosave()
+            return False
+        if self._annotation_changed and self.settings.autosave and self._edit_count == self._autosave_count:
+            return False  # the autosave of the last edit is still being written
         if self._annotation_changed:
             self._on_error("Annotation has been changed. Save the annotation first. (error at _check_changes)")
             self._annotation_changed = False
@@ -1616,6 +3563,7 @@ class AppWindow:
         self.window.set_needs_layout()
         self.current_scene_idx += 1
         self.scene_load(self.scenes.scenes_path, self.scene_num_lists[self.current_scene_idx], -4)  # open next scene on the first image
+        self._update_progress()
 
     def _on_previous_scene(self):
         if self._check_changes():
@@ -1630,6 +3578,7 @@ class AppWindow:
         self._log.text = "\t Moving to the previous scene."
         self.window.set_needs_layout()
         self.scene_load(self.scenes.scenes_path, self.scene_num_lists[self.current_scene_idx], -4)  # open next scene on the first image
+        self._update_progress()
 
     def _on_change_image(self):
         if self._check_changes():
@@ -1645,10 +3594,7 @@ class AppWindow:
         self.window.set_needs_layout()
         self.current_image_idx = self.image_num_lists.index(self.image_number_edit.int_value)
         self.scene_load(self.scenes.scenes_path, self._annotation_scene.scene_num, self.image_num_lists[self.current_image_idx])
-        self._progress.value = (self.current_image_idx + 1) / len(self.image_num_lists) # 25% complete
-        self._progress_str.text = "Progress: {:.1f}% [{}/{}]".format(
-            100 * (self.current_image_idx + 1) / len(self.image_num_lists), 
-            self.current_image_idx + 1, len(self.image_num_lists))
+        self._update_progress()
 
     def _on_next_image(self):
         if self._check_changes():
@@ -1663,10 +3609,7 @@ class AppWindow:
         self.window.set_needs_layout()
         self.current_image_idx += 1
         self.scene_load(self.scenes.scenes_path, self._annotation_scene.scene_num, self.image_num_lists[self.current_image_idx])
-        self._progress.value = (self.current_image_idx + 1) / len(self.image_num_lists) # 25% complete
-        self._progress_str.text = "Progress: {:.1f}% [{}/{}]".format(
-            100 * (self.current_image_idx + 1) / len(self.image_num_lists), 
-            self.current_image_idx + 1, len(self.image_num_lists))
+        self._update_progress()
 
     def _on_previous_image(self):
         if self._check_changes():
@@ -1681,11 +3624,43 @@ class AppWindow:
         self.window.set_needs_layout()
         self.current_image_idx -= 1
         self.scene_load(self.scenes.scenes_path, self._annotation_scene.scene_num, self.image_num_lists[self.current_image_idx])
-        self._progress.value = (self.current_image_idx + 1) / len(self.image_num_lists) 
+        self._update_progress()
+
+    def _update_progress(self):
+        self._progress.value = (self.current_image_idx + 1) / len(self.image_num_lists)
         self._progress_str.text = "Progress: {:.1f}% [{}/{}]".format(
-            100 * (self.current_image_idx + 1) / len(self.image_num_lists), 
+            100 * (self.current_image_idx + 1) / len(self.image_num_lists),
             self.current_image_idx + 1, len(self.image_num_lists))
 
+    def _on_incomplete_image(self, step):
+        # moves to the closest image in the step direction that is not validated as complete
+        if self._check_changes():
+            return
+        if self.current_image_idx is None:
+            self._on_error("Select the annotation object file. (error at _on_incomplete_image)")
+            return
+        image_idx = self.current_image_idx + step
+        while 0 <= image_idx < len(self.image_num_lists):
+            image_key = str(self.image_num_lists[image_idx])
+            if image_key not in self._scene_gt or \
+                    not self._quality_index.is_complete(image_key, self._scene_gt[image_key]):
+                break
+            image_idx += step
+        else:
+            self._on_error("No incomplete image left in this direction. (error at _on_incomplete_image)")
+            return
+        self._log.text = "\t Moving to the {} incomplete image.".format("next" if step > 0 else "previous")
+        self.window.set_needs_layout()
+        self.current_image_idx = image_idx
+        self.scene_load(self.scenes.scenes_path, self._annotation_scene.scene_num, self.image_num_lists[self.current_image_idx])
+        self._update_progress()
+
+    def _on_next_incomplete_image(self):
+        self._on_incomplete_image(1)
+
+    def _on_previous_incomplete_image(self):
+        self._on_incomplete_image(-1)
+
 
 def main():
 
@@ -0,0 +1,190 @@
+# Headless annotation quality report of a whole dataset split.
+# Runs the depth difference check of the annotator on every annotated image
+# and writes a per-object report (csv/json). Interrupted runs are resumed.
+#
+# python quality_report.py --dataset_path GraspClutter6D_root --split scenes --output_dir quality_report
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from object_pose_annotator import (DEPTH_OK_DELTA, VALIDATION_DOWNSCALE, Dataset, camera_idx_to_thresh_factor,
+                                   evaluate_anno_quality, is_depth_diff_ok, make_validation_renderer, pose_from_gt)
+
+CSV_FIELDS = ["scene_id", "image_id", "camera_idx", "obj_id", "inst_id", "depth_diff_mean",
+              "ratio_delta_1", "ratio_delta_2", "num_valid_px", "ok_delta", "status"]
+
+# per worker process state
+_dataset = None
+_renderer_backend = None
+_meshes = {}
+_renderers = {}
+
+
+def _init_worker(dataset_path, split, renderer_backend):
+    global _dataset, _renderer_backend
+    _dataset = Dataset(dataset_path, split)
+    _renderer_backend = renderer_backend
+
+
+def _get_mesh(obj_id):
+    if obj_id not in _meshes:
+        _meshes[obj_id] = _dataset.load_obj_mesh(obj_id)
+    return _meshes[obj_id]
+
+
+def _get_renderer(width, height, intrinsic):
+    key = (width, height, tuple(intrinsic.reshape(-1)))
+    if key not in _renderers:
+        _renderers[key] = make_validation_renderer(width, height, intrinsic, _renderer_backend)
+    return _renderers[key]
+
+
+def evaluate_image(task):
+    scene_num, image_num, camera_idx, cam_info, gt_objs = task
+    depth_img = cv2.imread(_dataset.get_image_path(scene_num, image_num, 'depth'), -1)
+    if depth_img is None:
+        raise IOError("Failed to read the depth of scene {} image {}".format(scene_num, image_num))
+    height, width = depth_img.shape[0] // VALIDATION_DOWNSCALE, depth_img.shape[1] // VALIDATION_DOWNSCALE
+    depth_img = cv2.resize(depth_img, (width, height), interpolation=cv2.INTER_NEAREST)
+    depth_captured = np.float32(depth_img) * cam_info["depth_scale"]
+    intrinsic = np.array(cam_info["cam_K"]).reshape((3, 3)) / VALIDATION_DOWNSCALE
+    intrinsic[2, 2] = 1
+
+    meshes = [_get_mesh(int(obj["obj_id"])) for obj in gt_objs]
+    poses = [pose_from_gt(obj) for obj in gt_objs]
+    results = evaluate_anno_quality(_get_renderer(width, height, intrinsic), meshes, poses, depth_captured)
+
+    ok_delta = DEPTH_OK_DELTA * camera_idx_to_thresh_factor[camera_idx % 4]
+    objects = []
+    inst_counts = {}
+    for obj, result in zip(gt_objs, results):
+        obj_id = int(obj["obj_id"])
+        inst_counts[obj_id] = inst_counts.get(obj_id, 0) + 1
+        result["obj_id"] = obj_id
+        result["inst_id"] = int(obj.get("inst_id", inst_counts[obj_id]))
+        result["status"] = "Complete" if is_depth_diff_ok(result["depth_diff_mean"], camera_idx) else "Incomplete"
+        objects.append(result)
+    return {"scene_id": scene_num, "image_id": image_num, "camera_idx": camera_idx % 4,
+            "ok_delta": ok_delta, "objects": objects}
+
+
+def load_done(jsonl_path):
+    # (scene, image) pairs of a previous run. a partially written last line of an
+    # interrupted run is dropped so that image is evaluated again.
+    done = set()
+    if not os.path.exists(jsonl_path):
+        return done
+    valid_size = 0
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            try:
+                result = json.loads(line.decode("utf-8"))
+            except ValueError:
+                break
+            done.add((result["scene_id"], result["image_id"]))
+            valid_size += len(line)
+    with open(jsonl_path, "ab") as f:
+        f.truncate(valid_size)
+    return done
+
+
+def iter_tasks(dataset, scene_nums, done):
+    for scene_num in scene_nums:
+        scene_camera = dataset.load_scene_camera(scene_num)
+        scene_gt = dataset.load_scene_gt(scene_num)
+        # the camera index follows the image order, as in the annotator
+        for image_idx, image_num in enumerate(sorted(int(x) for x in scene_camera.keys())):
+            gt_objs = scene_gt.get(str(image_num), [])
+            if not gt_objs or (scene_num, image_num) in done:
+                continue
+            yield scene_num, image_num, image_idx, scene_camera[str(image_num)], gt_objs
+
+
+def write_reports(jsonl_path, output_dir):
+    rows = []
+    num_images = 0
+    with open(jsonl_path) as f:
+        for line in f:
+            result = json.loads(line)
+            num_images += 1
+            for obj in result["objects"]:
+                row = {key: result[key] for key in ["scene_id", "image_id", "camera_idx", "ok_delta"]}
+                row.update({key: obj[key] for key in CSV_FIELDS if key in obj})
+                if not np.isfinite(row["depth_diff_mean"]):
+                    row["depth_diff_mean"] = None  # object not visible
+                rows.append(row)
+    rows.sort(key=lambda r: (r["scene_id"], r["image_id"], r["obj_id"], r["inst_id"]))
+
+    with open(os.path.join(output_dir, "quality_report.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    num_complete = sum(row["status"] == "Complete" for row in rows)
+    summary = {"num_images": num_images, "num_objects": len(rows), "num_complete": num_complete}
+    with open(os.path.join(output_dir, "quality_report.json"), "w") as f:
+        json.dump({"summary": summary, "objects": rows}, f)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless annotation quality report of a dataset split")
+    parser.add_argument("--dataset_path", required=True, help="dataset root (contains the split and models_eval)")
+    parser.add_argument("--split", default="scenes", help="split directory with the scenes")
+    parser.add_argument("--output_dir", default="quality_report")
+    parser.add_argument("--scenes", type=int, nargs="*", help="only evaluate these scene ids")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--renderer", choices=["gl", "cpu"], default=os.environ.get("POSE_ANNO_RENDERER", "gl"),
+                        help="depth renderer, cpu does not need an OpenGL/EGL context")
+    args = parser.parse_args()
+
+    dataset = Dataset(args.dataset_path, args.split)
+    scene_nums = args.scenes if args.scenes else dataset.get_scene_nums()
+    os.makedirs(args.output_dir, exist_ok=True)
+    jsonl_path = os.path.join(args.output_dir, "quality_report.jsonl")
+    done = load_done(jsonl_path)
+    if done:
+        print("[Info] Resuming, {} images already evaluated".format(len(done)))
+
+    num_evaluated = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(args.dataset_path, args.split, args.renderer)) as executor, \
+            open(jsonl_path, "a") as jsonl_file:
+
+        def collect(futures):
+            nonlocal num_evaluated
+            for future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print("[WARNING]", e)
+                    continue
+                jsonl_file.write(json.dumps(result) + "\n")
+                jsonl_file.flush()
+                num_evaluated += 1
+                if num_evaluated % 100 == 0:
+                    print("[Info] Evaluated {} images".format(num_evaluated))
+
+        # keep a bounded number of images in flight
+        pending = set()
+        for task in iter_tasks(dataset, scene_nums, done):
+            if len(pending) >= 4 * args.workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(executor.submit(evaluate_image, task))
+        collect(pending)
+
+    summary = write_reports(jsonl_path, args.output_dir)
+    print("[Info] {} images, {}/{} objects complete. Report saved to {}".format(
+        summary["num_images"], summary["num_complete"], summary["num_objects"], args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# AnnotationEngine behind a localhost AnnotationService, on a small synthetic dataset
+#
+# python -m pytest tests
+
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from annotation_server import AnnotationClient, AnnotationService, serve_in_thread  # noqa: E402
+from benchmark import generate_dataset  # noqa: E402
+from object_pose_annotator import pose_from_gt  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def dataset_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dataset"))
+    generate_dataset(path, num_images=2, num_objects=3, width=160, height=120, model_points=1000)
+    return path
+
+
+@pytest.fixture(scope="module")
+def client(dataset_path):
+    service = AnnotationService(dataset_path, "scenes", num_workers=0, renderer_backend="cpu")
+    server, url = serve_in_thread(service)
+    yield AnnotationClient(url)
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def load_scene_gt(dataset_path):
+    with open(os.path.join(dataset_path, "scenes", "000001", "scene_gt.json")) as f:
+        return json.load(f)
+
+
+def test_health(client):
+    assert client.health()
+
+
+def test_open_image(client, dataset_path):
+    objects = client.open_image(scene_num=1, image_num=0)
+    gt_objs = sorted(load_scene_gt(dataset_path)["0"], key=lambda d: d["obj_id"])
+    assert [obj["obj_id"] for obj in objects] == [gt["obj_id"] for gt in gt_objs]
+    for obj, gt in zip(objects, gt_objs):
+        np.testing.assert_allclose(obj["pose"], pose_from_gt(gt), atol=1e-6)
+
+
+def test_copy_annotation(client, dataset_path):
+    # the generated poses of all images are consistent with the cameras
+    scene_gt = load_scene_gt(dataset_path)
+    gt_objs = client.copy_annotation(scene_num=1, source_image_num=0, target_image_num=1)
+    for copied, gt in zip(gt_objs, scene_gt["1"]):
+        np.testing.assert_allclose(pose_from_gt(copied), pose_from_gt(gt), atol=1e-4)
+    objects = client.get_objects(scene_num=1, image_num=1)
+    assert len(objects) == len(scene_gt["1"])
+
+
+def test_validate(client):
+    results = client.validate(scene_num=1, image_num=1)
+    assert len(results) == 3
+    assert all(result["status"] == "Complete" for result in results)
+
+
+def test_move_and_save(client, dataset_path):
+    name = client.open_image(scene_num=1, image_num=0)[0]["name"]
+    pose_before = np.array(client.get_objects(scene_num=1, image_num=0)[0]["pose"])
+    pose = np.array(client.move(scene_num=1, image_num=0, name=name, translation=[0.01, 0, 0]))
+    np.testing.assert_allclose(pose[:3, 3], pose_before[:3, 3] + [0.01, 0, 0], atol=1e-9)
+    np.testing.assert_allclose(pose[:3, :3], pose_before[:3, :3], atol=1e-9)
+
+    client.save(scene_num=1, image_num=0)
+    saved = [gt for gt in load_scene_gt(dataset_path)["0"] if gt["inst_id"] == 1]
+    assert any(np.allclose(pose_from_gt(gt), pose, atol=1e-6) for gt in saved)
+    reopened = client.open_image(scene_num=1, image_num=0, reload=True)
+    np.testing.assert_allclose([obj["pose"] for obj in reopened if obj["name"] == name][0], pose, atol=1e-6)
+
+
+def test_unknown_method(client):
+    request = urllib.request.Request(client.url + "/rpc", data=json.dumps({"method": "shutdown"}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(request, timeout=10)
+    assert e.value.code == 400
+    with pytest.raises(AttributeError):
+        client.shutdown
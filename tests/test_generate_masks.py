@@ -0,0 +1,64 @@
+# BOP masks and scene_gt_info.json entries of generate_masks on a small synthetic dataset,
+# checked against the depths of every object rendered alone
+
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_masks  # noqa: E402
+from benchmark import generate_dataset  # noqa: E402
+from object_pose_annotator import CPURenderer, compose_depths, pose_from_gt  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def dataset_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dataset"))
+    generate_dataset(path, num_images=1, num_objects=4, width=160, height=120, model_points=1000)
+    generate_masks._init_worker(path, "scenes", "cpu")
+    return path
+
+
+def load_scene_json(dataset_path, file_name):
+    with open(os.path.join(dataset_path, "scenes", "000001", file_name)) as f:
+        return json.load(f)
+
+
+def test_masks_match_per_object_depths(dataset_path):
+    cam_info = load_scene_json(dataset_path, "scene_camera.json")["0"]
+    gt_objs = load_scene_json(dataset_path, "scene_gt.json")["0"]
+    gt_info = generate_masks.generate_image_masks((1, 0, cam_info, gt_objs, 0))
+
+    renderer = CPURenderer(160, 120, np.array(cam_info["cam_K"]).reshape((3, 3)))
+    depths = renderer.render_depths([generate_masks._get_mesh(int(obj["obj_id"])) for obj in gt_objs],
+                                    [pose_from_gt(obj) for obj in gt_objs])
+    _, labels = compose_depths(depths, 120, 160)
+    scene_path = os.path.join(dataset_path, "scenes", "000001")
+    assert len(gt_info) == len(gt_objs)
+    for k, info in enumerate(gt_info):
+        mask = cv2.imread(os.path.join(scene_path, "mask", "000000_{:06}.png".format(k)), -1) > 0
+        mask_visib = cv2.imread(os.path.join(scene_path, "mask_visib", "000000_{:06}.png".format(k)), -1) > 0
+        np.testing.assert_array_equal(mask, depths[k] > 0)
+        np.testing.assert_array_equal(mask_visib, labels == k + 1)
+        assert info["px_count_all"] == mask.sum() > 0
+        assert info["px_count_visib"] == mask_visib.sum()
+        assert info["px_count_valid"] <= info["px_count_all"]
+        assert 0 < info["visib_fract"] <= 1
+        ys, xs = mask.nonzero()
+        assert info["bbox_obj"] == [xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1]
+
+
+def test_stale_masks_are_removed(dataset_path):
+    cam_info = load_scene_json(dataset_path, "scene_camera.json")["0"]
+    gt_objs = load_scene_json(dataset_path, "scene_gt.json")["0"]
+    generate_masks.generate_image_masks((1, 0, cam_info, gt_objs, 0))
+    gt_info = generate_masks.generate_image_masks((1, 0, cam_info, gt_objs[:2], len(gt_objs)))
+    assert len(gt_info) == 2
+    for mask_dir in ["mask", "mask_visib"]:
+        names = sorted(os.listdir(os.path.join(dataset_path, "scenes", "000001", mask_dir)))
+        assert names == ["000000_000000.png", "000000_000001.png"]
@@ -0,0 +1,107 @@
+# ICP refinement: single-object point-to-plane ICP, the joint occlusion-aware solver and
+# refine_objects / is_refine_accepted on synthetic box surfaces
+
+import os
+import sys
+
+import numpy as np
+import open3d as o3d
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from object_pose_annotator import (AnnotationScene, is_refine_accepted, joint_icp_point_to_plane,  # noqa: E402
+                                   refine_objects)
+
+
+def box_cloud(size=(0.05, 0.04, 0.03), num_points=4000, seed=0):
+    # points and outward normals on the surface of a box (meter) centered at the origin
+    mesh = o3d.geometry.TriangleMesh.create_box(*size)
+    mesh.translate(-np.array(size) / 2)
+    mesh.compute_triangle_normals()
+    np.random.seed(seed)  # sample_points_uniformly draws from the global generator
+    pcd = mesh.sample_points_uniformly(num_points, use_triangle_normal=True)
+    return np.asarray(pcd.points), np.asarray(pcd.normals)
+
+
+def pose(rotvec=(0, 0, 0), translation=(0, 0, 0)):
+    transform = np.identity(4)
+    transform[:3, :3] = o3d.geometry.get_rotation_matrix_from_axis_angle(np.array(rotvec, dtype=np.float64))
+    transform[:3, 3] = translation
+    return transform
+
+
+def apply(transform, points):
+    return points @ transform[:3, :3].T + transform[:3, 3]
+
+
+def perturbation(seed):
+    rng = np.random.default_rng(seed)
+    return pose(rng.normal(0, np.radians(1), 3), rng.uniform(-0.002, 0.002, 3))
+
+
+def test_joint_icp_converges_for_two_objects():
+    points, normals = box_cloud()
+    placements = [pose(translation=(-0.035, 0, 0.5)), pose((0, 0, 0.3), (0.035, 0, 0.5))]
+    target_points = np.vstack([apply(placement, points) for placement in placements])
+    target_normals = np.vstack([normals @ placement[:3, :3].T for placement in placements])
+    # models start slightly off their scene surfaces (perturbed in the model frame)
+    starts = [placements[0] @ perturbation(1), placements[1] @ perturbation(2)]
+    transformations, fitness, inlier_rmse = joint_icp_point_to_plane(
+        [apply(start, points) for start in starts], target_points, target_normals)
+
+    for transformation, start, placement in zip(transformations, starts, placements):
+        refined = transformation @ start
+        np.testing.assert_allclose(refined[:3, 3], placement[:3, 3], atol=5e-4)
+        np.testing.assert_allclose(refined[:3, :3], placement[:3, :3], atol=1e-2)
+    assert np.all(fitness > 0.9)
+    assert np.all(inlier_rmse < 1e-3)
+
+
+def test_joint_icp_assigns_each_scene_point_to_one_object():
+    # the scene only shows object A. object B is a copy of A 2 mm off it: each scene point
+    # is nearer to A's model, so B may not claim (and be pulled onto) any of them
+    points, normals = box_cloud()
+    placement = pose(translation=(0, 0, 0.5))
+    target_points, target_normals = apply(placement, points), normals @ placement[:3, :3].T
+    model_a = apply(placement, points)
+    model_b = apply(pose(translation=(0.002, 0.001, 0)) @ placement, points)
+
+    transformations, fitness, _ = joint_icp_point_to_plane([model_a, model_b], target_points, target_normals)
+    assert fitness[0] > 0.9
+    assert fitness[1] == 0
+    np.testing.assert_allclose(transformations[1], np.identity(4))
+    np.testing.assert_allclose(transformations[0], np.identity(4), atol=1e-6)
+
+
+def make_scene(placements, points, normals):
+    scene = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(
+        np.vstack([apply(placement, points) for placement in placements])))
+    scene.normals = o3d.utility.Vector3dVector(np.vstack([normals @ placement[:3, :3].T for placement in placements]))
+    return AnnotationScene(scene, 1, 0)
+
+
+@pytest.mark.parametrize("joint", [False, True])
+def test_refine_objects_accepts_and_rejects(joint):
+    points, normals = box_cloud()
+    placement = pose(translation=(0, 0, 0.5))
+    annotation_scene = make_scene([placement], points, normals)
+    model = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    # one object near its scene surface, one far away from any scene point
+    annotation_scene.add_obj(model, None, "obj_000001_1", 1, placement @ perturbation(3))
+    annotation_scene.add_obj(model, None, "obj_000001_2", 2, pose(translation=(0.5, 0, 0.5)))
+    near, far = annotation_scene.get_objects()
+
+    (transformation, fitness, _), (far_transformation, far_fitness, _) = \
+        refine_objects(annotation_scene, [near, far], joint)
+    assert is_refine_accepted(transformation, fitness)
+    near.set_transform(transformation)
+    np.testing.assert_allclose(near.transform[:3, 3], placement[:3, 3], atol=5e-4)
+    assert far_fitness == 0
+    assert not is_refine_accepted(far_transformation, far_fitness)
+
+
+def test_is_refine_accepted_rejects_large_moves():
+    assert is_refine_accepted(pose(translation=(0.01, 0, 0)), 0.5)
+    assert not is_refine_accepted(pose(translation=(0.2, 0.1, 0)), 0.9)
+    assert not is_refine_accepted(np.identity(4), 0)
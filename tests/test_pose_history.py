@@ -0,0 +1,120 @@
+# PoseHistory: undo/redo, grouped changes, the ring buffer wrap-around, coalescing of
+# key-repeat moves and undo of one object
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import object_pose_annotator  # noqa: E402
+from object_pose_annotator import PoseHistory  # noqa: E402
+
+
+def pose(x):
+    result = np.identity(4)
+    result[0, 3] = x
+    return result
+
+
+def positions(restore):
+    return [(obj_idx, p[0, 3]) for obj_idx, p in restore]
+
+
+def test_undo_redo():
+    history = PoseHistory(capacity=8)
+    assert not history.can_undo() and not history.can_redo()
+    history.record([(0, pose(0), pose(1))])
+    history.record([(1, pose(0), pose(2))])
+    assert positions(history.undo()) == [(1, 0)]
+    assert positions(history.undo()) == [(0, 0)]
+    assert history.undo() == []
+    assert positions(history.redo()) == [(0, 1)]
+    assert history.can_undo() and history.can_redo()
+    # a new change discards the redo rows
+    history.record([(2, pose(0), pose(3))])
+    assert not history.can_redo()
+    assert positions(history.undo()) == [(2, 0)]
+    assert positions(history.undo()) == [(0, 0)]
+    assert not history.can_undo()
+
+
+def test_group_is_undone_and_redone_together():
+    history = PoseHistory(capacity=8)
+    history.record([(0, pose(0), pose(1))])
+    history.record([(0, pose(1), pose(2)), (1, pose(0), pose(3)), (2, pose(0), pose(4))])
+    assert sorted(positions(history.undo())) == [(0, 1), (1, 0), (2, 0)]
+    assert sorted(positions(history.redo())) == [(0, 2), (1, 3), (2, 4)]
+    history.undo()
+    assert positions(history.undo()) == [(0, 0)]
+
+
+def test_ring_wrap_around_drops_the_oldest_groups():
+    history = PoseHistory(capacity=4)
+    for i in range(6):
+        history.record([(i, pose(i), pose(i + 1))])
+    assert [positions(history.undo()) for _ in range(4)] == [[(5, 5)], [(4, 4)], [(3, 3)], [(2, 2)]]
+    assert not history.can_undo()
+    assert [positions(history.redo()) for _ in range(4)] == [[(2, 3)], [(3, 4)], [(4, 5)], [(5, 6)]]
+    assert not history.can_redo()
+
+    # a group is dropped as a whole, never in part
+    history = PoseHistory(capacity=4)
+    history.record([(0, pose(0), pose(1)), (1, pose(0), pose(1)), (2, pose(0), pose(1))])
+    history.record([(3, pose(0), pose(1)), (4, pose(0), pose(1))])
+    assert sorted(positions(history.undo())) == [(3, 0), (4, 0)]
+    assert not history.can_undo()
+
+
+def test_group_larger_than_the_history_is_rejected():
+    history = PoseHistory(capacity=2)
+    history.record([(0, pose(0), pose(1))])
+    with pytest.raises(ValueError):
+        history.record([(i, pose(0), pose(1)) for i in range(3)])
+    # the history is left unchanged
+    assert positions(history.undo()) == [(0, 0)]
+    assert not history.can_undo()
+    history.record([])
+    assert not history.can_undo()
+
+
+def test_key_repeat_moves_are_coalesced(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(object_pose_annotator.time, "monotonic", lambda: now[0])
+    history = PoseHistory(capacity=8)
+    for i in range(5):
+        history.record([(0, pose(i), pose(i + 1))], key=("move", 0))
+        now[0] += 0.1
+    # another key starts a new step
+    history.record([(1, pose(0), pose(1))], key=("move", 1))
+    history.record([(1, pose(1), pose(2))], key=("move", 1))
+    # a pause longer than the coalesce time starts a new step
+    now[0] += object_pose_annotator.POSE_HISTORY_COALESCE_TIME + 0.1
+    history.record([(1, pose(2), pose(3))], key=("move", 1))
+    assert positions(history.undo()) == [(1, 2)]
+    assert positions(history.undo()) == [(1, 0)]
+    assert positions(history.undo()) == [(0, 0)]
+    assert not history.can_undo()
+    assert positions(history.redo()) == [(0, 5)]
+
+    # records after an undo are never merged into the undone step
+    history.record([(0, pose(5), pose(6))], key=("move", 0))
+    assert positions(history.undo()) == [(0, 5)]
+    assert positions(history.undo()) == [(0, 0)]
+
+
+def test_undo_object():
+    history = PoseHistory(capacity=8)
+    history.record([(0, pose(0), pose(1))])
+    history.record([(1, pose(0), pose(5))])
+    history.record([(0, pose(1), pose(2))])
+    assert positions(history.undo_object(0, pose(2))) == [(0, 1)]
+    assert positions(history.undo_object(0, pose(1))) == [(0, 0)]
+    assert history.undo_object(0, pose(0)) == []
+    # the other object's change is untouched
+    assert positions(history.undo_object(1, pose(5))) == [(1, 0)]
+    # undo_object is a change of its own, so undo brings the pose back
+    assert positions(history.undo()) == [(1, 5)]
+    assert positions(history.undo()) == [(0, 1)]
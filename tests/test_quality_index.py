@@ -0,0 +1,68 @@
+# QualityIndex: completeness of validated images and invalidation by the pose hash of
+# their scene_gt.json entry
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from object_pose_annotator import QualityIndex  # noqa: E402
+
+
+def gt_obj(obj_id, t_z=500.0):
+    return {"obj_id": obj_id, "inst_id": 1, "cam_R_m2c": [1, 0, 0, 0, 1, 0, 0, 0, 1], "cam_t_m2c": [0, 0, t_z]}
+
+
+def validated(*statuses):
+    return [{"name": "obj_{:06}_1".format(i + 1), "depth_diff_mean": 1.0, "status": status}
+            for i, status in enumerate(statuses)]
+
+
+def test_complete_only_if_every_object_is_complete(tmp_path):
+    index = QualityIndex(str(tmp_path))
+    gt_objs = [gt_obj(1), gt_obj(2)]
+    index.update(0, gt_objs, validated("Complete", "Complete"), 2)
+    index.update(1, gt_objs, validated("Complete", "Incomplete"), 2)
+    # an object of the image was not validated
+    index.update(2, gt_objs, validated("Complete"), 2)
+    index.update(3, [], [], 0)
+    assert index.is_complete(0, gt_objs)
+    assert not index.is_complete(1, gt_objs)
+    assert not index.is_complete(2, gt_objs)
+    assert not index.is_complete(3, [])
+    assert not index.is_complete(4, gt_objs)
+    assert index.num_complete() == 1
+
+
+def test_pose_change_invalidates_the_entry(tmp_path):
+    index = QualityIndex(str(tmp_path))
+    gt_objs = [gt_obj(1), gt_obj(2)]
+    index.update(0, gt_objs, validated("Complete", "Complete"), 2)
+    moved = [gt_obj(1), gt_obj(2, t_z=501.0)]
+    assert index.get(0, moved) is None
+    assert not index.is_complete(0, moved)
+    assert not index.is_complete(0, gt_objs[:1])
+    # keys are image numbers as in scene_gt.json, given as int or str
+    assert index.is_complete("0", gt_objs)
+    # num_complete does not check the hashes
+    assert index.num_complete() == 1
+
+
+def test_entries_persist_and_merge(tmp_path):
+    first, second = QualityIndex(str(tmp_path)), QualityIndex(str(tmp_path))
+    first.update(0, [gt_obj(1)], validated("Complete"), 1)
+    # another annotator of the scene keeps the entries written since it read the index
+    second.update(1, [gt_obj(2)], validated("Complete"), 1)
+    reloaded = QualityIndex(str(tmp_path))
+    assert reloaded.is_complete(0, [gt_obj(1)])
+    assert reloaded.is_complete(1, [gt_obj(2)])
+    assert reloaded.num_complete() == 2
+
+
+def test_corrupt_index_is_ignored(tmp_path):
+    with open(os.path.join(str(tmp_path), QualityIndex.FILE_NAME), "w") as f:
+        f.write("{")
+    index = QualityIndex(str(tmp_path))
+    assert index.entries == {}
+    index.update(0, [gt_obj(1)], validated("Complete"), 1)
+    assert QualityIndex(str(tmp_path)).is_complete(0, [gt_obj(1)])
@@ -0,0 +1,90 @@
+# CPURenderer rasterization (footprint, depth and instance labels of known planes) and the
+# occlusion order of compose_depths
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from object_pose_annotator import CPURenderer, MeshArrays, compose_depths  # noqa: E402
+
+WIDTH, HEIGHT = 160, 120
+# principal point on a pixel corner, so plane edges fall between pixel centers
+INTRINSIC = np.array([[100.0, 0.0, 80.5], [0.0, 100.0, 60.5], [0.0, 0.0, 1.0]])
+
+
+def square(half_size):
+    # two triangles of a square in the model z = 0 plane, centered at the origin (meter)
+    vertices = np.array([[-1, -1, 0], [1, -1, 0], [1, 1, 0], [-1, 1, 0]]) * half_size
+    return MeshArrays(vertices, [[0, 1, 2], [0, 2, 3]])
+
+
+def at_depth(z):
+    pose = np.identity(4)
+    pose[2, 3] = z
+    return pose
+
+
+def expected_footprint(half_size, z):
+    # pixel centers strictly inside the projected square
+    u, v = np.meshgrid(np.arange(WIDTH), np.arange(HEIGHT))
+    half_px = 100.0 * half_size / z
+    return (np.abs(u - 80.5) < half_px) & (np.abs(v - 60.5) < half_px)
+
+
+def test_plane_footprint_and_depth():
+    renderer = CPURenderer(WIDTH, HEIGHT, INTRINSIC)
+    depth = renderer.render_depth([square(0.1)], [at_depth(0.5)])
+    footprint = expected_footprint(0.1, 0.5)
+    assert footprint.sum() == 40 * 40
+    np.testing.assert_array_equal(depth > 0, footprint)
+    np.testing.assert_allclose(depth[footprint], 500, atol=1e-3)
+
+
+def test_plane_beyond_far_plane_is_clipped():
+    renderer = CPURenderer(WIDTH, HEIGHT, INTRINSIC, far=0.4)
+    assert not np.any(renderer.render_depth([square(0.1)], [at_depth(0.5)]))
+
+
+def test_render_labels_occlusion_and_footprints():
+    renderer = CPURenderer(WIDTH, HEIGHT, INTRINSIC)
+    meshes = [square(0.1), square(0.02)]
+    poses = [at_depth(0.5), at_depth(0.4)]
+    depth, labels, footprints = renderer.render_labels(meshes, poses, footprints=True)
+    far, near = expected_footprint(0.1, 0.5), expected_footprint(0.02, 0.4)
+    np.testing.assert_array_equal(labels, np.where(near, 2, np.where(far, 1, 0)))
+    np.testing.assert_allclose(depth[near], 400, atol=1e-3)
+    np.testing.assert_allclose(depth[far & ~near], 500, atol=1e-3)
+    assert not np.any(depth[~far])
+    # footprints are amodal: the far plane also covers the pixels hidden by the near one
+    np.testing.assert_array_equal(footprints[0], np.flatnonzero(far))
+    np.testing.assert_array_equal(footprints[1], np.flatnonzero(near))
+
+    # the same result whatever the drawing order
+    depth_rev, labels_rev = renderer.render_labels(meshes[::-1], poses[::-1])
+    np.testing.assert_array_equal(depth_rev, depth)
+    np.testing.assert_array_equal(labels_rev, np.where(labels > 0, 3 - labels, 0))
+
+    # and the same as composing the depths rendered one object at a time
+    depth_composed, labels_composed = compose_depths(renderer.render_depths(meshes, poses), HEIGHT, WIDTH)
+    np.testing.assert_array_equal(depth_composed, depth)
+    np.testing.assert_array_equal(labels_composed, labels)
+
+
+def test_compose_depths_occlusion_order():
+    depths = np.zeros((3, 2, 3), dtype=np.float32)
+    depths[0] = [[500, 500, 0], [500, 0, 0]]
+    depths[1] = [[400, 600, 0], [0, 0, 0]]
+    depths[2] = [[450, 550, 0], [0, 700, 0]]
+    depth, labels = compose_depths(depths, 2, 3)
+    # the nearest non-empty object wins, 0 (empty) never occludes
+    np.testing.assert_array_equal(labels, [[2, 1, 0], [1, 3, 0]])
+    np.testing.assert_array_equal(depth, [[400, 500, 0], [500, 700, 0]])
+
+
+def test_compose_depths_without_objects():
+    depth, labels = compose_depths(np.zeros((0, 4, 5), dtype=np.float32), 4, 5)
+    assert depth.shape == labels.shape == (4, 5)
+    assert not np.any(depth) and not np.any(labels)
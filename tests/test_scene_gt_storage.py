@@ -0,0 +1,149 @@
+# annotation storage of several annotators per scene: the scene file locks, per-image
+# shards, compile_scene_gt and the compile_scene_gt.py command
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compile_scene_gt as compile_command  # noqa: E402
+from object_pose_annotator import (SCENE_GT_SHARD_DIR, SCENE_LOCK_DIR, QualityIndex, compile_scene_gt,  # noqa: E402
+                                   file_lock, read_scene_gt, remove_shard, write_scene_gt_entry)
+
+
+def gt_objs(t_z):
+    return [{"obj_id": 1, "inst_id": 1, "cam_R_m2c": [1, 0, 0, 0, 1, 0, 0, 0, 1], "cam_t_m2c": [0, 0, t_z]}]
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def shard_path(scene_path, image_num):
+    return os.path.join(scene_path, SCENE_GT_SHARD_DIR, "{:06}.json".format(image_num))
+
+
+def test_file_lock_excludes_other_holders(tmp_path):
+    scene_path = str(tmp_path)
+    events = []
+    held = threading.Event()
+
+    def first():
+        with file_lock(scene_path, "scene_gt"):
+            held.set()
+            time.sleep(0.2)
+            events.append("first released")
+
+    def second():
+        held.wait()
+        with file_lock(scene_path, "scene_gt"):
+            events.append("second acquired")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events == ["first released", "second acquired"]
+
+    # locks of other files do not wait on each other
+    with file_lock(scene_path, "scene_gt"):
+        acquired = threading.Event()
+
+        def other():
+            with file_lock(scene_path, "anno_quality_index"):
+                acquired.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert acquired.wait(5)
+        thread.join()
+
+
+def test_shard_overrides_scene_gt(tmp_path):
+    scene_path = str(tmp_path)
+    write_scene_gt_entry(scene_path, 0, gt_objs(500))
+    write_scene_gt_entry(scene_path, 1, gt_objs(600))
+    write_scene_gt_entry(scene_path, 0, gt_objs(510), sharded=True)
+    assert load_json(os.path.join(scene_path, "scene_gt.json")) == {"0": gt_objs(500), "1": gt_objs(600)}
+    assert load_json(shard_path(scene_path, 0)) == gt_objs(510)
+    assert read_scene_gt(scene_path) == {"0": gt_objs(510), "1": gt_objs(600)}
+
+
+def test_single_file_save_removes_the_shard(tmp_path):
+    scene_path = str(tmp_path)
+    write_scene_gt_entry(scene_path, 0, gt_objs(510), sharded=True)
+    write_scene_gt_entry(scene_path, 0, gt_objs(520))
+    assert not os.path.exists(shard_path(scene_path, 0))
+    assert read_scene_gt(scene_path) == {"0": gt_objs(520)}
+
+
+def test_compile_merges_the_shards(tmp_path):
+    scene_path = str(tmp_path)
+    write_scene_gt_entry(scene_path, 0, gt_objs(500))
+    write_scene_gt_entry(scene_path, 1, gt_objs(610), sharded=True)
+    write_scene_gt_entry(scene_path, -4, gt_objs(620), sharded=True)
+    assert compile_scene_gt(scene_path) == 2
+    expected = {"0": gt_objs(500), "1": gt_objs(610), "-4": gt_objs(620)}
+    assert load_json(os.path.join(scene_path, "scene_gt.json")) == expected
+    # shards are kept unless removed
+    assert os.path.exists(shard_path(scene_path, 1))
+    assert compile_scene_gt(scene_path, remove_shards=True) == 2
+    assert os.listdir(os.path.join(scene_path, SCENE_GT_SHARD_DIR)) == []
+    assert read_scene_gt(scene_path) == expected
+    assert compile_scene_gt(scene_path) == 0
+
+
+def test_remove_shard_keeps_a_shard_saved_again(tmp_path):
+    scene_path = str(tmp_path)
+    write_scene_gt_entry(scene_path, 1, gt_objs(610), sharded=True)
+    # the shard was saved again after the compiled version was read
+    assert not remove_shard(scene_path, 1, gt_objs(600))
+    assert os.path.exists(shard_path(scene_path, 1))
+    assert remove_shard(scene_path, 1, gt_objs(610))
+    assert not remove_shard(scene_path, 1)
+
+
+def test_lock_files_stay_in_the_hidden_lock_dir(tmp_path):
+    scene_path = str(tmp_path)
+    write_scene_gt_entry(scene_path, 0, gt_objs(500))
+    write_scene_gt_entry(scene_path, 1, gt_objs(610), sharded=True)
+    write_scene_gt_entry(scene_path, 2, gt_objs(620), sharded=True)
+    write_scene_gt_entry(scene_path, 2, gt_objs(630))
+    QualityIndex(scene_path).update(0, gt_objs(500), [], 1)
+    compile_scene_gt(scene_path, remove_shards=True)
+    files = [os.path.relpath(os.path.join(dir_path, name), scene_path)
+             for dir_path, _, names in os.walk(scene_path) for name in names]
+    assert sorted(name for name in files if not name.startswith(SCENE_LOCK_DIR + os.sep)) == \
+        ["anno_quality_index.json", "scene_gt.json"]
+    # lock files are never deleted
+    assert sorted(os.listdir(os.path.join(scene_path, SCENE_LOCK_DIR))) == \
+        ["anno_quality_index.lock", "scene_gt.lock", "shard_000001.lock", "shard_000002.lock"]
+
+
+def test_compile_command_removes_shards(tmp_path, monkeypatch, capsys):
+    dataset_path = str(tmp_path)
+    scene_paths = [os.path.join(dataset_path, "scenes", "{:06}".format(scene_num)) for scene_num in [1, 2]]
+    for scene_path in scene_paths:
+        os.makedirs(scene_path)
+    write_scene_gt_entry(scene_paths[0], 0, gt_objs(500))
+    write_scene_gt_entry(scene_paths[0], 1, gt_objs(610), sharded=True)
+    write_scene_gt_entry(scene_paths[1], 0, gt_objs(700), sharded=True)
+
+    monkeypatch.setattr(sys, "argv", ["compile_scene_gt.py", "--dataset_path", dataset_path, "--scenes", "1"])
+    compile_command.main()
+    assert "Merged 1 images" in capsys.readouterr().out
+    assert load_json(os.path.join(scene_paths[0], "scene_gt.json")) == {"0": gt_objs(500), "1": gt_objs(610)}
+    assert os.path.exists(shard_path(scene_paths[0], 1))
+    assert not os.path.exists(os.path.join(scene_paths[1], "scene_gt.json"))
+
+    monkeypatch.setattr(sys, "argv", ["compile_scene_gt.py", "--dataset_path", dataset_path, "--remove_shards"])
+    compile_command.main()
+    assert "Merged 2 images" in capsys.readouterr().out
+    for scene_path, expected in zip(scene_paths, [{"0": gt_objs(500), "1": gt_objs(610)}, {"0": gt_objs(700)}]):
+        assert load_json(os.path.join(scene_path, "scene_gt.json")) == expected
+        assert os.listdir(os.path.join(scene_path, SCENE_GT_SHARD_DIR)) == []